@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""集計キューブ - ブランド×アイテムタイプ×カテゴリ×月×フラグの全組み合わせを1回だけ集計し、各表・グラフはロールアップで求める"""
+
+from partial_aggregates import GroupPartials
+
+# キューブの次元（この中の任意の組み合わせでロールアップできる）
+CUBE_DIMENSIONS = ['ブランド', 'アイテムタイプ', 'ブランドカテゴリ', '販売月', 'まとめ売り', 'ノベルティ', 'CITES_RISK', '箱あり']
+
+# 中央値・仕入れ上限（分位点スケッチ）を求められる次元。販売月ごとの表・グラフは件数・合計しか使わないため、
+# スケッチは販売月をまとめたセルだけに持つ（月の数だけ小さいセルに分かれて圧縮されないのを避ける）
+SKETCH_DIMENSIONS = [dim for dim in CUBE_DIMENSIONS if dim != '販売月']
+
+
+class AggregateCube:
+    """全次元の組み合わせ（セル）ごとの合算可能な集計値＋分位点スケッチ
+
+    セルは実際に出現した組み合わせだけを持つため、セル数は行数を超えない。
+    欠損値のキーもセルとして残し、ロールアップ時に groupby と同じく除外する。
+    fold でチャンクを追加できるので、全行をメモリに載せずに作ることもできる。
+    件数・合計・平均・分散は全次元のセル（cells）に、分位点スケッチは sketch_dimensions だけのセル
+    （sketch_cells）に持つ。sketch_dimensions にない次元を含むロールアップの中央値・仕入れ上限は NaN。
+    """
+
+    def __init__(self, dimensions=CUBE_DIMENSIONS, sketch_capacity=1024, sketch_dimensions=SKETCH_DIMENSIONS):
+        self.dimensions = list(dimensions)
+        self.sketch_dimensions = [dim for dim in sketch_dimensions if dim in self.dimensions]
+        self.cells = GroupPartials(self.dimensions, sketch_capacity, dropna=False, sketch_columns={})
+        self.sketch_cells = GroupPartials(self.sketch_dimensions, sketch_capacity, dropna=False)
+        self._rollups = {}
+
+    @classmethod
+    def from_frame(cls, df, dimensions=CUBE_DIMENSIONS, sketch_capacity=None):
+        """DataFrameからキューブを作る（既定では全値を保持し、中央値は厳密値）"""
+        return cls(dimensions, sketch_capacity).fold(df)
+
+    def fold(self, df):
+        """エンリッチ済みのDataFrame（チャンク）を取り込む（最初のチャンクにない次元（v1 の箱あり等）は除く）"""
+        if self.cells.table is None:
+            capacity = self.cells.sketch_capacity
+            self.dimensions = [dim for dim in self.dimensions if dim in df.columns]
+            self.sketch_dimensions = [dim for dim in self.sketch_dimensions if dim in df.columns]
+            self.cells = GroupPartials(self.dimensions, capacity, dropna=False, sketch_columns={})
+            self.sketch_cells = GroupPartials(self.sketch_dimensions, capacity, dropna=False)
+        self.cells.fold(df)
+        self.sketch_cells.fold(df)
+        self._rollups.clear()
+        return self
+
+    @property
+    def cell_count(self):
+        self.cells.settle()
+        return 0 if self.cells.table is None else len(self.cells.table)
+
+    @property
+    def sketch_points(self):
+        """分位点スケッチが保持している代表点の数"""
+        return self.sketch_cells.sketch_points
+
+    def rollup(self, keys, sort=False):
+        """keys 以外の次元を合算した GroupPartials（同じ keys・sort はキャッシュを返す）"""
+        key_columns = [keys] if isinstance(keys, str) else list(keys)
+        missing = [key for key in key_columns if key not in self.dimensions]
+        if missing:
+            raise KeyError(f'キューブにない次元です: {missing}')
+        cache_key = (keys if isinstance(keys, str) else tuple(keys), sort)
+        if cache_key not in self._rollups:
+            rolled = self.cells.rollup(keys, sort=sort)
+            if all(key in self.sketch_dimensions for key in key_columns):
+                # 同じ行から作ったセルなので、グループとその並び（出現順・昇順）は cells のロールアップと一致する
+                sketched = self.sketch_cells.rollup(keys, sort=sort)
+                rolled.sketch_columns = sketched.sketch_columns
+                rolled.sketches = sketched.sketches
+            self._rollups[cache_key] = rolled
+        return self._rollups[cache_key]
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""分位点スケッチのベンチマーク - 許容順位誤差ごとに、チャンク集計・並列マージした中央値と厳密な中央値との誤差を測る
+
+使い方: python bench_quantile_sketch.py [CSVパス]
+CSVを渡すとブランド×販売月ごとの価格で、省略すると合成データ（対数正規分布の価格）で測る。
+各グループの順位誤差がスケッチの誤差上限（rank_error_bound）か設定した許容順位誤差を超えたら
+AssertionError で止める（誤差上限自体が許容順位誤差を超えた場合も同じ）。
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from ingest import read_sales_csv
+from quantile_sketch import QuantileSketches, capacity_for_error
+
+# 測定する許容順位誤差（None は厳密値）
+RANK_ERRORS = [None, 0.01, 0.005, 0.002]
+CHUNK_ROWS = 50_000
+WORKERS = 4
+QUANTILES = [0.5, 0.9]
+
+
+def load_prices(csv_path=None, rows=2_000_000, groups=300, seed=0):
+    """価格とグループ番号（CSVならブランド×販売月、合成データなら偏りのあるグループ）"""
+    if csv_path:
+        df = read_sales_csv(csv_path)
+        keys = df['ブランド'].astype(str) + ' / ' + df['販売日'].dt.to_period('M').astype(str)
+        codes, _ = pd.factorize(keys)
+        return df['価格'].to_numpy(dtype=np.float64), codes.astype(np.int64)
+    rng = np.random.default_rng(seed)
+    codes = np.minimum(rng.zipf(1.3, rows) - 1, groups - 1)
+    scale = rng.uniform(20, 300, groups)[codes]
+    return np.round(rng.lognormal(0, 0.8, rows) * scale, 2), codes
+
+
+def sketch_in_chunks(values, codes, size, capacity):
+    """チャンクごとに作ったスケッチを WORKERS 個に分けて畳み込み、最後にマージする（並列集計の模擬）"""
+    identity = np.arange(size)
+    partials = [QuantileSketches(size, capacity) for _ in range(WORKERS)]
+    for i, start in enumerate(range(0, len(values), CHUNK_ROWS)):
+        chunk = QuantileSketches.from_values(values[start:start + CHUNK_ROWS], codes[start:start + CHUNK_ROWS],
+                                             size, capacity)
+        worker = i % WORKERS
+        partials[worker] = partials[worker].concat(chunk).regroup(np.concatenate([identity, identity]), size)
+    merged = partials[0]
+    for partial in partials[1:]:
+        merged = merged.concat(partial).regroup(np.concatenate([identity, identity]), size)
+    return merged
+
+
+def rank_of(values, codes, estimates):
+    """推定値以下の値の割合（グループごと）"""
+    below = np.bincount(codes, weights=values <= estimates[codes], minlength=len(estimates))
+    return below / np.bincount(codes, minlength=len(estimates))
+
+
+def main():
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else None
+    values, codes = load_prices(csv_path)
+    keep = ~np.isnan(values)
+    values, codes = values[keep], codes[keep]
+    size = int(codes.max()) + 1
+    counts = np.bincount(codes, minlength=size)
+    grouped = pd.Series(values).groupby(codes)
+    exact = {q: grouped.quantile(q).reindex(range(size)).to_numpy() for q in QUANTILES}
+    exact_ranks = {q: rank_of(values, codes, exact[q]) for q in QUANTILES}
+
+    print(f"=== 分位点スケッチ ベンチマーク: {len(values):,}行 / {size:,}グループ"
+          f"（最大 {counts.max():,}行） / {CHUNK_ROWS:,}行チャンク × {WORKERS}並列 ===")
+    print(f"{'順位誤差':>8} {'上限':>6} {'代表点数':>10} {'秒':>7} {'誤差上限':>10} "
+          + ' '.join(f"{'p' + str(int(q * 100)) + ' 最大相対誤差':>18} {'最大順位誤差':>12}" for q in QUANTILES))
+    for rank_error in RANK_ERRORS:
+        capacity = capacity_for_error(rank_error)
+        start = time.perf_counter()
+        sketches = sketch_in_chunks(values, codes, size, capacity)
+        elapsed = time.perf_counter() - start
+        bound = sketches.rank_error_bound()
+        limit = 0.0 if rank_error is None else rank_error
+        assert bound.max() <= limit, f"誤差上限 {bound.max():.4%} が許容順位誤差 {limit:.4%} を超えました"
+        columns = []
+        for q in QUANTILES:
+            estimate = sketches.quantile(q)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                relative = np.nanmax(np.abs(estimate - exact[q]) / np.abs(exact[q]))
+            # 厳密値自体の順位（同値が多いと q からずれる）との差を順位誤差とする
+            ranks = np.abs(rank_of(values, codes, estimate) - exact_ranks[q])
+            over = np.flatnonzero((ranks > bound + 1e-12) | (ranks > limit))
+            assert len(over) == 0, (f"順位誤差が上限を超えました: 順位誤差 {rank_error} / p{int(q * 100)} / "
+                                    f"グループ {over[:10].tolist()}")
+            rank = np.nanmax(ranks)
+            columns.append(f"{relative:>18.4%} {rank:>12.4%}")
+        label = '厳密' if rank_error is None else f'{rank_error:.3f}'
+        print(f"{label:>8} {str(capacity):>6} {len(sketches.means):>10,} {elapsed:>7.2f} {bound.max():>10.4%} " + ' '.join(columns))
+
+
+if __name__ == '__main__':
+    main()
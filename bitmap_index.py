@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""ビットマップインデックス - フラグの値ごとに該当行をビット列で、ブランド・アイテムタイプの値ごとに行番号で持ち、条件に合う行を絞り込みなしで引く"""
+
+import numpy as np
+import pandas as pd
+
+# ビットマップを作る列（値の種類が少ないフラグ列）
+BITMAP_COLUMNS = ['まとめ売り', 'ノベルティ', 'CITES_RISK', '箱あり']
+
+# 値ごとの行番号を持つ列（値の種類が多い列。ビットマップだと 行数 × 値の種類 のメモリになる）
+ROW_ID_COLUMNS = ['ブランド', 'アイテムタイプ']
+
+
+class BitmapIndex:
+    """フラグ列の値ごとの行ビットマップ（np.packbits で8行を1バイトに詰めた uint8 配列）と、
+    ブランド・アイテムタイプの値ごとの行番号
+
+    「単品・CITESリスクなし」のようなフラグの複合条件は、値ごとのビットマップの AND だけで求まるため、
+    DataFrame 全体の比較をやり直す必要がない。ブランドのように値の種類が多い列は、
+    行番号を値の順に並べた1本の配列とオフセットで持つ（メモリは行数分だけ）。
+    行番号は df の位置（0始まり）で、df.take 等に渡す。欠損値の行はどの値にも含めない。
+    """
+
+    def __init__(self, row_count):
+        self.row_count = row_count
+        self.bitmaps = {}
+        self.row_ids = {}
+
+    @classmethod
+    def from_frame(cls, df, bitmap_columns=BITMAP_COLUMNS, row_id_columns=ROW_ID_COLUMNS):
+        """df の bitmap_columns の値ごとのビットマップと、row_id_columns の値ごとの行番号を作る（df にない列は除く）"""
+        index = cls(len(df))
+        buffer = np.zeros(len(df), dtype=bool)
+        for column in bitmap_columns:
+            if column not in df.columns:
+                continue
+            order, offsets, uniques = _group_rows(df[column])
+            # 値ごとに使い回しのバッファにビットを立てて詰める
+            for code, value in enumerate(uniques):
+                rows = order[offsets[code]:offsets[code + 1]]
+                buffer[rows] = True
+                index.bitmaps[(column, value)] = np.packbits(buffer)
+                buffer[rows] = False
+        for column in row_id_columns:
+            if column not in df.columns:
+                continue
+            order, offsets, uniques = _group_rows(df[column])
+            index.row_ids[column] = (order, offsets, {value: code for code, value in enumerate(uniques)})
+        return index
+
+    def bitmap(self, column, value):
+        """フラグ列 column == value の行のビットマップ（該当なしなら全ビット0）"""
+        bitmap = self.bitmaps.get((column, value))
+        if bitmap is None:
+            return np.zeros((self.row_count + 7) // 8, dtype=np.uint8)
+        return bitmap
+
+    def match(self, conditions):
+        """フラグ列の {列: 値} のすべてを満たす行のビットマップ（条件なしなら全行）"""
+        result = np.packbits(np.ones(self.row_count, dtype=bool))
+        for column, value in conditions.items():
+            result = result & self.bitmap(column, value)
+        return result
+
+    def rows(self, bitmap):
+        """ビットマップの行番号（昇順）"""
+        return np.flatnonzero(np.unpackbits(bitmap, count=self.row_count))
+
+    def value_rows(self, column, value):
+        """ブランド・アイテムタイプ等の column == value の行番号（昇順。該当なしなら空）"""
+        order, offsets, codes = self.row_ids[column]
+        code = codes.get(value)
+        if code is None:
+            return order[:0]
+        return order[offsets[code]:offsets[code + 1]]
+
+
+def _group_rows(values):
+    """値ごとにまとめた行番号（値の番号順・値の中は昇順）、値ごとのオフセット、値の一覧"""
+    codes, uniques = pd.factorize(values)
+    order = np.argsort(codes, kind='stable')
+    offsets = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    return order, offsets, uniques.tolist()
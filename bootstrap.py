@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""ブートストラップ信頼区間 - 全グループの中央値・CVの信頼区間を、インデックス行列による一括リサンプリングで求める"""
+
+import numpy as np
+
+from price_index import PriceIndex
+
+# 不安定と判定する基準（件数が少ない、または信頼区間が広いグループ）
+MIN_STABLE_COUNT = 3
+MAX_MEDIAN_CI_RATIO = 0.5  # 中央値の信頼区間幅 / 中央値
+MAX_CV_CI_WIDTH = 0.3
+
+
+def bootstrap_intervals(df, keys, value='価格', resamples=1000, confidence=0.95, seed=0,
+                        batch_elements=4_000_000):
+    """keys ごとの value の中央値・CVのブートストラップ信頼区間（{グループ: dict}）
+
+    同じ件数 n のグループをまとめ、(グループ数, resamples, n) の乱数インデックス行列で
+    一括リサンプリングしてCVを求める（グループごとの Python ループはしない）。
+    1回に作る行列の要素数は batch_elements 以下に抑える。CV は標本標準偏差（ddof=1）/ 平均。
+    中央値は PriceIndex でグループ内の値を昇順に並べておき、リサンプルの中央の順位のインデックスだけを
+    順序統計量の分布（ベータ分布）から直接引く（全インデックスを作るのと同じ分布で、件数によらず速い）。
+    戻り値の dict は median_ci_low / median_ci_high / median_ci_width / cv_ci_low / cv_ci_high /
+    cv_ci_width / unstable（統計の dict にそのまま追加できる）。
+    """
+    index = PriceIndex.from_frame(df, keys, value)
+    groups, values, offsets, counts = index.groups, index.values, index.offsets, index.counts
+    size = len(groups)
+    medians = index.quantiles(0.5)
+
+    rng = np.random.default_rng(seed)
+    tail = (1 - confidence) / 2
+    bounds = {name: np.full((size, 2), np.nan) for name in ['median', 'cv']}
+    for n in np.unique(counts[counts > 0]):
+        same_size = np.flatnonzero(counts == n)
+        per_batch = max(1, batch_elements // (resamples * n))
+        for start in range(0, len(same_size), per_batch):
+            batch = same_size[start:start + per_batch]
+            sample_medians = _resample_medians(values, offsets[batch], n, resamples, rng)
+            sample_cvs = _resample_cvs(values, offsets[batch], n, resamples, rng, batch_elements)
+            bounds['median'][batch] = np.quantile(sample_medians, [tail, 1 - tail], axis=1).T
+            bounds['cv'][batch] = np.quantile(sample_cvs, [tail, 1 - tail], axis=1).T
+
+    median_width = bounds['median'][:, 1] - bounds['median'][:, 0]
+    cv_width = bounds['cv'][:, 1] - bounds['cv'][:, 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        unstable = ((counts < MIN_STABLE_COUNT) | ~(median_width <= MAX_MEDIAN_CI_RATIO * np.abs(medians))
+                    | ~(cv_width <= MAX_CV_CI_WIDTH))
+    columns = zip(groups, bounds['median'].tolist(), median_width.tolist(), bounds['cv'].tolist(),
+                  cv_width.tolist(), unstable.tolist())
+    return {
+        group: {
+            'median_ci_low': median_ci[0],
+            'median_ci_high': median_ci[1],
+            'median_ci_width': median_ci_width,
+            'cv_ci_low': cv_ci[0],
+            'cv_ci_high': cv_ci[1],
+            'cv_ci_width': cv_ci_width,
+            'unstable': flag,
+        }
+        for group, median_ci, median_ci_width, cv_ci, cv_ci_width, flag in columns
+    }
+
+
+def _resample_medians(values, starts, n, resamples, rng):
+    """昇順に並んだ n 件のグループを resamples 回復元抽出したときの中央値（(グループ数, resamples)）
+
+    一様乱数 n 個の k 番目に小さい値は Beta(k, n+1-k) に従い、その次の値は残り n-k 個の最小値になる。
+    インデックス floor(n·U) は U について単調なので、中央の順位のインデックスも同じ式で求まる。
+    """
+    shape = (len(starts), resamples)
+    rank = (n - 1) // 2 + 1
+    lower = rng.beta(rank, n + 1 - rank, size=shape)
+    upper = lower + (1 - lower) * rng.beta(1, n - rank, size=shape) if n % 2 == 0 else lower
+    lower_index = np.minimum((lower * n).astype(np.int64), n - 1) + starts[:, None]
+    upper_index = np.minimum((upper * n).astype(np.int64), n - 1) + starts[:, None]
+    return (values[lower_index] + values[upper_index]) / 2
+
+
+def _resample_cvs(values, starts, n, resamples, rng, batch_elements):
+    """開始位置 starts から n 件ずつのグループを resamples 回復元抽出したときのCV（(グループ数, resamples)）"""
+    cvs = np.empty((len(starts), resamples))
+    # 1グループが大きい場合はリサンプル回数の方向にも分割する
+    step = max(1, batch_elements // (len(starts) * n))
+    for begin in range(0, resamples, step):
+        count = min(step, resamples - begin)
+        index = rng.integers(0, n, size=(len(starts), count, n)) + starts[:, None, None]
+        samples = values[index]
+        mean = samples.mean(axis=2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = samples.std(axis=2, ddof=1) if n > 1 else np.full_like(mean, np.nan)
+            cvs[:, begin:begin + count] = np.where(mean > 0, std / mean, 0.0)
+    return cvs
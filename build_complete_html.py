@@ -3,58 +3,81 @@
 
 import pandas as pd
 import json
-from collections import defaultdict
-import re
-from datetime import datetime
+import os
 import numpy as np
 
+from aggregate_cube import AggregateCube
+from classification_cache import ClassificationCache
+from frame_snapshot import load_snapshot, save_snapshot, snapshot_key
+from group_stats import GroupStatsEngine
+from html_template import Template
+from html_writer import StreamingHtmlWriter
+from ingest import INGEST_VERSION, LoadTimer, iter_sales_csv, read_sales_csv, to_sorted_categorical
+from price_histogram import BinScheme
+from quantile_sketch import capacity_for_error
+from ranking import ROTATION_FILTERS, RankingEngine, equals, limit_times_sales
+from stream_summary import StreamSummary
+from title_classifier import TitleClassifier, apply_unique
+from trend_matrix import stats_trend_matrix, trend_matrix
+
 # 設定
 SHIPPING_JPY = 3000
 EXCHANGE_RATE = 155
 FEE_RATE = 0.20
 
-# CSVファイル読み込み
-df = pd.read_csv('/Users/naokijodan/Desktop/髪飾り市場データ_sheet8_2026-02-05.csv')
+# 入力CSV
+CSV_PATH = '/Users/naokijodan/Desktop/髪飾り市場データ_sheet8_2026-02-05.csv'
 
-print(f"=== データ読み込み完了 ===")
-print(f"総件数: {len(df)}")
+# 出力HTML
+OUTPUT_PATH = '/Users/naokijodan/Desktop/hair-accessory-research/index.html'
 
-# 販売数を数値に変換
-df['販売数'] = pd.to_numeric(df['販売数'], errors='coerce').fillna(1).astype(int)
+# タイトル分類キャッシュ（前回までに分類済みのタイトルは再分類しない）
+CLASSIFICATION_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'title_classification')
 
-# 売上計算
-df['売上'] = df['価格'] * df['販売数']
+# エンリッチ済みDataFrameのスナップショット（同じCSVなら読み込み・分類を省略）
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'snapshots')
 
-# 総販売数・総売上
-total_sales = int(df['販売数'].sum())
-total_revenue = float(df['売上'].sum())
+# 集計方法（'memory': CSV全体を読み込んで集計 / 'stream': STREAM_CHUNK_ROWS 行ずつ読み込み、集計キューブと
+# 行単位の要約（StreamSummary）だけを残す。RAMに収まらない大きなCSV用で、中央値は QUANTILE_RANK_ERROR の近似）
+STATS_MODE = 'memory'
 
-# 期間
-period_start = df['販売日'].min()
-period_end = df['販売日'].max()
-
-# アイテムタイプ分類
-def extract_item_type(title):
-    title_upper = str(title).upper()
-    if 'TIARA' in title_upper:
-        return 'Tiara'
-    if 'HEADBAND' in title_upper or 'HAIR BAND' in title_upper or 'HAIRBAND' in title_upper:
-        return 'Headband'
-    if 'BARRETTE' in title_upper or 'VALLETTA' in title_upper:
-        return 'Barrette'
-    if 'CLIP' in title_upper or 'HAIRPIN' in title_upper or 'HAIR PIN' in title_upper or 'PIN' in title_upper:
-        return 'Hair Clip'
-    if 'SCRUNCHIE' in title_upper or 'シュシュ' in title_upper:
-        return 'Scrunchie'
-    if 'KANZASHI' in title_upper or 'KUSHI' in title_upper or '簪' in title_upper:
-        return 'Kanzashi'
-    if 'COMB' in title_upper:
-        return 'Comb'
-    if 'RIBBON' in title_upper:
-        return 'Ribbon'
-    return 'Other'
-
-df['アイテムタイプ'] = df['タイトル'].apply(extract_item_type)
+# チャンク集計（stream_group_stats）で1回に読み込む行数
+STREAM_CHUNK_ROWS = 100_000
+
+# チャンク集計の中央値・分位点の許容順位誤差（チャンクの数によらず保証される。None なら全値を保持して厳密値）
+QUANTILE_RANK_ERROR = 0.002
+
+# アイテムタイプ分類ルール（上から順に判定し、最初に一致したタイプを採用）
+ITEM_TYPE_RULES = [
+    ('Tiara', ['TIARA']),
+    ('Headband', ['HEADBAND', 'HAIR BAND', 'HAIRBAND']),
+    ('Barrette', ['BARRETTE', 'VALLETTA']),
+    ('Hair Clip', ['CLIP', 'HAIRPIN', 'HAIR PIN', 'PIN']),
+    ('Scrunchie', ['SCRUNCHIE', 'シュシュ']),
+    ('Kanzashi', ['KANZASHI', 'KUSHI', '簪']),
+    ('Comb', ['COMB']),
+    ('Ribbon', ['RIBBON']),
+]
+
+# まとめ売り判定
+BULK_KEYWORDS = ['LOT', 'BULK', 'SET OF', 'BUNDLE', 'X2', 'X3', '2PCS', '3PCS', '4PCS', '5PCS', '6PCS',
+                 'PAIR', 'COLLECTION', '複数', 'まとめ', 'セット', 'SET', 'PCS', 'PACK']
+BULK_PATTERN = r'\d+\s*(?:PCS|PIECES|PACK|点|個|本)'
+
+# ノベルティ判定
+NOVELTY_KEYWORDS = ['NOVELTY', 'GWP', 'LIMITED', 'NOT FOR SALE', '非売品', 'RARE', 'VIP']
+
+# CITES規制品判定
+CITES_RISK_KEYWORDS = ['TORTOISE', 'BEKKO', 'IVORY', 'べっ甲', '象牙', 'TORTOISESHELL']
+
+# タイトル分類（アイテムタイプ・まとめ売り・ノベルティ・CITESを一括判定）
+title_classifier = TitleClassifier(
+    item_type_rules=ITEM_TYPE_RULES,
+    bulk_keywords=BULK_KEYWORDS,
+    bulk_pattern=BULK_PATTERN,
+    novelty_keywords=NOVELTY_KEYWORDS,
+    cites_risk_keywords=CITES_RISK_KEYWORDS,
+)
 
 # ブランドカテゴリ分類
 HIGH_BRANDS = ['CHANEL', 'DIOR', 'LOUIS VUITTON', 'GUCCI', 'HERMES', 'PRADA', 'FENDI', 'CELINE']
@@ -78,58 +101,113 @@ def categorize_brand(brand):
             return 'キャラクター'
     return 'その他'
 
-df['ブランドカテゴリ'] = df['ブランド'].apply(categorize_brand)
-
-# まとめ売り判定
-def is_bulk(title):
-    bulk_keywords = ['LOT', 'BULK', 'SET OF', 'BUNDLE', 'X2', 'X3', '2PCS', '3PCS', '4PCS', '5PCS', '6PCS',
-                     'PAIR', 'COLLECTION', '複数', 'まとめ', 'セット', 'SET', 'PCS', 'PACK']
-    title_upper = str(title).upper()
-    for kw in bulk_keywords:
-        if kw in title_upper:
-            return True
-    if re.search(r'\d+\s*(PCS|PIECES|PACK|点|個|本)', title_upper):
-        return True
-    return False
-
-df['まとめ売り'] = df['タイトル'].apply(is_bulk)
-
-# ノベルティ判定
-def is_novelty(title):
-    novelty_keywords = ['NOVELTY', 'GWP', 'LIMITED', 'NOT FOR SALE', '非売品', 'RARE', 'VIP']
-    title_upper = str(title).upper()
-    for kw in novelty_keywords:
-        if kw in title_upper:
-            return True
-    return False
-
-df['ノベルティ'] = df['タイトル'].apply(is_novelty)
-
-# CITES規制品判定
-def is_cites_risk(title):
-    risk_keywords = ['TORTOISE', 'BEKKO', 'IVORY', 'べっ甲', '象牙', 'TORTOISESHELL']
-    title_upper = str(title).upper()
-    for kw in risk_keywords:
-        if kw in title_upper:
-            return True
-    return False
-
-df['CITES_RISK'] = df['タイトル'].apply(is_cites_risk)
+# CSV読み込み〜派生列（分類・仕入れ上限・販売月）の計算
+def build_enriched_df(csv_path):
+    load_timer = LoadTimer()
+    df = read_sales_csv(csv_path)
+
+    print(f"=== データ読み込み完了 ===")
+    print(f"総件数: {len(df)}")
+    load_timer.report('CSV読み込み')
+    return enrich_sales_df(df, ClassificationCache(CLASSIFICATION_CACHE_DIR))
+
+# 読み込んだDataFrame（またはチャンク）に派生列を追加する（verbose=False なら途中経過を表示しない）
+# classification_cache は実行ごとに1つ作って渡す（チャンクごとにキャッシュを読み直さない）
+def enrich_sales_df(df, classification_cache, verbose=True):
+    log = print if verbose else (lambda *args: None)
+
+    # 販売数を数値に変換
+    df['販売数'] = pd.to_numeric(df['販売数'], errors='coerce').fillna(1).astype(int)
+
+    # 売上計算
+    df['売上'] = df['価格'] * df['販売数']
+
+    title_flags = title_classifier.classify(df['タイトル'], cache=classification_cache)
+    log(f"=== タイトル分類: {title_classifier.last_row_count}件中ユニーク{title_classifier.last_unique_count}件 "
+        f"(重複率 {title_classifier.duplicate_ratio:.1%}) ===")
+    log(f"=== 分類キャッシュ: ヒット{classification_cache.last_hit_count}件 / 新規分類{classification_cache.last_miss_count}件 ===")
+    for col in title_flags.columns:
+        df[col] = title_flags[col]
+
+    df['ブランドカテゴリ'] = apply_unique(df['ブランド'], categorize_brand)
+
+    # 仕入れ上限計算
+    df['仕入れ上限'] = df['価格'] * EXCHANGE_RATE * (1 - FEE_RATE) - SHIPPING_JPY
+
+    # 月次データ抽出
+    df['販売月'] = df['販売日'].dt.to_period('M').astype(str)
+
+    # ラベル列はカテゴリ型で保持（メモリ削減・比較とgroupbyの高速化）
+    for col in ['アイテムタイプ', 'ブランドカテゴリ', '販売月']:
+        df[col] = to_sorted_categorical(df[col])
+    return df
+
+# CSVをチャンク単位で読み込み・エンリッチして集計キューブに畳み込み、グループ別統計エンジンを返す
+# 同時にメモリに載るのは1チャンク分だけなので、RAMに収まらない大きなCSVにも使える
+# summary（StreamSummary）を渡すと、キューブに入らない行単位の情報も同じ走査で畳み込む
+def stream_group_stats(csv_path, summary=None, chunk_rows=STREAM_CHUNK_ROWS, rank_error=QUANTILE_RANK_ERROR):
+    cube = AggregateCube(sketch_capacity=capacity_for_error(rank_error))
+    # 新規分類はメモリに溜め、最後に1回だけ書き出す
+    classification_cache = ClassificationCache(CLASSIFICATION_CACHE_DIR, autosave=False)
+    for chunk in iter_sales_csv(csv_path, chunk_rows):
+        chunk = enrich_sales_df(chunk, classification_cache, verbose=False)
+        cube.fold(chunk)
+        if summary is not None:
+            summary.fold(chunk)
+    classification_cache.flush()
+    return GroupStatsEngine(cube, cv_min_count=2)
 
-# 仕入れ上限計算
-df['仕入れ上限'] = df['価格'] * EXCHANGE_RATE * (1 - FEE_RATE) - SHIPPING_JPY
+# 価格帯分布
+PRICE_BINS = BinScheme([0, 25, 50, 75, 100, 150, 200, 300, 500, 1000, float('inf')],
+                       ['$0-24', '$25-49', '$50-74', '$75-99', '$100-149', '$150-199', '$200-299', '$300-499', '$500-999', '$1000+'])
+
+# 同じCSV・同じ設定ならスナップショットから読み込む（表示だけ調整して再生成する場合に高速）
+snapshot_id = snapshot_key(CSV_PATH, {
+    'rules_version': title_classifier.rules_version,
+    'brand_categories': [HIGH_BRANDS, DESIGNER_BRANDS, CHARACTER_BRANDS],
+    'exchange_rate': EXCHANGE_RATE,
+    'fee_rate': FEE_RATE,
+    'shipping_jpy': SHIPPING_JPY,
+    'ingest': INGEST_VERSION,
+})
+load_timer = LoadTimer()
+if STATS_MODE == 'stream':
+    # チャンク集計（DataFrame全体は作らない。期間・価格帯分布は stream_summary から作る）
+    df = None
+    stream_summary = StreamSummary(PRICE_BINS)
+    stats_engine = stream_group_stats(CSV_PATH, stream_summary)
+    print(f"=== チャンク集計完了 ===")
+    print(f"総件数: {stream_summary.row_count}")
+    load_timer.report('チャンク集計')
+else:
+    df = load_snapshot(SNAPSHOT_DIR, snapshot_id)
+    if df is not None:
+        print(f"=== スナップショット読み込み完了 ===")
+        print(f"総件数: {len(df)}")
+        load_timer.report('スナップショット読み込み')
+    else:
+        df = build_enriched_df(CSV_PATH)
+        save_snapshot(SNAPSHOT_DIR, snapshot_id, df)
+
+    # グループ別統計（ブランド×アイテムタイプ×カテゴリ×月×フラグの集計キューブを1回だけ作り、
+    # 各表・グラフはそのロールアップで求める。CV値（変動係数）は2件未満なら0）
+    stats_engine = GroupStatsEngine(df, cv_min_count=2)
+print(f"=== 集計キューブ: {stats_engine.cube.cell_count}セル（分位点スケッチ {stats_engine.cube.sketch_points:,}点） ===")
 
-# CV値（変動係数）計算関数
-def calc_cv(prices):
-    if len(prices) < 2:
-        return 0
-    return float(prices.std() / prices.mean()) if prices.mean() > 0 else 0
+# 総販売数・総売上
+overall_stats = stats_engine.total()
+total_sales = overall_stats['sales']
+total_revenue = overall_stats['revenue']
 
-# 月次データ抽出
-df['販売月'] = pd.to_datetime(df['販売日']).dt.to_period('M').astype(str)
+# 期間
+first_date, last_date = ((stream_summary.first_date, stream_summary.last_date) if df is None
+                         else (df['販売日'].min(), df['販売日'].max()))
+period_start = first_date.strftime('%Y-%m-%d')
+period_end = last_date.strftime('%Y-%m-%d')
 
 # 主要ブランドを特定
-brand_sales = df.groupby('ブランド')['販売数'].sum().sort_values(ascending=False)
+brand_sales = pd.Series({b: s['sales'] for b, s in stats_engine.by('ブランド', sort=True).items()},
+                        dtype='int64').sort_values(ascending=False)
 top_brands = brand_sales[brand_sales.index != '(不明)'].head(10).index.tolist()
 
 print(f"\n=== トップ10ブランド ===")
@@ -137,166 +215,84 @@ for b in top_brands:
     print(f"  - {b}")
 
 # アイテムタイプ別統計
-item_type_stats = {}
-for item_type in df['アイテムタイプ'].unique():
-    type_df = df[df['アイテムタイプ'] == item_type]
-    if len(type_df) < 3:
-        continue
-    item_type_stats[item_type] = {
-        'count': int(len(type_df)),
-        'sales': int(type_df['販売数'].sum()),
-        'revenue': float(type_df['売上'].sum()),
-        'avg_price': float(type_df['価格'].mean()),
-        'median_price': float(type_df['価格'].median()),
-        'min_price': float(type_df['価格'].min()),
-        'max_price': float(type_df['価格'].max()),
-        'cv': float(calc_cv(type_df['価格'])),
-        'purchase_limit': float(type_df['仕入れ上限'].median())
-    }
+item_type_stats = stats_engine.by('アイテムタイプ', min_count=3)
 
 # ブランド別統計
-brand_stats = {}
-for brand in df['ブランド'].unique():
-    brand_df = df[df['ブランド'] == brand]
-    if len(brand_df) < 2:
-        continue
-    brand_stats[brand] = {
-        'count': int(len(brand_df)),
-        'sales': int(brand_df['販売数'].sum()),
-        'revenue': float(brand_df['売上'].sum()),
-        'avg_price': float(brand_df['価格'].mean()),
-        'median_price': float(brand_df['価格'].median()),
-        'min_price': float(brand_df['価格'].min()),
-        'max_price': float(brand_df['価格'].max()),
-        'cv': float(calc_cv(brand_df['価格'])),
-        'purchase_limit': float(brand_df['仕入れ上限'].median())
-    }
+brand_stats = stats_engine.by('ブランド', min_count=2)
 
 # 月次売上
-monthly_sales = df.groupby('販売月').agg({
-    '販売数': 'sum',
-    '売上': 'sum'
-}).reset_index()
-monthly_sales = monthly_sales.sort_values('販売月')
+if df is None:
+    monthly_sales = stats_trend_matrix(stats_engine, value='revenue', name='売上')
+else:
+    monthly_sales = trend_matrix(df, value='売上', resolution='month')
 
 # ブランドカテゴリ別統計
 brand_cat_stats = {}
-for cat in df['ブランドカテゴリ'].unique():
-    cat_df = df[df['ブランドカテゴリ'] == cat]
-    brand_cat_stats[cat] = {
-        'count': int(len(cat_df)),
-        'sales': int(cat_df['販売数'].sum()),
-        'revenue': float(cat_df['売上'].sum()),
-        'avg_price': float(cat_df['価格'].mean()),
-        'median_price': float(cat_df['価格'].median())
-    }
+for cat, stats in stats_engine.by('ブランドカテゴリ').items():
+    brand_cat_stats[cat] = {k: stats[k] for k in ['count', 'sales', 'revenue', 'avg_price', 'median_price']}
 
 # まとめ売り統計
-bulk_df = df[df['まとめ売り'] == True]
+bulk_group = stats_engine.by('まとめ売り').get(True, {})
 bulk_stats = {
-    'count': int(len(bulk_df)),
-    'sales': int(bulk_df['販売数'].sum()),
-    'avg_price': float(bulk_df['価格'].mean()) if len(bulk_df) > 0 else 0,
-    'median_price': float(bulk_df['価格'].median()) if len(bulk_df) > 0 else 0
+    'count': bulk_group.get('count', 0),
+    'sales': bulk_group.get('sales', 0),
+    'avg_price': bulk_group.get('avg_price', 0),
+    'median_price': bulk_group.get('median_price', 0)
 }
 
 # 価格帯分布
 def get_price_distribution(prices):
-    bins = [0, 25, 50, 75, 100, 150, 200, 300, 500, 1000, float('inf')]
-    labels = ['$0-24', '$25-49', '$50-74', '$75-99', '$100-149', '$150-199', '$200-299', '$300-499', '$500-999', '$1000+']
-    distribution = pd.cut(prices, bins=bins, labels=labels).value_counts().sort_index()
-    return {k: int(v) for k, v in distribution.items()}
-
-price_dist = get_price_distribution(df['価格'])
-
-# おすすめ商品（回転重視）
-safe_df = df[(df['まとめ売り'] == False) & (df['CITES_RISK'] == False)]
-recommend_rotation = []
-recommend_profit = []
-
-grouped = safe_df.groupby(['ブランド', 'アイテムタイプ']).agg({
-    '価格': ['count', 'mean', 'median', 'min', 'max', 'std'],
-    '販売数': 'sum',
-    '売上': 'sum',
-    '仕入れ上限': 'median'
-}).round(2)
-grouped.columns = ['取引件数', '平均価格', '中央値', '最低価格', '最高価格', '標準偏差', '販売数', '売上', '仕入れ上限']
-grouped['CV'] = grouped['標準偏差'] / grouped['平均価格']
-grouped['CV'] = grouped['CV'].fillna(0)
-
-# 回転重視
-rotation_df = grouped[(grouped['CV'] <= 0.5) & (grouped['仕入れ上限'] <= 30000) & (grouped['販売数'] >= 3)]
-rotation_df = rotation_df.copy()
-rotation_df['スコア'] = rotation_df['仕入れ上限'] * rotation_df['販売数']
-rotation_df = rotation_df.sort_values('スコア', ascending=False)
-
-for idx, row in rotation_df.head(20).iterrows():
-    brand, item_type = idx
-    recommend_rotation.append({
-        'brand': brand,
-        'item_type': item_type,
-        'sales': int(row['販売数']),
-        'median_price': float(row['中央値']),
-        'purchase_limit': float(row['仕入れ上限']),
-        'cv': float(row['CV']),
-        'score': float(row['スコア'])
-    })
+    return PRICE_BINS.counts(prices)
+
+price_dist = stream_summary.price_counts if df is None else get_price_distribution(df['価格'])
+
+# おすすめ商品（単品のみ。まとめ売り・CITESリスク品を除外したブランド×アイテムタイプ別）
+recommend_columns = stats_engine.columns(['まとめ売り', 'CITES_RISK', 'ブランド', 'アイテムタイプ'], sort=True)
+# 統計は小数2桁に丸め、CVは丸めた標準偏差 / 平均（1件のグループは0）
+for name in ['revenue', 'avg_price', 'median_price', 'min_price', 'max_price', 'std', 'purchase_limit']:
+    recommend_columns[name] = recommend_columns[name].round(2)
+with np.errstate(invalid='ignore', divide='ignore'):
+    recommend_cv = recommend_columns['std'] / recommend_columns['avg_price']
+recommend_columns['cv'] = np.where(np.isnan(recommend_cv), 0.0, recommend_cv)
+recommend_ranking = RankingEngine(recommend_columns)
+SAFE_FILTERS = [equals('まとめ売り', False), equals('CITES_RISK', False)]
+
+def top_recommendations(k, filters, columns):
+    return [dict(row, brand=row.pop('ブランド'), item_type=row.pop('アイテムタイプ'))
+            for row in recommend_ranking.top(k, limit_times_sales, SAFE_FILTERS + filters,
+                                             ['ブランド', 'アイテムタイプ'] + columns)]
+
+# 回転重視（CV <= 0.5、仕入上限 <= 30000、販売数 >= 3）
+recommend_rotation = top_recommendations(20, ROTATION_FILTERS, ['sales', 'median_price', 'purchase_limit', 'cv'])
 
 # 利益重視
-profit_df = grouped.copy()
-profit_df['スコア'] = profit_df['仕入れ上限'] * profit_df['販売数']
-profit_df = profit_df.sort_values('スコア', ascending=False)
-
-for idx, row in profit_df.head(30).iterrows():
-    brand, item_type = idx
-    recommend_profit.append({
-        'brand': brand,
-        'item_type': item_type,
-        'sales': int(row['販売数']),
-        'revenue': float(row['売上']),
-        'median_price': float(row['中央値']),
-        'purchase_limit': float(row['仕入れ上限']),
-        'cv': float(row['CV']),
-        'score': float(row['スコア'])
-    })
+recommend_profit = top_recommendations(30, [], ['sales', 'revenue', 'median_price', 'purchase_limit', 'cv'])
 
 # 主要アイテムタイプ
 main_item_types = ['Barrette', 'Headband', 'Hair Clip', 'Tiara', 'Scrunchie', 'Kanzashi']
 
 # ブランド別詳細データ
 def get_brand_detail(brand_name):
-    brand_df = df[df['ブランド'] == brand_name]
-    if len(brand_df) < 3:
+    stats = stats_engine.by('ブランド').get(brand_name)
+    if not stats or stats['count'] < 3:
         return None
 
     type_stats = []
-    for item_type in brand_df['アイテムタイプ'].unique():
-        type_df = brand_df[brand_df['アイテムタイプ'] == item_type]
-        if len(type_df) >= 1:
-            type_stats.append({
-                'item_type': item_type,
-                'count': int(len(type_df)),
-                'sales': int(type_df['販売数'].sum()),
-                'avg_price': float(type_df['価格'].mean()),
-                'median_price': float(type_df['価格'].median()),
-                'min_price': float(type_df['価格'].min()),
-                'max_price': float(type_df['価格'].max()),
-                'purchase_limit': float(type_df['仕入れ上限'].median())
-            })
+    for item_type, t_stats in stats_engine.within(['ブランド', 'アイテムタイプ'], brand_name).items():
+        type_stats.append({
+            'item_type': item_type,
+            **{k: t_stats[k] for k in ['count', 'sales', 'avg_price', 'median_price', 'min_price', 'max_price',
+                                       'purchase_limit']}
+        })
 
     return {
-        'total_count': int(len(brand_df)),
-        'total_sales': int(brand_df['販売数'].sum()),
-        'total_revenue': float(brand_df['売上'].sum()),
-        'avg_price': float(brand_df['価格'].mean()),
-        'median_price': float(brand_df['価格'].median()),
-        'min_price': float(brand_df['価格'].min()),
-        'max_price': float(brand_df['価格'].max()),
-        'cv': float(calc_cv(brand_df['価格'])),
-        'purchase_limit': float(brand_df['仕入れ上限'].median()),
+        'total_count': stats['count'],
+        'total_sales': stats['sales'],
+        'total_revenue': stats['revenue'],
+        **{k: stats[k] for k in ['avg_price', 'median_price', 'min_price', 'max_price', 'cv', 'purchase_limit']},
         'type_stats': sorted(type_stats, key=lambda x: x['sales'], reverse=True),
-        'novelty_count': int(len(brand_df[brand_df['ノベルティ'] == True])),
-        'bulk_count': int(len(brand_df[brand_df['まとめ売り'] == True]))
+        'novelty_count': stats_engine.within(['ブランド', 'ノベルティ'], brand_name).get(True, {}).get('count', 0),
+        'bulk_count': stats_engine.within(['ブランド', 'まとめ売り'], brand_name).get(True, {}).get('count', 0)
     }
 
 brand_details = {}
@@ -309,8 +305,8 @@ for brand in top_brands:
 chart_scripts = []
 
 # 月次売上データ
-monthly_labels = monthly_sales['販売月'].tolist()
-monthly_values = [float(v) for v in monthly_sales['売上'].tolist()]
+monthly_labels = monthly_sales.index.tolist()
+monthly_values = [float(v) for v in monthly_sales['売上']]
 
 # ブランド別シェア用データ
 brand_pie_labels = list(brand_stats.keys())[:10]
@@ -330,81 +326,74 @@ cat_pie_values = [brand_cat_stats[c]['sales'] for c in cat_pie_labels]
 
 # ========== HTML生成 ==========
 
-def generate_stats_grid(stats):
-    """統計カードグリッドを生成"""
-    return f'''
+STATS_GRID = Template('''
         <div class="stats-grid">
             <div class="stat-card">
                 <div class="icon">📊</div>
                 <div class="label">取引件数</div>
-                <div class="value">{stats.get('count', 0):,}</div>
+                <div class="value">{count:,}</div>
             </div>
             <div class="stat-card">
                 <div class="icon">📦</div>
                 <div class="label">総販売数</div>
-                <div class="value">{stats.get('sales', 0):,}</div>
+                <div class="value">{sales:,}</div>
             </div>
             <div class="stat-card">
                 <div class="icon">💵</div>
                 <div class="label">平均価格</div>
-                <div class="value">${stats.get('avg_price', 0):,.2f}</div>
+                <div class="value">${avg_price:,.2f}</div>
             </div>
             <div class="stat-card">
                 <div class="icon">📈</div>
                 <div class="label">中央値</div>
-                <div class="value">${stats.get('median_price', 0):,.2f}</div>
+                <div class="value">${median_price:,.2f}</div>
             </div>
             <div class="stat-card">
                 <div class="icon">⬇️</div>
                 <div class="label">最低価格</div>
-                <div class="value">${stats.get('min_price', 0):,.2f}</div>
+                <div class="value">${min_price:,.2f}</div>
             </div>
             <div class="stat-card">
                 <div class="icon">⬆️</div>
                 <div class="label">最高価格</div>
-                <div class="value">${stats.get('max_price', 0):,.2f}</div>
+                <div class="value">${max_price:,.2f}</div>
             </div>
             <div class="stat-card">
                 <div class="icon">📉</div>
                 <div class="label">CV値</div>
-                <div class="value">{stats.get('cv', 0):.3f}</div>
+                <div class="value">{cv:.3f}</div>
             </div>
             <div class="stat-card">
                 <div class="icon">💴</div>
                 <div class="label">仕入上限</div>
-                <div class="value highlight">¥{stats.get('purchase_limit', 0):,.0f}</div>
+                <div class="value highlight">¥{purchase_limit:,.0f}</div>
             </div>
         </div>
-    '''
+    ''')
 
-def generate_brand_table(data, tab_id):
-    """ブランド別テーブルを生成"""
-    rows = []
-    for brand, stats in sorted(data.items(), key=lambda x: x[1]['sales'], reverse=True)[:20]:
-        if brand == '(不明)':
-            display_name = '不明'
-        else:
-            display_name = brand
-
-        keyword = brand.replace(' ', '+')
-        rows.append(f'''
+def generate_stats_grid(stats):
+    """統計カードグリッドを生成"""
+    return STATS_GRID.render(stats, count=0, sales=0, avg_price=0, median_price=0, min_price=0, max_price=0, cv=0,
+                             purchase_limit=0)
+
+BRAND_TABLE_ROW = Template('''
                     <tr>
                         <td><strong>{display_name}</strong></td>
-                        <td>{stats['sales']:,}</td>
-                        <td>${stats['min_price']:.2f}</td>
-                        <td>${stats['max_price']:.2f}</td>
-                        <td>${stats['median_price']:.2f}</td>
-                        <td>¥{stats['median_price'] * EXCHANGE_RATE:,.0f}</td>
-                        <td class="highlight">¥{stats['purchase_limit']:,.0f}</td>
-                        <td>{stats['cv']:.3f}</td>
+                        <td>{sales:,}</td>
+                        <td>${min_price:.2f}</td>
+                        <td>${max_price:.2f}</td>
+                        <td>${median_price:.2f}</td>
+                        <td>¥{median_jpy:,.0f}</td>
+                        <td class="highlight">¥{purchase_limit:,.0f}</td>
+                        <td>{cv:.3f}</td>
                         <td>
-                            <a href="https://www.ebay.com/sch/i.html?_nkw={keyword}+Hair+Accessory&LH_Sold=1" target="_blank" class="link-btn link-ebay">eBay</a>
-                            <a href="https://jp.mercari.com/search?keyword={keyword}%20髪飾り&status=on_sale" target="_blank" class="link-btn link-mercari">メルカリ</a>
+                            <a href="https://www.ebay.com/sch/i.html?_nkw={keyword!a}+Hair+Accessory&LH_Sold=1" target="_blank" class="link-btn link-ebay">eBay</a>
+                            <a href="https://jp.mercari.com/search?keyword={keyword!a}%20髪飾り&status=on_sale" target="_blank" class="link-btn link-mercari">メルカリ</a>
                         </td>
                     </tr>
         ''')
 
-    return f'''
+BRAND_TABLE = Template('''
         <div class="table-container">
             <table>
                 <thead>
@@ -421,50 +410,48 @@ def generate_brand_table(data, tab_id):
                     </tr>
                 </thead>
                 <tbody>
-                    {''.join(rows)}
+                    {rows!s}
                 </tbody>
             </table>
         </div>
-    '''
+    ''')
+
+def generate_brand_table(data, tab_id):
+    """ブランド別テーブルを生成"""
+    rows = [dict(stats, display_name='不明' if brand == '(不明)' else brand, keyword=brand.replace(' ', '+'),
+                 median_jpy=stats['median_price'] * EXCHANGE_RATE)
+            for brand, stats in sorted(data.items(), key=lambda x: x[1]['sales'], reverse=True)[:20]]
+    return BRAND_TABLE.render(rows=BRAND_TABLE_ROW.render_rows(rows))
+
+ITEM_TYPE_TAB = Template('''
+    <div id="type_{tab_id!a}" class="tab-content">
+        <h2 class="section-title">{item_type} 市場分析</h2>
+        {stats_grid!s}
+        <h3 class="section-title">📊 市場分析グラフ</h3>
+        <div class="chart-grid" style="display: grid; grid-template-columns: 1fr 1fr; gap: 20px;">
+            <div class="chart-container"><div id="{tab_id!a}_brand_bar"></div></div>
+            <div class="chart-container"><div id="{tab_id!a}_brand_pie"></div></div>
+        </div>
+        <h3 class="section-title">🏷️ ブランド別集計（Top20）</h3>
+        {brand_table!s}
+    </div>
+    ''')
 
 # 主要アイテムタイプ用のタブ内容生成
 def generate_item_type_tab(item_type):
     """アイテムタイプ別タブの内容を生成（スクリプトなし）"""
-    type_df = df[df['アイテムタイプ'] == item_type]
-    if len(type_df) < 3:
+    stats = stats_engine.by('アイテムタイプ').get(item_type, {})
+    if stats.get('count', 0) < 3:
         return f'''
         <div id="type_{item_type.lower().replace(' ', '_')}" class="tab-content">
             <h2 class="section-title">{item_type} 市場分析</h2>
-            <p>データが不足しています（{len(type_df)}件）</p>
+            <p>データが不足しています（{stats.get('count', 0)}件）</p>
         </div>
         ''', None
 
-    stats = {
-        'count': int(len(type_df)),
-        'sales': int(type_df['販売数'].sum()),
-        'revenue': float(type_df['売上'].sum()),
-        'avg_price': float(type_df['価格'].mean()),
-        'median_price': float(type_df['価格'].median()),
-        'min_price': float(type_df['価格'].min()),
-        'max_price': float(type_df['価格'].max()),
-        'cv': float(calc_cv(type_df['価格'])),
-        'purchase_limit': float(type_df['仕入れ上限'].median())
-    }
-
     type_brand_stats = {}
-    for brand in type_df['ブランド'].unique():
-        brand_df = type_df[type_df['ブランド'] == brand]
-        if len(brand_df) >= 1:
-            type_brand_stats[brand] = {
-                'count': int(len(brand_df)),
-                'sales': int(brand_df['販売数'].sum()),
-                'avg_price': float(brand_df['価格'].mean()),
-                'median_price': float(brand_df['価格'].median()),
-                'min_price': float(brand_df['価格'].min()),
-                'max_price': float(brand_df['価格'].max()),
-                'cv': float(calc_cv(brand_df['価格'])) if len(brand_df) >= 2 else 0,
-                'purchase_limit': float(brand_df['仕入れ上限'].median())
-            }
+    for brand, b_stats in stats_engine.within(['アイテムタイプ', 'ブランド'], item_type).items():
+        type_brand_stats[brand] = {k: v for k, v in b_stats.items() if k != 'revenue'}
 
     top_brands_in_type = sorted(type_brand_stats.items(), key=lambda x: x[1]['sales'], reverse=True)[:10]
     chart_labels = [b[0] for b in top_brands_in_type]
@@ -472,21 +459,11 @@ def generate_item_type_tab(item_type):
 
     tab_id = item_type.lower().replace(' ', '_')
 
-    html = f'''
-    <div id="type_{tab_id}" class="tab-content">
-        <h2 class="section-title">{item_type} 市場分析</h2>
-        {generate_stats_grid(stats)}
-        <h3 class="section-title">📊 市場分析グラフ</h3>
-        <div class="chart-grid" style="display: grid; grid-template-columns: 1fr 1fr; gap: 20px;">
-            <div class="chart-container"><div id="{tab_id}_brand_bar"></div></div>
-            <div class="chart-container"><div id="{tab_id}_brand_pie"></div></div>
-        </div>
-        <h3 class="section-title">🏷️ ブランド別集計（Top20）</h3>
-        {generate_brand_table(type_brand_stats, tab_id)}
-    </div>
-    '''
+    html = ITEM_TYPE_TAB.render(item_type=item_type, tab_id=tab_id, stats_grid=generate_stats_grid(stats),
+                                brand_table=generate_brand_table(type_brand_stats, tab_id))
 
     script = f'''
+    tabCharts['type_{tab_id}'] = function() {{
         Plotly.newPlot('{tab_id}_brand_bar', [{{
             x: {chart_values},
             y: {json.dumps(chart_labels, ensure_ascii=False)},
@@ -499,68 +476,43 @@ def generate_item_type_tab(item_type):
             values: {chart_values},
             type: 'pie'
         }}], {{...plotlyLayout, title: 'ブランド別シェア'}}, plotlyConfig);
+    }};
     '''
 
     return html, script
 
-# 主要ブランド用のタブ内容生成
-def generate_brand_tab(brand_name):
-    """ブランド別タブの内容を生成（スクリプトなし）"""
-    if brand_name not in brand_details:
-        return '', None
-
-    detail = brand_details[brand_name]
-    tab_id = brand_name.lower().replace(' ', '_').replace('.', '').replace('&', '')
-
-    type_rows = []
-    for ts in detail['type_stats'][:15]:
-        keyword = f"{brand_name.replace(' ', '+')}+{ts['item_type'].replace(' ', '+')}"
-        type_rows.append(f'''
+BRAND_TYPE_ROW = Template('''
                     <tr>
-                        <td><strong>{ts['item_type']}</strong></td>
-                        <td>{ts['sales']:,}</td>
-                        <td>${ts['min_price']:.2f}</td>
-                        <td>${ts['max_price']:.2f}</td>
-                        <td>${ts['median_price']:.2f}</td>
-                        <td class="highlight">¥{ts['purchase_limit']:,.0f}</td>
+                        <td><strong>{item_type}</strong></td>
+                        <td>{sales:,}</td>
+                        <td>${min_price:.2f}</td>
+                        <td>${max_price:.2f}</td>
+                        <td>${median_price:.2f}</td>
+                        <td class="highlight">¥{purchase_limit:,.0f}</td>
                         <td>
-                            <a href="https://www.ebay.com/sch/i.html?_nkw={keyword}&LH_Sold=1" target="_blank" class="link-btn link-ebay">eBay</a>
-                            <a href="https://jp.mercari.com/search?keyword={brand_name}%20{ts['item_type']}&status=on_sale" target="_blank" class="link-btn link-mercari">メルカリ</a>
+                            <a href="https://www.ebay.com/sch/i.html?_nkw={keyword!a}&LH_Sold=1" target="_blank" class="link-btn link-ebay">eBay</a>
+                            <a href="https://jp.mercari.com/search?keyword={brand_name!a}%20{item_type!a}&status=on_sale" target="_blank" class="link-btn link-mercari">メルカリ</a>
                         </td>
                     </tr>
         ''')
 
-    chart_labels = [ts['item_type'] for ts in detail['type_stats'][:8]]
-    chart_values = [ts['sales'] for ts in detail['type_stats'][:8]]
-
-    stats = {
-        'count': detail['total_count'],
-        'sales': detail['total_sales'],
-        'avg_price': detail['avg_price'],
-        'median_price': detail['median_price'],
-        'min_price': detail['min_price'],
-        'max_price': detail['max_price'],
-        'cv': detail['cv'],
-        'purchase_limit': detail['purchase_limit']
-    }
-
-    html = f'''
-    <div id="brand_{tab_id}" class="tab-content">
+BRAND_TAB = Template('''
+    <div id="brand_{tab_id!a}" class="tab-content">
         <h2 class="section-title">{brand_name} 詳細分析</h2>
-        {generate_stats_grid(stats)}
+        {stats_grid!s}
         <div class="insight-box">
             <h3>💡 {brand_name} の特徴</h3>
             <ul>
-                <li>📦 総販売数: {detail['total_sales']:,}個</li>
-                <li>💰 総売上: ${detail['total_revenue']:,.2f}</li>
-                <li>🎁 ノベルティ品: {detail['novelty_count']}件</li>
-                <li>📦 まとめ売り: {detail['bulk_count']}件</li>
+                <li>📦 総販売数: {total_sales:,}個</li>
+                <li>💰 総売上: ${total_revenue:,.2f}</li>
+                <li>🎁 ノベルティ品: {novelty_count}件</li>
+                <li>📦 まとめ売り: {bulk_count}件</li>
             </ul>
         </div>
         <h3 class="section-title">📊 アイテムタイプ別分析</h3>
         <div class="chart-grid" style="display: grid; grid-template-columns: 1fr 1fr; gap: 20px;">
-            <div class="chart-container"><div id="{tab_id}_type_bar"></div></div>
-            <div class="chart-container"><div id="{tab_id}_type_pie"></div></div>
+            <div class="chart-container"><div id="{tab_id!a}_type_bar"></div></div>
+            <div class="chart-container"><div id="{tab_id!a}_type_pie"></div></div>
         </div>
         <h3 class="section-title">🏷️ アイテムタイプ別集計</h3>
         <div class="table-container">
@@ -577,14 +529,46 @@ def generate_brand_tab(brand_name):
                     </tr>
                 </thead>
                 <tbody>
-                    {''.join(type_rows)}
+                    {type_rows!s}
                 </tbody>
             </table>
         </div>
     </div>
-    '''
+    ''')
+
+# 主要ブランド用のタブ内容生成
+def generate_brand_tab(brand_name):
+    """ブランド別タブの内容を生成（スクリプトなし）"""
+    if brand_name not in brand_details:
+        return '', None
+
+    detail = brand_details[brand_name]
+    tab_id = brand_name.lower().replace(' ', '_').replace('.', '').replace('&', '')
+
+    type_rows = BRAND_TYPE_ROW.render_rows(
+        [dict(ts, keyword=f"{brand_name.replace(' ', '+')}+{ts['item_type'].replace(' ', '+')}")
+         for ts in detail['type_stats'][:15]],
+        brand_name=brand_name)
+
+    chart_labels = [ts['item_type'] for ts in detail['type_stats'][:8]]
+    chart_values = [ts['sales'] for ts in detail['type_stats'][:8]]
+
+    stats = {
+        'count': detail['total_count'],
+        'sales': detail['total_sales'],
+        'avg_price': detail['avg_price'],
+        'median_price': detail['median_price'],
+        'min_price': detail['min_price'],
+        'max_price': detail['max_price'],
+        'cv': detail['cv'],
+        'purchase_limit': detail['purchase_limit']
+    }
+
+    html = BRAND_TAB.render(detail, brand_name=brand_name, tab_id=tab_id, stats_grid=generate_stats_grid(stats),
+                            type_rows=type_rows)
 
     script = f'''
+    tabCharts['brand_{tab_id}'] = function() {{
         Plotly.newPlot('{tab_id}_type_bar', [{{
             x: {chart_values},
             y: {json.dumps(chart_labels, ensure_ascii=False)},
@@ -597,29 +581,11 @@ def generate_brand_tab(brand_name):
             values: {chart_values},
             type: 'pie'
         }}], {{...plotlyLayout, title: 'アイテムタイプ別シェア'}}, plotlyConfig);
+    }};
     '''
 
     return html, script
 
-# タブとスクリプトを収集
-item_type_tabs_html = []
-item_type_scripts = []
-for t in main_item_types:
-    if t in item_type_stats:
-        html, script = generate_item_type_tab(t)
-        item_type_tabs_html.append(html)
-        if script:
-            item_type_scripts.append(script)
-
-brand_tabs_html = []
-brand_scripts = []
-for b in top_brands[:6]:
-    html, script = generate_brand_tab(b)
-    if html:
-        brand_tabs_html.append(html)
-    if script:
-        brand_scripts.append(script)
-
 # アイテムタイプタブボタン
 item_type_tab_buttons = ''.join([
     f'<button class="tab" onclick="showTab(\'type_{t.lower().replace(" ", "_")}\')">{t}</button>'
@@ -632,56 +598,50 @@ brand_tab_buttons = ''.join([
     for b in top_brands[:6]
 ])
 
-# おすすめ回転重視テーブル
-rotation_rows = []
-for i, rec in enumerate(recommend_rotation[:15], 1):
-    stability = '★★★' if rec['cv'] <= 0.2 else ('★★☆' if rec['cv'] <= 0.35 else '★☆☆')
-    rotation_rows.append(f'''
+# おすすめテーブルの行
+RECOMMEND_ROW = Template('''
                         <tr>
-                            <td><strong>{i}</strong></td>
-                            <td>{rec['brand']}</td>
-                            <td>{rec['item_type']}</td>
-                            <td>{rec['sales']}</td>
-                            <td>${rec['median_price']:.2f}</td>
-                            <td class="highlight">¥{rec['purchase_limit']:,.0f}</td>
-                            <td>{stability}</td>
-                            <td>{rec['score']:,.0f}</td>
+                            <td><strong>{rank}</strong></td>
+                            <td>{brand}</td>
+                            <td>{item_type}</td>
+                            <td>{sales}</td>
+                            <td>${median_price:.2f}</td>
+                            <td class="highlight">¥{purchase_limit:,.0f}</td>
+                            <td>{rating!s}</td>
+                            <td>{score:,.0f}</td>
                         </tr>
     ''')
 
+def recommend_rows(recommendations, rating):
+    """rating は推薦1件 → 安定度・リスクの表示（HTML）"""
+    return RECOMMEND_ROW.render_rows([dict(rec, rank=i, rating=rating(rec))
+                                      for i, rec in enumerate(recommendations, 1)])
+
+# おすすめ回転重視テーブル
+rotation_rows = recommend_rows(
+    recommend_rotation[:15],
+    lambda rec: '★★★' if rec['cv'] <= 0.2 else ('★★☆' if rec['cv'] <= 0.35 else '★☆☆'))
+
 # おすすめ利益重視テーブル
-profit_rows = []
-for i, rec in enumerate(recommend_profit[:20], 1):
-    risk = '<span class="risk-low">低</span>' if rec['cv'] <= 0.3 else ('<span class="risk-mid">中</span>' if rec['cv'] <= 0.6 else '<span class="risk-high">高</span>')
-    profit_rows.append(f'''
-                        <tr>
-                            <td><strong>{i}</strong></td>
-                            <td>{rec['brand']}</td>
-                            <td>{rec['item_type']}</td>
-                            <td>{rec['sales']}</td>
-                            <td>${rec['median_price']:.2f}</td>
-                            <td class="highlight">¥{rec['purchase_limit']:,.0f}</td>
-                            <td>{risk}</td>
-                            <td>{rec['score']:,.0f}</td>
-                        </tr>
-    ''')
+profit_rows = recommend_rows(
+    recommend_profit[:20],
+    lambda rec: '<span class="risk-low">低</span>' if rec['cv'] <= 0.3 else ('<span class="risk-mid">中</span>' if rec['cv'] <= 0.6 else '<span class="risk-high">高</span>'))
 
 # CITES警告品
-cites_df = df[df['CITES_RISK'] == True]
+cites_count = stats_engine.by('CITES_RISK').get(True, {}).get('count', 0)
 cites_warning = ''
-if len(cites_df) > 0:
+if cites_count > 0:
     cites_warning = f'''
         <div class="insight-box" style="background: linear-gradient(135deg, #ffebee, #ffcdd2); border-left: 4px solid #f44336;">
-            <h3>⚠️ CITES規制リスク品検出（{len(cites_df)}件）</h3>
+            <h3>⚠️ CITES規制リスク品検出（{cites_count}件）</h3>
             <p>べっ甲・象牙などのワシントン条約規制対象の可能性がある商品が検出されました。輸出入には許可証が必要です。</p>
         </div>
     '''
 
-# 全スクリプトを結合
-all_chart_scripts = '\n'.join(item_type_scripts + brand_scripts)
+# HTML生成（セクションごとに一時ファイルへ書き出し、最後に出力先へ置き換える）
+html_out = StreamingHtmlWriter(OUTPUT_PATH)
 
-# HTML生成
-html_content = f'''<!DOCTYPE html>
+html_out.write('''<!DOCTYPE html>
 <html lang="ja" data-theme="light">
 <head>
     <meta charset="UTF-8">
@@ -689,7 +649,7 @@ html_content = f'''<!DOCTYPE html>
     <title>髪飾り市場分析 - eBay転売リサーチ</title>
     <script src="https://cdn.plot.ly/plotly-2.27.0.min.js"></script>
     <style>
-        :root {{
+        :root {
             --bg-primary: #ffffff;
             --bg-secondary: #f8f9fa;
             --text-primary: #212529;
@@ -698,8 +658,8 @@ html_content = f'''<!DOCTYPE html>
             --accent-color: #E91E63;
             --accent-light: #FCE4EC;
             --card-shadow: 0 2px 8px rgba(0,0,0,0.1);
-        }}
-        [data-theme="dark"] {{
+        }
+        [data-theme="dark"] {
             --bg-primary: #1a1a2e;
             --bg-secondary: #16213e;
             --text-primary: #eaeaea;
@@ -707,54 +667,57 @@ html_content = f'''<!DOCTYPE html>
             --border-color: #3a3a5a;
             --accent-light: #3a1a2e;
             --card-shadow: 0 2px 8px rgba(0,0,0,0.3);
-        }}
-        * {{ box-sizing: border-box; margin: 0; padding: 0; }}
-        body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; background: var(--bg-secondary); color: var(--text-primary); line-height: 1.6; }}
-        .header {{ background: linear-gradient(135deg, #E91E63 0%, #9C27B0 100%); color: white; padding: 30px 20px; text-align: center; }}
-        .header h1 {{ font-size: 2em; margin-bottom: 10px; }}
-        .header .subtitle {{ opacity: 0.9; font-size: 1.1em; }}
-        .settings-panel {{ background: rgba(255,255,255,0.1); border-radius: 10px; padding: 15px; margin: 20px auto; max-width: 800px; display: flex; flex-wrap: wrap; gap: 15px; justify-content: center; align-items: center; }}
-        .settings-panel label {{ display: flex; align-items: center; gap: 8px; font-size: 0.9em; }}
-        .settings-panel input {{ width: 80px; padding: 5px 10px; border: none; border-radius: 5px; text-align: right; }}
-        .settings-panel button {{ background: white; color: #E91E63; border: none; padding: 8px 16px; border-radius: 5px; cursor: pointer; font-weight: bold; }}
-        .settings-panel button:hover {{ background: #FCE4EC; }}
-        .container {{ max-width: 1400px; margin: 0 auto; padding: 20px; }}
-        .tab-nav {{ display: flex; flex-wrap: wrap; gap: 5px; margin-bottom: 20px; background: var(--bg-primary); padding: 10px; border-radius: 10px; box-shadow: var(--card-shadow); }}
-        .tab {{ padding: 10px 20px; border: none; background: var(--bg-secondary); color: var(--text-primary); cursor: pointer; border-radius: 5px; transition: all 0.3s; font-size: 0.9em; }}
-        .tab:hover {{ background: var(--accent-light); }}
-        .tab.active {{ background: var(--accent-color); color: white; }}
-        .tab-content {{ display: none; background: var(--bg-primary); padding: 20px; border-radius: 10px; box-shadow: var(--card-shadow); }}
-        .tab-content.active {{ display: block; }}
-        .section-title {{ font-size: 1.3em; margin: 20px 0 15px; padding-bottom: 10px; border-bottom: 2px solid var(--accent-color); }}
-        .stats-grid {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(150px, 1fr)); gap: 15px; margin-bottom: 20px; }}
-        .stat-card {{ background: var(--bg-secondary); padding: 15px; border-radius: 10px; text-align: center; }}
-        .stat-card .icon {{ font-size: 1.5em; margin-bottom: 5px; }}
-        .stat-card .label {{ font-size: 0.8em; color: var(--text-secondary); margin-bottom: 5px; }}
-        .stat-card .value {{ font-size: 1.4em; font-weight: bold; color: var(--text-primary); }}
-        .stat-card .value.highlight {{ color: var(--accent-color); }}
-        .chart-grid {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(400px, 1fr)); gap: 20px; margin-bottom: 20px; }}
-        .chart-container {{ background: var(--bg-secondary); padding: 15px; border-radius: 10px; min-height: 350px; }}
-        .table-container {{ overflow-x: auto; margin-bottom: 20px; }}
-        table {{ width: 100%; border-collapse: collapse; font-size: 0.9em; }}
-        th, td {{ padding: 12px 10px; text-align: left; border-bottom: 1px solid var(--border-color); }}
-        th {{ background: var(--bg-secondary); font-weight: 600; position: sticky; top: 0; }}
-        tr:hover {{ background: var(--accent-light); }}
-        .highlight {{ color: var(--accent-color); font-weight: bold; }}
-        .link-btn {{ display: inline-block; padding: 4px 10px; border-radius: 4px; text-decoration: none; font-size: 0.8em; margin: 2px; }}
-        .link-ebay {{ background: #0064D2; color: white; }}
-        .link-mercari {{ background: #FF0211; color: white; }}
-        .insight-box {{ background: linear-gradient(135deg, var(--accent-light), var(--bg-secondary)); border-left: 4px solid var(--accent-color); padding: 15px 20px; border-radius: 0 10px 10px 0; margin: 20px 0; }}
-        .insight-box h3 {{ margin-bottom: 10px; }}
-        .insight-box ul {{ margin-left: 20px; }}
-        .mode-selector {{ display: flex; gap: 20px; margin-bottom: 20px; padding: 15px; background: var(--bg-secondary); border-radius: 10px; }}
-        .mode-selector label {{ display: flex; align-items: center; gap: 8px; cursor: pointer; }}
-        .risk-low {{ color: #4CAF50; font-weight: bold; }}
-        .risk-mid {{ color: #FF9800; font-weight: bold; }}
-        .risk-high {{ color: #f44336; font-weight: bold; }}
-        @media (max-width: 768px) {{ .chart-grid {{ grid-template-columns: 1fr; }} .stats-grid {{ grid-template-columns: repeat(2, 1fr); }} }}
+        }
+        * { box-sizing: border-box; margin: 0; padding: 0; }
+        body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; background: var(--bg-secondary); color: var(--text-primary); line-height: 1.6; }
+        .header { background: linear-gradient(135deg, #E91E63 0%, #9C27B0 100%); color: white; padding: 30px 20px; text-align: center; }
+        .header h1 { font-size: 2em; margin-bottom: 10px; }
+        .header .subtitle { opacity: 0.9; font-size: 1.1em; }
+        .settings-panel { background: rgba(255,255,255,0.1); border-radius: 10px; padding: 15px; margin: 20px auto; max-width: 800px; display: flex; flex-wrap: wrap; gap: 15px; justify-content: center; align-items: center; }
+        .settings-panel label { display: flex; align-items: center; gap: 8px; font-size: 0.9em; }
+        .settings-panel input { width: 80px; padding: 5px 10px; border: none; border-radius: 5px; text-align: right; }
+        .settings-panel button { background: white; color: #E91E63; border: none; padding: 8px 16px; border-radius: 5px; cursor: pointer; font-weight: bold; }
+        .settings-panel button:hover { background: #FCE4EC; }
+        .container { max-width: 1400px; margin: 0 auto; padding: 20px; }
+        .tab-nav { display: flex; flex-wrap: wrap; gap: 5px; margin-bottom: 20px; background: var(--bg-primary); padding: 10px; border-radius: 10px; box-shadow: var(--card-shadow); }
+        .tab { padding: 10px 20px; border: none; background: var(--bg-secondary); color: var(--text-primary); cursor: pointer; border-radius: 5px; transition: all 0.3s; font-size: 0.9em; }
+        .tab:hover { background: var(--accent-light); }
+        .tab.active { background: var(--accent-color); color: white; }
+        .tab-content { display: none; background: var(--bg-primary); padding: 20px; border-radius: 10px; box-shadow: var(--card-shadow); }
+        .tab-content.active { display: block; }
+        .section-title { font-size: 1.3em; margin: 20px 0 15px; padding-bottom: 10px; border-bottom: 2px solid var(--accent-color); }
+        .stats-grid { display: grid; grid-template-columns: repeat(auto-fit, minmax(150px, 1fr)); gap: 15px; margin-bottom: 20px; }
+        .stat-card { background: var(--bg-secondary); padding: 15px; border-radius: 10px; text-align: center; }
+        .stat-card .icon { font-size: 1.5em; margin-bottom: 5px; }
+        .stat-card .label { font-size: 0.8em; color: var(--text-secondary); margin-bottom: 5px; }
+        .stat-card .value { font-size: 1.4em; font-weight: bold; color: var(--text-primary); }
+        .stat-card .value.highlight { color: var(--accent-color); }
+        .chart-grid { display: grid; grid-template-columns: repeat(auto-fit, minmax(400px, 1fr)); gap: 20px; margin-bottom: 20px; }
+        .chart-container { background: var(--bg-secondary); padding: 15px; border-radius: 10px; min-height: 350px; }
+        .table-container { overflow-x: auto; margin-bottom: 20px; }
+        table { width: 100%; border-collapse: collapse; font-size: 0.9em; }
+        th, td { padding: 12px 10px; text-align: left; border-bottom: 1px solid var(--border-color); }
+        th { background: var(--bg-secondary); font-weight: 600; position: sticky; top: 0; }
+        tr:hover { background: var(--accent-light); }
+        .highlight { color: var(--accent-color); font-weight: bold; }
+        .link-btn { display: inline-block; padding: 4px 10px; border-radius: 4px; text-decoration: none; font-size: 0.8em; margin: 2px; }
+        .link-ebay { background: #0064D2; color: white; }
+        .link-mercari { background: #FF0211; color: white; }
+        .insight-box { background: linear-gradient(135deg, var(--accent-light), var(--bg-secondary)); border-left: 4px solid var(--accent-color); padding: 15px 20px; border-radius: 0 10px 10px 0; margin: 20px 0; }
+        .insight-box h3 { margin-bottom: 10px; }
+        .insight-box ul { margin-left: 20px; }
+        .mode-selector { display: flex; gap: 20px; margin-bottom: 20px; padding: 15px; background: var(--bg-secondary); border-radius: 10px; }
+        .mode-selector label { display: flex; align-items: center; gap: 8px; cursor: pointer; }
+        .risk-low { color: #4CAF50; font-weight: bold; }
+        .risk-mid { color: #FF9800; font-weight: bold; }
+        .risk-high { color: #f44336; font-weight: bold; }
+        @media (max-width: 768px) { .chart-grid { grid-template-columns: 1fr; } .stats-grid { grid-template-columns: repeat(2, 1fr); } }
     </style>
 </head>
-<body>
+''')
+
+# ヘッダー・全体分析タブ
+html_out.write(f'''<body>
     <div class="header">
         <h1>髪飾り市場分析</h1>
         <p class="subtitle">eBay転売リサーチ - {period_start} ~ {period_end}</p>
@@ -777,14 +740,14 @@ html_content = f'''<!DOCTYPE html>
         <div id="overview" class="tab-content active">
             <h2 class="section-title">📊 全体市場分析</h2>
             <div class="stats-grid">
-                <div class="stat-card"><div class="icon">📊</div><div class="label">取引件数</div><div class="value">{len(df):,}</div></div>
+                <div class="stat-card"><div class="icon">📊</div><div class="label">取引件数</div><div class="value">{overall_stats['count']:,}</div></div>
                 <div class="stat-card"><div class="icon">📦</div><div class="label">総販売数</div><div class="value">{total_sales:,}</div></div>
                 <div class="stat-card"><div class="icon">💵</div><div class="label">総売上</div><div class="value">${total_revenue:,.2f}</div></div>
-                <div class="stat-card"><div class="icon">📈</div><div class="label">平均価格</div><div class="value">${float(df['価格'].mean()):,.2f}</div></div>
-                <div class="stat-card"><div class="icon">💰</div><div class="label">中央値</div><div class="value">${float(df['価格'].median()):,.2f}</div></div>
-                <div class="stat-card"><div class="icon">⬆️</div><div class="label">最高価格</div><div class="value">${float(df['価格'].max()):,.2f}</div></div>
-                <div class="stat-card"><div class="icon">📉</div><div class="label">CV値</div><div class="value">{calc_cv(df['価格']):.3f}</div></div>
-                <div class="stat-card"><div class="icon">💴</div><div class="label">仕入上限中央値</div><div class="value highlight">¥{float(df['仕入れ上限'].median()):,.0f}</div></div>
+                <div class="stat-card"><div class="icon">📈</div><div class="label">平均価格</div><div class="value">${overall_stats['avg_price']:,.2f}</div></div>
+                <div class="stat-card"><div class="icon">💰</div><div class="label">中央値</div><div class="value">${overall_stats['median_price']:,.2f}</div></div>
+                <div class="stat-card"><div class="icon">⬆️</div><div class="label">最高価格</div><div class="value">${overall_stats['max_price']:,.2f}</div></div>
+                <div class="stat-card"><div class="icon">📉</div><div class="label">CV値</div><div class="value">{overall_stats['cv']:.3f}</div></div>
+                <div class="stat-card"><div class="icon">💴</div><div class="label">仕入上限中央値</div><div class="value highlight">¥{overall_stats['purchase_limit']:,.0f}</div></div>
             </div>
             {cites_warning}
             <h3 class="section-title">📊 市場分析グラフ</h3>
@@ -798,16 +761,37 @@ html_content = f'''<!DOCTYPE html>
             <h3 class="section-title">🏷️ ブランド別集計（Top20）</h3>
             {generate_brand_table(brand_stats, 'overview')}
         </div>
-        <div id="item_types" class="tab-content">
+''')
+
+# アイテムタイプ別タブ（グラフのスクリプトは最後にまとめて書く）
+chart_scripts = []
+html_out.write(f'''        <div id="item_types" class="tab-content">
             <h2 class="section-title">🎀 アイテムタイプ別分析</h2>
             <div class="tab-nav">{item_type_tab_buttons}</div>
         </div>
-        {''.join(item_type_tabs_html)}
+        ''')
+for t in main_item_types:
+    if t in item_type_stats:
+        html, script = generate_item_type_tab(t)
+        html_out.write(html)
+        if script:
+            chart_scripts.append(script)
+
+# ブランド別タブ
+html_out.write(f'''
         <div id="brands" class="tab-content">
             <h2 class="section-title">🏷️ ブランド別詳細分析</h2>
             <div class="tab-nav">{brand_tab_buttons}</div>
         </div>
-        {''.join(brand_tabs_html)}
+        ''')
+for b in top_brands[:6]:
+    html, script = generate_brand_tab(b)
+    html_out.write(html)
+    if script:
+        chart_scripts.append(script)
+
+# まとめ売りタブ
+html_out.write(f'''
         <div id="bundle" class="tab-content">
             <h2 class="section-title">📦 まとめ売り分析</h2>
             <div class="stats-grid">
@@ -825,7 +809,10 @@ html_content = f'''<!DOCTYPE html>
                 </ul>
             </div>
         </div>
-        <div id="recommend" class="tab-content">
+''')
+
+# おすすめ順序タブ
+html_out.write(f'''        <div id="recommend" class="tab-content">
             <h2 class="section-title">⭐ おすすめ出品順序</h2>
             <div class="mode-selector">
                 <label><input type="radio" name="recMode" value="rotation" checked onchange="switchRecMode()"> 🔄 回転重視（初心者向け）</label>
@@ -839,7 +826,7 @@ html_content = f'''<!DOCTYPE html>
                 <div class="table-container">
                     <table>
                         <thead><tr><th>順位</th><th>ブランド</th><th>アイテムタイプ</th><th>販売数</th><th>中央値($)</th><th>仕入上限</th><th>安定度</th><th>スコア</th></tr></thead>
-                        <tbody>{''.join(rotation_rows)}</tbody>
+                        <tbody>{rotation_rows}</tbody>
                     </table>
                 </div>
             </div>
@@ -851,13 +838,17 @@ html_content = f'''<!DOCTYPE html>
                 <div class="table-container">
                     <table>
                         <thead><tr><th>順位</th><th>ブランド</th><th>アイテムタイプ</th><th>販売数</th><th>中央値($)</th><th>仕入上限</th><th>リスク</th><th>スコア</th></tr></thead>
-                        <tbody>{''.join(profit_rows)}</tbody>
+                        <tbody>{profit_rows}</tbody>
                     </table>
                 </div>
             </div>
         </div>
     </div>
-    <script>
+''')
+
+# スクリプト（アイテムタイプ別・ブランド別グラフを含む）
+all_chart_scripts = '\n'.join(chart_scripts)
+html_out.write(f'''    <script>
     // Plotly共通設定（グローバルスコープで定義）
     const plotlyLayout = {{
         paper_bgcolor: 'rgba(0,0,0,0)',
@@ -867,6 +858,15 @@ html_content = f'''<!DOCTYPE html>
     }};
     const plotlyConfig = {{ responsive: true, displayModeBar: false }};
 
+    // タブごとのグラフ（タブを初めて表示したときに1回だけ描画する。非表示のタブのグラフは作らない）
+    const tabCharts = {{}};
+    const renderedTabs = new Set();
+    function renderTabCharts(tabId) {{
+        if (renderedTabs.has(tabId) || !tabCharts[tabId]) return;
+        renderedTabs.add(tabId);
+        tabCharts[tabId]();
+    }}
+
     function toggleTheme() {{
         const html = document.documentElement;
         const currentTheme = html.getAttribute('data-theme');
@@ -881,6 +881,7 @@ html_content = f'''<!DOCTYPE html>
         document.querySelectorAll('.tab').forEach(el => el.classList.remove('active'));
         document.getElementById(tabId).classList.add('active');
         event.target.classList.add('active');
+        renderTabCharts(tabId);
     }}
 
     function switchRecMode() {{
@@ -929,7 +930,12 @@ html_content = f'''<!DOCTYPE html>
             document.getElementById('themeBtn').textContent = '☀️ ライトモード';
         }}
 
-        // 全体分析グラフ
+        // 最初に表示されているタブ（全体分析）のグラフだけを読み込み時に描画する
+        renderTabCharts(document.querySelector('.tab-content.active').id);
+    }});
+
+    // 全体分析グラフ
+    tabCharts['overview'] = function() {{
         Plotly.newPlot('monthly_chart', [{{
             x: {json.dumps(monthly_labels)},
             y: {json.dumps(monthly_values)},
@@ -961,20 +967,18 @@ html_content = f'''<!DOCTYPE html>
             values: {json.dumps(cat_pie_values)},
             type: 'pie'
         }}], {{...plotlyLayout, title: 'ブランドカテゴリ別シェア'}}, plotlyConfig);
+    }};
 
-        // アイテムタイプ別・ブランド別グラフ
-        {all_chart_scripts}
-    }});
+    // アイテムタイプ別・ブランド別グラフ
+    {all_chart_scripts}
     </script>
 </body>
 </html>
-'''
+''')
 
-# HTMLファイル出力
-output_path = '/Users/naokijodan/Desktop/hair-accessory-research/index.html'
-with open(output_path, 'w', encoding='utf-8') as f:
-    f.write(html_content)
+# HTMLファイル出力（出力先への置き換え）
+output_size = html_out.close()
 
 print(f"\n=== HTML生成完了 ===")
-print(f"出力先: {output_path}")
-print(f"ファイルサイズ: {len(html_content):,} bytes")
+print(f"出力先: {OUTPUT_PATH}")
+print(f"ファイルサイズ: {output_size:,} bytes")
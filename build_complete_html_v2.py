@@ -3,58 +3,99 @@
 
 import pandas as pd
 import json
-from collections import defaultdict
-import re
+import os
 from datetime import datetime
-import numpy as np
+
+from aggregate_cube import AggregateCube
+from bitmap_index import BitmapIndex
+from bootstrap import MIN_STABLE_COUNT, bootstrap_intervals
+from classification_cache import ClassificationCache
+from flag_premium import flag_premiums, grouped_flag_premiums
+from frame_snapshot import load_snapshot, save_snapshot, snapshot_key
+from group_stats import GroupStatsEngine
+from html_template import Template
+from html_writer import StreamingHtmlWriter
+from ingest import INGEST_VERSION, LoadTimer, iter_sales_csv, read_sales_csv, to_sorted_categorical
+from price_histogram import BinScheme
+from price_index import PriceIndex
+from purchase_scenarios import PurchaseScenarios
+from quantile_sketch import capacity_for_error
+from ranking import ROTATION_FILTERS, RankingEngine, equals, limit_times_sales
+from report_payload import CLIENT_STYLE, ReportPayload
+from stream_summary import StreamSummary
+from title_classifier import TitleClassifier, apply_unique
+from trend_matrix import stats_trend_matrix, trend_matrix
 
 # 設定
 SHIPPING_JPY = 3000
 EXCHANGE_RATE = 155
 FEE_RATE = 0.20
 
-# CSVファイル読み込み
-df = pd.read_csv('/Users/naokijodan/Desktop/髪飾り市場データ_sheet8_2026-02-05.csv')
+# 仕入れ上限のシナリオ（為替レート × 手数料率 × 送料の全組み合わせを試算）
+SCENARIO_EXCHANGE_RATES = [140, 145, 150, 155, 160, 165]
+SCENARIO_FEE_RATES = [0.15, 0.20, 0.25]
+SCENARIO_SHIPPING_JPY = [2000, 3000, 4000]
 
-print(f"=== データ読み込み完了 ===")
-print(f"総件数: {len(df)}")
+# ブートストラップ信頼区間のリサンプル回数
+BOOTSTRAP_RESAMPLES = 500
 
-# 販売数を数値に変換
-df['販売数'] = pd.to_numeric(df['販売数'], errors='coerce').fillna(1).astype(int)
+# 入力CSV
+CSV_PATH = '/Users/naokijodan/Desktop/髪飾り市場データ_sheet8_2026-02-05.csv'
 
-# 売上計算
-df['売上'] = df['価格'] * df['販売数']
+# 出力HTML
+OUTPUT_PATH = '/Users/naokijodan/Desktop/hair-accessory-research/index.html'
 
-# 総販売数・総売上
-total_sales = int(df['販売数'].sum())
-total_revenue = float(df['売上'].sum())
+# 出力形式（'static': 表の行・グラフの配列をHTMLに直接書く / 'data': 重複のない1つのJSONデータを埋め込み、
+# 表・グラフはブラウザで描画する。HTMLが小さくなり、スマートフォンでも読み込みが速い）
+OUTPUT_MODE = 'static'
 
-# 期間
-period_start = df['販売日'].min()
-period_end = df['販売日'].max()
-
-# アイテムタイプ分類
-def extract_item_type(title):
-    title_upper = str(title).upper()
-    if 'TIARA' in title_upper:
-        return 'Tiara'
-    if 'HEADBAND' in title_upper or 'HAIR BAND' in title_upper or 'HAIRBAND' in title_upper:
-        return 'Headband'
-    if 'BARRETTE' in title_upper or 'VALLETTA' in title_upper:
-        return 'Barrette'
-    if 'CLIP' in title_upper or 'HAIRPIN' in title_upper or 'HAIR PIN' in title_upper or 'PIN' in title_upper:
-        return 'Hair Clip'
-    if 'SCRUNCHIE' in title_upper or 'シュシュ' in title_upper:
-        return 'Scrunchie'
-    if 'KANZASHI' in title_upper or 'KUSHI' in title_upper or '簪' in title_upper:
-        return 'Kanzashi'
-    if 'COMB' in title_upper:
-        return 'Comb'
-    if 'RIBBON' in title_upper:
-        return 'Ribbon'
-    return 'Other'
-
-df['アイテムタイプ'] = df['タイトル'].apply(extract_item_type)
+# static モードの表の最大行数（data モードは見えている行だけを描画する仮想スクロールの表なので全件を出力する）
+BRAND_LIST_LIMIT = 50
+POPULAR_ITEMS_LIMIT = 15
+
+# タイトル分類キャッシュ（前回までに分類済みのタイトルは再分類しない）
+CLASSIFICATION_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'title_classification')
+
+# エンリッチ済みDataFrameのスナップショット（同じCSVなら読み込み・分類を省略）
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'snapshots')
+
+# 集計方法（'memory': CSV全体を読み込んで集計 / 'stream': STREAM_CHUNK_ROWS 行ずつ読み込み、集計キューブと
+# 行単位の要約（StreamSummary）だけを残す。RAMに収まらない大きなCSV用で、中央値は QUANTILE_RANK_ERROR の近似、
+# ブートストラップ信頼区間は省略、人気商品は POPULAR_ITEMS_LIMIT 件まで）
+STATS_MODE = 'memory'
+
+# チャンク集計（stream_group_stats）で1回に読み込む行数
+STREAM_CHUNK_ROWS = 100_000
+
+# チャンク集計の中央値・分位点の許容順位誤差（チャンクの数によらず保証される。None なら全値を保持して厳密値）
+QUANTILE_RANK_ERROR = 0.002
+
+# アイテムタイプ分類ルール（上から順に判定し、最初に一致したタイプを採用）
+ITEM_TYPE_RULES = [
+    ('Tiara', ['TIARA']),
+    ('Headband', ['HEADBAND', 'HAIR BAND', 'HAIRBAND']),
+    ('Barrette', ['BARRETTE', 'VALLETTA']),
+    ('Hair Clip', ['CLIP', 'HAIRPIN', 'HAIR PIN', 'PIN']),
+    ('Scrunchie', ['SCRUNCHIE', 'シュシュ']),
+    ('Kanzashi', ['KANZASHI', 'KUSHI', '簪']),
+    ('Comb', ['COMB']),
+    ('Ribbon', ['RIBBON']),
+]
+
+# まとめ売り判定
+BULK_KEYWORDS = ['LOT', 'BULK', 'SET OF', 'BUNDLE', 'X2', 'X3', '2PCS', '3PCS', '4PCS', '5PCS', '6PCS',
+                 'PAIR', 'COLLECTION', '複数', 'まとめ', 'セット', 'SET', 'PCS', 'PACK']
+BULK_PATTERN = r'\d+\s*(?:PCS|PIECES|PACK|点|個|本)'
+
+# ノベルティ判定
+NOVELTY_KEYWORDS = ['NOVELTY', 'GWP', 'LIMITED', 'NOT FOR SALE', '非売品', 'RARE', 'VIP']
+
+# CITES規制リスク判定（セーフキーワードがあればリスクなし）
+CITES_RISK_KEYWORDS = ['TORTOISE', 'BEKKO', 'IVORY', 'べっ甲', '象牙', '鼈甲']
+CITES_SAFE_KEYWORDS = ['RESIN', 'PLASTIC', 'FAUX', 'CELLULOID', '樹脂']
+
+# 箱あり判定
+BOX_KEYWORDS = ['W/BOX', 'WITH BOX', 'BOX']
 
 # ブランドカテゴリ分類
 HIGH_BRANDS = ['CHANEL', 'DIOR', 'LOUIS VUITTON', 'GUCCI', 'HERMES', 'PRADA', 'FENDI', 'CELINE']
@@ -66,22 +107,17 @@ CHARACTER_BRANDS = ['SANRIO', 'Disney', 'Pokemon', 'miffy']
 # 全ブランドリスト（タイトルからの検出用）
 ALL_BRANDS = HIGH_BRANDS + DESIGNER_BRANDS + CHARACTER_BRANDS
 
-# ブランド列が(不明)の場合、タイトルからブランドを検出して補完
-def detect_brand_from_title(row):
-    brand = row['ブランド']
-    title = str(row['タイトル']).upper()
-
-    # ブランド列が(不明)または空の場合、タイトルから検出
-    if pd.isna(brand) or brand == '(不明)':
-        for b in ALL_BRANDS:
-            if b.upper() in title:
-                return b
-    return brand
-
-df['ブランド'] = df.apply(detect_brand_from_title, axis=1)
-
-print(f"=== ブランド補完後 ===")
-print(df['ブランド'].value_counts().head(20).to_string())
+# タイトル分類（アイテムタイプ・まとめ売り・ノベルティ・CITES・箱あり・ブランドを1回の走査で判定）
+title_classifier = TitleClassifier(
+    item_type_rules=ITEM_TYPE_RULES,
+    bulk_keywords=BULK_KEYWORDS,
+    bulk_pattern=BULK_PATTERN,
+    novelty_keywords=NOVELTY_KEYWORDS,
+    cites_risk_keywords=CITES_RISK_KEYWORDS,
+    cites_safe_keywords=CITES_SAFE_KEYWORDS,
+    box_keywords=BOX_KEYWORDS,
+    brands=ALL_BRANDS,
+)
 
 def categorize_brand(brand):
     if pd.isna(brand) or brand == '(不明)':
@@ -98,128 +134,249 @@ def categorize_brand(brand):
             return 'キャラクター'
     return 'その他'
 
-df['ブランドカテゴリ'] = df['ブランド'].apply(categorize_brand)
+# CSV読み込み〜派生列（分類・ブランド補完・仕入れ上限・販売月）の計算
+def build_enriched_df(csv_path):
+    load_timer = LoadTimer()
+    df = read_sales_csv(csv_path)
+
+    print(f"=== データ読み込み完了 ===")
+    print(f"総件数: {len(df)}")
+    load_timer.report('CSV読み込み')
+    return enrich_sales_df(df, ClassificationCache(CLASSIFICATION_CACHE_DIR))
+
+# 読み込んだDataFrame（またはチャンク）に派生列を追加する（verbose=False なら途中経過を表示しない）
+# classification_cache は実行ごとに1つ作って渡す（チャンクごとにキャッシュを読み直さない）
+def enrich_sales_df(df, classification_cache, verbose=True):
+    log = print if verbose else (lambda *args: None)
+
+    # 販売数を数値に変換
+    df['販売数'] = pd.to_numeric(df['販売数'], errors='coerce').fillna(1).astype(int)
+
+    # 売上計算
+    df['売上'] = df['価格'] * df['販売数']
+
+    title_flags = title_classifier.classify(df['タイトル'], cache=classification_cache)
+    log(f"=== タイトル分類: {title_classifier.last_row_count}件中ユニーク{title_classifier.last_unique_count}件 "
+        f"(重複率 {title_classifier.duplicate_ratio:.1%}) ===")
+    log(f"=== 分類キャッシュ: ヒット{classification_cache.last_hit_count}件 / 新規分類{classification_cache.last_miss_count}件 ===")
+    title_brands = title_flags.pop('タイトルブランド')
+    for col in title_flags.columns:
+        df[col] = title_flags[col]
+
+    # ブランド列が(不明)または空の行だけ、タイトルから検出したブランドで補完
+    unknown_brand = df['ブランド'].isna() | (df['ブランド'] == '(不明)')
+    brand_fill = unknown_brand & title_brands.notna()
+    df['ブランド'] = to_sorted_categorical(df['ブランド'], extra_values=title_brands[brand_fill].unique())
+    df.loc[brand_fill, 'ブランド'] = title_brands[brand_fill]
+
+    # ブランドごとの補完件数（ALL_BRANDSの並び順）
+    brand_fill_counts = title_brands[brand_fill].value_counts().reindex(ALL_BRANDS).dropna().astype(int)
+    log(f"=== タイトルからのブランド補完: {int(brand_fill.sum())}件 / 不明{int(unknown_brand.sum())}件 ===")
+    for b, count in brand_fill_counts.items():
+        log(f"  - {b}: {count}件")
+
+    log(f"=== ブランド補完後 ===")
+    log(df['ブランド'].value_counts().head(20).to_string())
+
+    df['ブランドカテゴリ'] = apply_unique(df['ブランド'], categorize_brand)
+
+    # 仕入れ上限計算
+    df['仕入れ上限'] = df['価格'] * EXCHANGE_RATE * (1 - FEE_RATE) - SHIPPING_JPY
+
+    # 販売月
+    df['販売月'] = df['販売日'].dt.to_period('M').astype(str)
+
+    # ラベル列はカテゴリ型で保持（メモリ削減・比較とgroupbyの高速化）
+    for col in ['アイテムタイプ', 'ブランドカテゴリ', '販売月']:
+        df[col] = to_sorted_categorical(df[col])
+    return df
+
+# CSVをチャンク単位で読み込み・エンリッチして集計キューブに畳み込み、グループ別統計エンジンを返す
+# 同時にメモリに載るのは1チャンク分だけなので、RAMに収まらない大きなCSVにも使える
+# summary（StreamSummary）を渡すと、キューブに入らない行単位の情報も同じ走査で畳み込む
+def stream_group_stats(csv_path, summary=None, chunk_rows=STREAM_CHUNK_ROWS, rank_error=QUANTILE_RANK_ERROR):
+    cube = AggregateCube(sketch_capacity=capacity_for_error(rank_error))
+    # 新規分類はメモリに溜め、最後に1回だけ書き出す
+    classification_cache = ClassificationCache(CLASSIFICATION_CACHE_DIR, autosave=False)
+    for chunk in iter_sales_csv(csv_path, chunk_rows):
+        chunk = enrich_sales_df(chunk, classification_cache, verbose=False)
+        cube.fold(chunk)
+        if summary is not None:
+            summary.fold(chunk)
+    classification_cache.flush()
+    return GroupStatsEngine(cube)
 
-# まとめ売り判定
-def is_bulk(title):
-    bulk_keywords = ['LOT', 'BULK', 'SET OF', 'BUNDLE', 'X2', 'X3', '2PCS', '3PCS', '4PCS', '5PCS', '6PCS',
-                     'PAIR', 'COLLECTION', '複数', 'まとめ', 'セット', 'SET', 'PCS', 'PACK']
-    title_upper = str(title).upper()
-    for kw in bulk_keywords:
-        if kw in title_upper:
-            return True
-    if re.search(r'\d+\s*(PCS|PIECES|PACK|点|個|本)', title_upper):
-        return True
-    return False
-
-df['まとめ売り'] = df['タイトル'].apply(is_bulk)
+# 価格帯分布（50ドル刻み）
+PRICE_BINS_50 = BinScheme(list(range(0, 1001, 50)) + [float('inf')],
+                          [f'${i}-{i+49}' for i in range(0, 1000, 50)] + ['$1000+'])
 
-# ノベルティ判定
-def is_novelty(title):
-    novelty_keywords = ['NOVELTY', 'GWP', 'LIMITED', 'NOT FOR SALE', '非売品', 'RARE', 'VIP']
-    title_upper = str(title).upper()
-    for kw in novelty_keywords:
-        if kw in title_upper:
-            return True
-    return False
-
-df['ノベルティ'] = df['タイトル'].apply(is_novelty)
-
-# CITES規制リスク判定
-def is_cites_risk(title):
-    risk_keywords = ['TORTOISE', 'BEKKO', 'IVORY', 'べっ甲', '象牙', '鼈甲']
-    safe_keywords = ['RESIN', 'PLASTIC', 'FAUX', 'CELLULOID', '樹脂']
-    title_upper = str(title).upper()
-    for kw in safe_keywords:
-        if kw in title_upper:
-            return False
-    for kw in risk_keywords:
-        if kw in title_upper:
-            return True
-    return False
-
-df['CITES_RISK'] = df['タイトル'].apply(is_cites_risk)
+# 個別タブを作るブランド（売上順。ブランド名, タブID, アクセントのCSSクラス）
+brand_tabs = [
+    ('CHANEL', 'CHANEL', 'chanel-accent'),
+    ('LOUIS VUITTON', 'LOUIS_VUITTON', 'lv-accent'),
+    ('Vivienne Westwood', 'Vivienne_Westwood', 'vw-accent'),
+    ('GUCCI', 'GUCCI', 'gucci-accent'),
+    ('PRADA', 'PRADA', 'prada-accent'),
+    ('HERMES', 'HERMES', 'hermes-accent'),
+    ('Salvatore Ferragamo', 'Salvatore_Ferragamo', 'ferragamo-accent'),
+    ('DIOR', 'DIOR', 'dior-accent'),
+    ('CELINE', 'CELINE', 'celine-accent'),
+    ('FENDI', 'FENDI', 'fendi-accent'),
+    ('Alexandre de Paris', 'Alexandre_de_Paris', 'adp-accent'),
+]
+POPULAR_ITEM_FIELDS = ['タイトル', '価格', '販売数', '仕入れ上限']
+
+# 同じCSV・同じ設定ならスナップショットから読み込む（表示だけ調整して再生成する場合に高速）
+snapshot_id = snapshot_key(CSV_PATH, {
+    'rules_version': title_classifier.rules_version,
+    'brand_categories': [HIGH_BRANDS, DESIGNER_BRANDS, CHARACTER_BRANDS],
+    'exchange_rate': EXCHANGE_RATE,
+    'fee_rate': FEE_RATE,
+    'shipping_jpy': SHIPPING_JPY,
+    'ingest': INGEST_VERSION,
+})
+load_timer = LoadTimer()
+if STATS_MODE == 'stream':
+    # チャンク集計（DataFrame全体は作らない。行単位の表・グラフは stream_summary から作る）
+    df = None
+    stream_summary = StreamSummary(PRICE_BINS_50, 'ブランド', [brand for brand, _, _ in brand_tabs],
+                                   top_rows=POPULAR_ITEMS_LIMIT, top_fields=POPULAR_ITEM_FIELDS)
+    stats_engine = stream_group_stats(CSV_PATH, stream_summary)
+    row_count = stream_summary.row_count
+    print(f"=== チャンク集計完了 ===")
+    print(f"総件数: {row_count}")
+    load_timer.report('チャンク集計')
+else:
+    df = load_snapshot(SNAPSHOT_DIR, snapshot_id)
+    if df is not None:
+        print(f"=== スナップショット読み込み完了 ===")
+        print(f"総件数: {len(df)}")
+        load_timer.report('スナップショット読み込み')
+    else:
+        df = build_enriched_df(CSV_PATH)
+        save_snapshot(SNAPSHOT_DIR, snapshot_id, df)
+    row_count = len(df)
 
-# 箱あり判定
-def has_box(title):
-    title_upper = str(title).upper()
-    return 'W/BOX' in title_upper or 'WITH BOX' in title_upper or 'BOX' in title_upper
-
-df['箱あり'] = df['タイトル'].apply(has_box)
-
-# 仕入れ上限計算
-df['仕入れ上限'] = df['価格'] * EXCHANGE_RATE * (1 - FEE_RATE) - SHIPPING_JPY
-
-# ブランド別統計
-def get_brand_stats(brand_df):
-    if len(brand_df) == 0:
-        return {}
-    sales = int(brand_df['販売数'].sum())
-    prices = brand_df['価格']
-    return {
-        'count': len(brand_df),
-        'sales': sales,
-        'revenue': float(brand_df['売上'].sum()),
-        'avg_price': float(prices.mean()),
-        'median_price': float(prices.median()),
-        'min_price': float(prices.min()),
-        'max_price': float(prices.max()),
-        'cv': float(prices.std() / prices.mean()) if prices.mean() > 0 else 0,
-        'purchase_limit': float(brand_df['仕入れ上限'].median())
-    }
+    # グループ別統計（ブランド×アイテムタイプ×カテゴリ×月×フラグの集計キューブを1回だけ作り、
+    # 各表・グラフはそのロールアップで求める）
+    stats_engine = GroupStatsEngine(df)
+
+    # ブランド別の価格インデックス（分位点・価格帯の件数・価格分布を絞り込みや再走査なしで求める）
+    brand_price_index = PriceIndex.from_frame(df, 'ブランド')
+
+    # フラグのビットマップとブランド・アイテムタイプの行番号のインデックス（条件に合う行を df の比較なしで引く）
+    row_index = BitmapIndex.from_frame(df)
+print(f"=== 集計キューブ: {stats_engine.cube.cell_count}セル（分位点スケッチ {stats_engine.cube.sketch_points:,}点） ===")
+
+# 総販売数・総売上
+overall_stats = stats_engine.total()
+total_sales = overall_stats['sales']
+total_revenue = overall_stats['revenue']
+
+# 期間
+first_date, last_date = ((stream_summary.first_date, stream_summary.last_date) if df is None
+                         else (df['販売日'].min(), df['販売日'].max()))
+period_start = first_date.strftime('%Y-%m-%d')
+period_end = last_date.strftime('%Y-%m-%d')
+
+# フラグが立っている行数（brand を指定するとそのブランド内）
+def flag_count(flag, brand=None):
+    counts = stats_engine.by(flag) if brand is None else stats_engine.within(['ブランド', flag], brand)
+    return counts.get(True, {}).get('count', 0)
 
 # トップブランドリスト（販売数順）
-brand_sales = df.groupby('ブランド')['販売数'].sum().sort_values(ascending=False)
+brand_sales = pd.Series({b: s['sales'] for b, s in stats_engine.by('ブランド', sort=True).items()},
+                        dtype='int64').sort_values(ascending=False)
 top_brands = [b for b in brand_sales.head(10).index if b != '(不明)']
 
 print(f"\n=== トップ10ブランド ===")
 for b in top_brands:
     print(f"  - {b}")
 
-# ノベルティプレミアム計算（JDMプレミアムに相当）
-def calc_novelty_premium(brand_df):
-    novelty = brand_df[brand_df['ノベルティ'] == True]
-    regular = brand_df[brand_df['ノベルティ'] == False]
-    if len(novelty) < 2 or len(regular) < 2:
-        return 0.0
-    novelty_median = novelty['価格'].median()
-    regular_median = regular['価格'].median()
-    if regular_median > 0:
-        return float((novelty_median - regular_median) / regular_median * 100)
-    return 0.0
-
-# 箱ありプレミアム計算
-def calc_box_premium(brand_df):
-    with_box = brand_df[brand_df['箱あり'] == True]
-    without_box = brand_df[brand_df['箱あり'] == False]
-    if len(with_box) < 2 or len(without_box) < 2:
-        return 0.0
-    box_median = with_box['価格'].median()
-    no_box_median = without_box['価格'].median()
-    if no_box_median > 0:
-        return float((box_median - no_box_median) / no_box_median * 100)
-    return 0.0
-
-# 安定度評価
-def get_stability(cv):
+# ノベルティ・箱ありプレミアム（JDMプレミアムに相当。全ブランド・全ブランド×アイテムタイプを1回の groupby で計算。
+# チャンク集計ではキューブのロールアップの件数・中央値から求める）
+def premiums(flag, by='ブランド'):
+    if df is None:
+        keys = [by, flag] if isinstance(by, str) else list(by) + [flag]
+        return grouped_flag_premiums(stats_engine.by(keys))
+    return flag_premiums(df, flag, by=by)
+
+novelty_premiums = premiums('ノベルティ')
+box_premiums = premiums('箱あり')
+type_novelty_premiums = premiums('ノベルティ', by=['ブランド', 'アイテムタイプ'])
+type_box_premiums = premiums('箱あり', by=['ブランド', 'アイテムタイプ'])
+
+# ブランド×アイテムタイプ別の中央値・CVの信頼区間（件数が少ない・区間が広いグループは unstable。
+# 全商品の表には全行の区間、おすすめ順序タブには単品のみ（まとめ売り・CITESリスク品を除外）の区間を使う。
+# リサンプリングに全行の価格が必要なため、チャンク集計では省略）
+if df is None:
+    brand_type_intervals = {}
+    safe_brand_type_intervals = {}
+    print(f"=== ブートストラップ信頼区間: チャンク集計のため省略 ===")
+else:
+    brand_type_intervals = bootstrap_intervals(df, ['ブランド', 'アイテムタイプ'], resamples=BOOTSTRAP_RESAMPLES)
+    safe_rows = row_index.rows(row_index.match({'まとめ売り': False, 'CITES_RISK': False}))
+    safe_brand_type_intervals = bootstrap_intervals(df.take(safe_rows), ['ブランド', 'アイテムタイプ'],
+                                                    resamples=BOOTSTRAP_RESAMPLES)
+    unstable_count = sum(interval['unstable'] for interval in brand_type_intervals.values())
+    print(f"=== ブートストラップ信頼区間: {len(brand_type_intervals):,}グループ（不安定 {unstable_count:,}） ===")
+
+# ブランド×アイテムタイプの統計に信頼区間の表示を追加する（unstable・median_ci。intervals は stats と同じ行から
+# 求めた区間。チャンク集計では信頼区間がないため、件数が MIN_STABLE_COUNT 未満なら不安定とする）
+def with_interval(stats, brand, item_type, intervals=None):
+    interval = (brand_type_intervals if intervals is None else intervals).get((brand, item_type))
+    if interval is None:
+        unstable = stats['count'] < MIN_STABLE_COUNT
+        median_ci = '―'
+    else:
+        unstable = interval['unstable']
+        median_ci = f"${interval['median_ci_low']:.2f}〜${interval['median_ci_high']:.2f}"
+    if unstable:
+        median_ci += ' ⚠️不安定'
+    return dict(stats, **{**(interval or {}), 'unstable': unstable, 'median_ci': median_ci})
+
+# 安定度評価（unstable なら星を1つ減らす）
+STABILITY_STARS = ['☆☆☆', '★☆☆', '★★☆', '★★★']
+
+def get_stability(cv, unstable=False):
     if cv <= 0.3:
-        return '★★★'
+        level = 3
     elif cv <= 0.5:
-        return '★★☆'
+        level = 2
     elif cv <= 0.7:
-        return '★☆☆'
+        level = 1
     else:
-        return '☆☆☆'
+        level = 0
+    return STABILITY_STARS[max(level - unstable, 0)]
 
-# 価格帯分布（50ドル刻み）
 def get_price_distribution_50(prices):
-    bins = list(range(0, 1001, 50)) + [float('inf')]
-    labels = [f'${i}-{i+49}' for i in range(0, 1000, 50)] + ['$1000+']
-    distribution = pd.cut(prices, bins=bins, labels=labels).value_counts().sort_index()
-    return {str(k): int(v) for k, v in distribution.items()}
-
-# HTML生成開始
-html_parts = []
+    return PRICE_BINS_50.counts(prices)
+
+# HTML生成開始（生成したセクションから順に一時ファイルへ書き出し、最後に出力先へ置き換える）
+html_out = StreamingHtmlWriter(OUTPUT_PATH)
+report_payload = ReportPayload()
+
+def table_rows(key, template, rows, **common):
+    """表の行（data モードでは埋め込みデータに追加し、tbody にはプレースホルダだけを置く）"""
+    if OUTPUT_MODE == 'data':
+        return report_payload.table(key, template, rows, **common)
+    return template.render_rows(rows, **common)
+
+def sortable_table_rows(key, template, rows, columns, **common):
+    """並べ替え・絞り込みできる表の行（data モードのみ。columns は見出しの列ごとに使う値の名前）"""
+    if OUTPUT_MODE == 'data':
+        return report_payload.virtual_table(key, template, rows, columns, **common)
+    return template.render_rows(rows, **common)
+
+def row_limit(limit, total):
+    """表に出す行数（static モードは limit 件まで、data モードは全件）"""
+    return min(limit, total) if OUTPUT_MODE == 'static' else total
+
+def chart_series(values):
+    """グラフ用の配列のJS式（data モードでは埋め込みデータの配列を参照する）"""
+    if OUTPUT_MODE == 'data':
+        return f'reportSeries({report_payload.add_series(values)})'
+    return json.dumps(values)
 
 # CSSスタイル
 css = '''
@@ -541,9 +698,11 @@ tr:hover { background: rgba(233, 30, 99, 0.05); }
 }
 .adp-accent { color: #8B0000; font-weight: bold; }
 '''
+if OUTPUT_MODE == 'data':
+    css += CLIENT_STYLE
 
 # HTML開始
-html_parts.append(f'''<!DOCTYPE html>
+html_out.write(f'''<!DOCTYPE html>
 <html lang="ja">
 <head>
     <meta charset="UTF-8">
@@ -560,7 +719,7 @@ html_parts.append(f'''<!DOCTYPE html>
             <button onclick="toggleTheme()" id="themeBtn">🌙 ダークモード</button>
         </div>
         <h1>🎀 髪飾り市場分析（完全版）</h1>
-        <p>データ期間: {period_start} ~ {period_end} | 生成: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} | 総件数: {len(df)}件</p>
+        <p>データ期間: {period_start} ~ {period_end} | 生成: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} | 総件数: {row_count}件</p>
     </div>
 
     <div class="controls">
@@ -607,29 +766,26 @@ html_parts.append(f'''<!DOCTYPE html>
 ''')
 
 # 全体分析タブ
-overall_stats = get_brand_stats(df)
-cites_count = int(df['CITES_RISK'].sum())
+cites_count = flag_count('CITES_RISK')
 
 # アイテムタイプ別統計
 item_type_stats = {}
-for item_type in df['アイテムタイプ'].unique():
-    type_df = df[df['アイテムタイプ'] == item_type]
+for item_type, stats in stats_engine.by('アイテムタイプ').items():
     item_type_stats[item_type] = {
-        'sales': int(type_df['販売数'].sum()),
-        'revenue': float(type_df['売上'].sum()),
-        'median': float(type_df['価格'].median())
+        'sales': stats['sales'],
+        'revenue': stats['revenue'],
+        'median': stats['median_price']
     }
 
 # ブランドカテゴリ別統計
 brand_cat_stats = {}
-for cat in df['ブランドカテゴリ'].unique():
-    cat_df = df[df['ブランドカテゴリ'] == cat]
+for cat, stats in stats_engine.by('ブランドカテゴリ').items():
     brand_cat_stats[cat] = {
-        'sales': int(cat_df['販売数'].sum()),
-        'revenue': float(cat_df['売上'].sum())
+        'sales': stats['sales'],
+        'revenue': stats['revenue']
     }
 
-html_parts.append(f'''
+html_out.write(f'''
     <!-- 全体分析タブ -->
     <div id="overview" class="tab-content active">
         <div class="stats-grid">
@@ -661,14 +817,14 @@ html_parts.append(f'''
                 <li>🔝 最大カテゴリ: ハイブランド ({brand_cat_stats.get("ハイブランド", {}).get("sales", 0):,}件) とノーブランド ({brand_cat_stats.get("ノーブランド", {}).get("sales", 0):,}件) で市場の大半を占める</li>
                 <li>💎 高価格帯: Vivienne Westwood Tiara ($211中央値) が市場を牽引</li>
                 <li>⚡ 回転率重視: Headband・Hair Clipは低価格で回転が早い（エントリー層向け）</li>
-                <li>🎁 ノベルティ市場: {int(df['ノベルティ'].sum())}件の取引あり（CHANELが最多）</li>
+                <li>🎁 ノベルティ市場: {flag_count('ノベルティ')}件の取引あり（CHANELが最多）</li>
             </ul>
         </div>
 ''')
 
 # CITESリスク警告
 if cites_count > 0:
-    html_parts.append(f'''
+    html_out.write(f'''
         <div class="cites-warning">
             <h3>⚠️ CITES規制リスク品検出（{cites_count}件）</h3>
             <p>べっ甲・象牙などのワシントン条約規制対象の可能性がある商品が検出されました。輸出入には許可証が必要です。</p>
@@ -684,15 +840,13 @@ brand_cat_sales = [brand_cat_stats[k]['sales'] for k in brand_cat_labels]
 
 # ブランド別Top20
 brand_stats_list = []
-for brand in df['ブランド'].unique():
-    brand_df = df[df['ブランド'] == brand]
-    stats = get_brand_stats(brand_df)
-    stats['brand'] = brand
-    brand_stats_list.append(stats)
+for brand, stats in stats_engine.by('ブランド').items():
+    brand_stats_list.append(dict(stats, brand=brand, novelty_premium=novelty_premiums.get(brand, 0.0),
+                                 box_premium=box_premiums.get(brand, 0.0)))
 brand_stats_list.sort(key=lambda x: x['sales'], reverse=True)
 top20_brands = brand_stats_list[:20]
 
-html_parts.append(f'''
+html_out.write(f'''
         <h2 class="section-title">📊 カテゴリ別分析</h2>
         <div class="chart-grid">
             <div class="chart-container"><div id="itemTypeBarChart"></div></div>
@@ -731,37 +885,40 @@ html_parts.append(f'''
                 <tbody>
 ''')
 
-for idx, stats in enumerate(top20_brands):
-    brand = stats['brand']
-    brand_display = '不明' if brand == '(不明)' else brand
-    brand_id = brand.replace(' ', '_').replace('(', '').replace(')', '')
-    median_jpy = int(stats['median_price'] * EXCHANGE_RATE)
-    purchase_limit = int(stats['purchase_limit'])
-    stability = get_stability(stats['cv'])
-    ebay_url = f"https://www.ebay.com/sch/i.html?_nkw={brand.replace(' ', '+')}+Hair+Accessory&LH_Sold=1"
-    mercari_url = f"https://jp.mercari.com/search?keyword={brand}%20髪飾り&status=on_sale"
-
-    html_parts.append(f'''
+TOP20_ROW = Template('''
                     <tr>
                         <td><strong>{brand_display}</strong></td>
-                        <td>{stats["sales"]}</td>
-                        <td>${stats["min_price"]:.2f}</td>
-                        <td>${stats["max_price"]:.2f}</td>
-                        <td>${stats["median_price"]:.2f}</td>
+                        <td>{sales}</td>
+                        <td>${min_price:.2f}</td>
+                        <td>${max_price:.2f}</td>
+                        <td>${median_price:.2f}</td>
                         <td>¥{median_jpy:,}</td>
-                        <td class="highlight">¥{purchase_limit:,}</td>
-                        <td>{stats["cv"]:.3f}</td>
+                        <td class="highlight">¥{purchase_limit_jpy:,}</td>
+                        <td>{cv:.3f}</td>
                         <td>{stability}</td>
                         <td>
-                            <a href="{ebay_url}" target="_blank" class="link-btn link-ebay">eBay</a>
-                            <input type="checkbox" class="search-checkbox" data-id="brand_{brand_id}_ebay">
-                            <a href="{mercari_url}" target="_blank" class="link-btn link-mercari">メルカリ</a>
-                            <input type="checkbox" class="search-checkbox" data-id="brand_{brand_id}_mercari">
+                            <a href="https://www.ebay.com/sch/i.html?_nkw={ebay_query!a}+Hair+Accessory&LH_Sold=1" target="_blank" class="link-btn link-ebay">eBay</a>
+                            <input type="checkbox" class="search-checkbox" data-id="brand_{brand_id!a}_ebay">
+                            <a href="https://jp.mercari.com/search?keyword={brand!a}%20髪飾り&status=on_sale" target="_blank" class="link-btn link-mercari">メルカリ</a>
+                            <input type="checkbox" class="search-checkbox" data-id="brand_{brand_id!a}_mercari">
                         </td>
                     </tr>
 ''')
 
-html_parts.append('''
+def brand_row_values(stats):
+    """ブランド行の表示用の値（ブランド名・ID・検索語・日本円換算・安定度）"""
+    brand = stats['brand']
+    return dict(stats,
+                brand_display='不明' if brand == '(不明)' else brand,
+                brand_id=brand.replace(' ', '_').replace('(', '').replace(')', ''),
+                ebay_query=brand.replace(' ', '+'),
+                median_jpy=int(stats['median_price'] * EXCHANGE_RATE),
+                purchase_limit_jpy=int(stats['purchase_limit']),
+                stability=get_stability(stats['cv'], stats.get('unstable', False)))
+
+html_out.write(table_rows('top20', TOP20_ROW, [brand_row_values(stats) for stats in top20_brands]))
+
+html_out.write('''
                 </tbody>
             </table>
         </div>
@@ -769,7 +926,7 @@ html_parts.append('''
 ''')
 
 # ブランド一覧タブ
-html_parts.append('''
+html_out.write('''
     <!-- ブランド一覧タブ -->
     <div id="brands" class="tab-content">
         <h2 class="section-title">🏷️ ブランド一覧</h2>
@@ -785,97 +942,78 @@ html_parts.append('''
                         <th>仕入上限</th>
                         <th>CV値</th>
                         <th>安定度</th>
+                        <th>ノベルティ</th>
+                        <th>箱あり</th>
                     </tr>
                 </thead>
                 <tbody>
 ''')
 
-for stats in brand_stats_list[:50]:
-    brand = stats['brand']
-    brand_display = '不明' if brand == '(不明)' else brand
-    brand_df = df[df['ブランド'] == brand]
-    category = brand_df['ブランドカテゴリ'].iloc[0] if len(brand_df) > 0 else '不明'
-    stability = get_stability(stats['cv'])
+# ブランド → ブランドカテゴリ（カテゴリはブランド名だけで決まる）
+brand_category_map = {brand: cat for brand, cat in stats_engine.by(['ブランド', 'ブランドカテゴリ'])}
 
-    html_parts.append(f'''
+BRAND_LIST_ROW = Template('''
                     <tr>
                         <td><strong>{brand_display}</strong></td>
                         <td>{category}</td>
-                        <td>{stats["sales"]}</td>
-                        <td>${stats["revenue"]:,.2f}</td>
-                        <td>${stats["median_price"]:.2f}</td>
-                        <td>¥{int(stats["purchase_limit"]):,}</td>
-                        <td>{stats["cv"]:.3f}</td>
+                        <td>{sales}</td>
+                        <td>${revenue:,.2f}</td>
+                        <td>${median_price:.2f}</td>
+                        <td>¥{purchase_limit_jpy:,}</td>
+                        <td>{cv:.3f}</td>
                         <td>{stability}</td>
+                        <td>{novelty_premium:+.1f}%</td>
+                        <td>{box_premium:+.1f}%</td>
                     </tr>
 ''')
 
-html_parts.append('''
+html_out.write(sortable_table_rows('brands', BRAND_LIST_ROW, [
+    dict(brand_row_values(stats), category=brand_category_map.get(stats['brand'], '不明'))
+    for stats in brand_stats_list[:row_limit(BRAND_LIST_LIMIT, len(brand_stats_list))]
+], ['brand_display', 'category', 'sales', 'revenue', 'median_price', 'purchase_limit_jpy', 'cv', 'stability',
+    'novelty_premium', 'box_premium']))
+
+html_out.write('''
                 </tbody>
             </table>
         </div>
     </div>
 ''')
 
-# 個別ブランドタブ生成関数
-def generate_brand_tab(brand_name, tab_id, accent_class):
-    brand_df = df[df['ブランド'] == brand_name]
-    if len(brand_df) == 0:
-        return ''
-
-    stats = get_brand_stats(brand_df)
-    novelty_premium = calc_novelty_premium(brand_df)
-    box_premium = calc_box_premium(brand_df)
-    novelty_count = int(brand_df['ノベルティ'].sum())
-    bulk_count = int(brand_df['まとめ売り'].sum())
-
-    # アイテムタイプ別統計
-    item_stats = []
-    for item_type in brand_df['アイテムタイプ'].unique():
-        type_df = brand_df[brand_df['アイテムタイプ'] == item_type]
-        if len(type_df) > 0:
-            type_stats = get_brand_stats(type_df)
-            type_stats['type'] = item_type
-            item_stats.append(type_stats)
-    item_stats.sort(key=lambda x: x['sales'], reverse=True)
-
-    # 人気商品Top15
-    popular_items = brand_df.nlargest(15, '販売数')[['タイトル', '価格', '販売数', '仕入れ上限']].to_dict('records')
-
-    tab_html = f'''
+BRAND_TAB_HEAD = Template('''
     <!-- {brand_name}タブ -->
-    <div id="{tab_id}" class="tab-content">
-        <h2 class="section-title {accent_class}">📊 {brand_name} 詳細分析</h2>
+    <div id="{tab_id!a}" class="tab-content">
+        <h2 class="section-title {accent_class!a}">📊 {brand_name} 詳細分析</h2>
 
         <div class="stats-grid">
             <div class="stat-card">
                 <div class="label">総販売数</div>
-                <div class="value">{stats["sales"]:,}</div>
+                <div class="value">{sales:,}</div>
             </div>
             <div class="stat-card">
                 <div class="label">中央値</div>
-                <div class="value">${stats["median_price"]:.2f}</div>
+                <div class="value">${median_price:.2f}</div>
             </div>
             <div class="stat-card">
                 <div class="label">CV（変動係数）</div>
-                <div class="value">{stats["cv"]:.3f}</div>
+                <div class="value">{cv:.3f}</div>
             </div>
             <div class="stat-card">
                 <div class="label">ノベルティプレミアム</div>
-                <div class="value {accent_class}">{novelty_premium:+.1f}%</div>
+                <div class="value {accent_class!a}">{novelty_premium:+.1f}%</div>
             </div>
         </div>
 
         <div class="insight-box" style="border-left: 5px solid #ff6b35;">
-            <h3 class="{accent_class}">🎯 仕入れ戦略（実践ガイド）</h3>
+            <h3 class="{accent_class!a}">🎯 仕入れ戦略（実践ガイド）</h3>
             <div style="display: grid; gap: 15px;">
                 <div style="background: #e3f2fd; padding: 15px; border-radius: 8px; border-left: 4px solid #1976d2;">
                     <h4 style="color: #1976d2; margin-bottom: 10px;">✅ 狙い目条件</h4>
                     <ul style="margin-left: 20px;">
-                        <li><strong class="{accent_class}">箱・保証書付き</strong>（<span class="{accent_class}">{box_premium:+.1f}%</span>プレミアム）</li>
+                        <li><strong class="{accent_class!a}">箱・保証書付き</strong>（<span class="{accent_class!a}">{box_premium:+.1f}%</span>プレミアム）</li>
                         <li>型番・モデル名が<strong>明確に記載</strong>されている商品</li>
-                        <li><strong class="{accent_class}">ノベルティ・限定品</strong>（<span class="{accent_class}">{novelty_premium:+.1f}%</span>プレミアム）</li>
-                        <li>人気アイテムタイプ：<strong>{", ".join([s["type"] for s in item_stats[:3]])}</strong></li>
+                        <li><strong class="{accent_class!a}">ノベルティ・限定品</strong>（<span class="{accent_class!a}">{novelty_premium:+.1f}%</span>プレミアム）</li>
+                        <li>人気アイテムタイプ：<strong>{top_types}</strong></li>
                     </ul>
                 </div>
                 <div style="background: #fff3e0; padding: 15px; border-radius: 8px; border-left: 4px solid #ff6b35;">
@@ -888,79 +1026,76 @@ def generate_brand_tab(brand_name, tab_id, accent_class):
                 </div>
                 <div style="background: #f3e5f5; padding: 15px; border-radius: 8px; border-left: 4px solid #7b1fa2;">
                     <h4 style="color: #7b1fa2; margin-bottom: 10px;">💰 仕入れ価格目安</h4>
-                    <p style="margin: 0;"><strong>通常商品:</strong> ¥{int(stats["purchase_limit"]):,}以下</p>
-                    <p style="margin: 5px 0 0 0;"><strong class="{accent_class}">箱付き・美品:</strong> ${stats["median_price"]:.0f}前後が上限（中央値基準）</p>
+                    <p style="margin: 0;"><strong>通常商品:</strong> ¥{purchase_limit_jpy:,}以下</p>
+                    <p style="margin: 5px 0 0 0;"><strong class="{accent_class!a}">箱付き・美品:</strong> ${median_price:.0f}前後が上限（中央値基準）</p>
                 </div>
             </div>
         </div>
 
-        <h3 class="section-title {accent_class}">📊 市場分析グラフ</h3>
+        <h3 class="section-title {accent_class!a}">📊 市場分析グラフ</h3>
         <div class="brand-grid">
             <div class="brand-chart-container">
-                <h4 class="{accent_class}">価格帯別分析（50ドル刻み）</h4>
-                <div id="{tab_id}_price_chart" style="height: 350px;"></div>
+                <h4 class="{accent_class!a}">価格帯別分析（50ドル刻み）</h4>
+                <div id="{tab_id!a}_price_chart" style="height: 350px;"></div>
             </div>
             <div class="brand-chart-container">
-                <h4 class="{accent_class}">アイテムタイプ別分布</h4>
-                <div id="{tab_id}_item_chart" style="height: 350px;"></div>
+                <h4 class="{accent_class!a}">アイテムタイプ別分布</h4>
+                <div id="{tab_id!a}_item_chart" style="height: 350px;"></div>
             </div>
         </div>
 
-        <h3 class="section-title {accent_class}">🎀 アイテムタイプ別詳細分析</h3>
+        <h3 class="section-title {accent_class!a}">🎀 アイテムタイプ別詳細分析</h3>
         <div class="table-container">
             <table>
                 <thead>
                     <tr>
                         <th>アイテムタイプ</th>
                         <th>販売数</th>
-                        <th class="{accent_class}">比率</th>
+                        <th class="{accent_class!a}">比率</th>
                         <th>中央値</th>
-                        <th class="{accent_class}">仕入上限(¥)</th>
+                        <th>中央値の95%信頼区間</th>
+                        <th class="{accent_class!a}">仕入上限(¥)</th>
                         <th>CV値</th>
                         <th>安定度</th>
+                        <th>ノベルティ</th>
+                        <th>箱あり</th>
                         <th>検索</th>
                     </tr>
                 </thead>
                 <tbody>
-'''
+''')
 
-    total_brand_sales = stats['sales']
-    for type_stats in item_stats:
-        ratio = type_stats['sales'] / total_brand_sales * 100 if total_brand_sales > 0 else 0
-        stability = get_stability(type_stats['cv'])
-        type_id = type_stats['type'].replace(' ', '_')
-        brand_id = brand_name.replace(' ', '_')
-        ebay_url = f"https://www.ebay.com/sch/i.html?_nkw={brand_name.replace(' ', '+')}+{type_stats['type'].replace(' ', '+')}+Hair+Accessory&LH_Sold=1"
-        mercari_url = f"https://jp.mercari.com/search?keyword={brand_name}%20{type_stats['type']}%20髪飾り&status=on_sale"
-
-        tab_html += f'''
+BRAND_TYPE_ROW = Template('''
                     <tr>
-                        <td><strong>{type_stats["type"]}</strong></td>
-                        <td>{type_stats["sales"]}</td>
-                        <td class="{accent_class}">{ratio:.1f}%</td>
-                        <td>${type_stats["median_price"]:.2f}</td>
-                        <td class="highlight {accent_class}">¥{int(type_stats["purchase_limit"]):,}</td>
-                        <td>{type_stats["cv"]:.3f}</td>
+                        <td><strong>{type}</strong></td>
+                        <td>{sales}</td>
+                        <td class="{accent_class!a}">{ratio:.1f}%</td>
+                        <td>${median_price:.2f}</td>
+                        <td>{median_ci}</td>
+                        <td class="highlight {accent_class!a}">¥{purchase_limit_jpy:,}</td>
+                        <td>{cv:.3f}</td>
                         <td>{stability}</td>
+                        <td>{novelty_premium:+.1f}%</td>
+                        <td>{box_premium:+.1f}%</td>
                         <td>
-                            <a href="{ebay_url}" target="_blank" class="link-btn link-ebay">eBay</a>
-                            <input type="checkbox" class="search-checkbox" data-id="{brand_id}_{type_id}_ebay">
-                            <a href="{mercari_url}" target="_blank" class="link-btn link-mercari">メルカリ</a>
-                            <input type="checkbox" class="search-checkbox" data-id="{brand_id}_{type_id}_mercari">
+                            <a href="https://www.ebay.com/sch/i.html?_nkw={brand_query!a}+{type_query!a}+Hair+Accessory&LH_Sold=1" target="_blank" class="link-btn link-ebay">eBay</a>
+                            <input type="checkbox" class="search-checkbox" data-id="{brand_id!a}_{type_id!a}_ebay">
+                            <a href="https://jp.mercari.com/search?keyword={brand_name!a}%20{type!a}%20髪飾り&status=on_sale" target="_blank" class="link-btn link-mercari">メルカリ</a>
+                            <input type="checkbox" class="search-checkbox" data-id="{brand_id!a}_{type_id!a}_mercari">
                         </td>
                     </tr>
-'''
+''')
 
-    tab_html += f'''
+BRAND_TAB_MIDDLE = Template('''
                 </tbody>
             </table>
         </div>
 
-        <h3 class="section-title {accent_class}">💡 {brand_name}の特徴</h3>
+        <h3 class="section-title {accent_class!a}">💡 {brand_name}の特徴</h3>
         <div class="stats-grid" style="margin-bottom: 20px;">
             <div class="stat-card">
                 <div class="label">🎁 ノベルティ品</div>
-                <div class="value {accent_class}">{novelty_count}件</div>
+                <div class="value {accent_class!a}">{novelty_count}件</div>
             </div>
             <div class="stat-card">
                 <div class="label">📦 まとめ売り</div>
@@ -968,11 +1103,11 @@ def generate_brand_tab(brand_name, tab_id, accent_class):
             </div>
             <div class="stat-card">
                 <div class="label">💰 総売上</div>
-                <div class="value">${stats["revenue"]:,.2f}</div>
+                <div class="value">${revenue:,.2f}</div>
             </div>
         </div>
 
-        <h3 class="section-title {accent_class}">📌 人気商品（実データより）Top15</h3>
+        <h3 class="section-title {accent_class!a}">📌 人気商品（実データより）{popular_label}</h3>
         <div class="table-container">
             <table>
                 <thead>
@@ -981,101 +1116,125 @@ def generate_brand_tab(brand_name, tab_id, accent_class):
                         <th>商品タイトル</th>
                         <th>販売数</th>
                         <th>価格</th>
-                        <th class="{accent_class}">仕入上限(¥)</th>
+                        <th class="{accent_class!a}">仕入上限(¥)</th>
                         <th>検索</th>
                     </tr>
                 </thead>
                 <tbody>
-'''
-
-    for i, item in enumerate(popular_items, 1):
-        title = str(item['タイトル'])[:80] + '...' if len(str(item['タイトル'])) > 80 else str(item['タイトル'])
-        search_term = str(item['タイトル'])[:50].replace(' ', '+')
-        item_id = f"{tab_id}_top{i}"
-        ebay_url = f"https://www.ebay.com/sch/i.html?_nkw={search_term}&LH_Sold=1"
-        mercari_url = f"https://jp.mercari.com/search?keyword={str(item['タイトル'])[:30]}&status=on_sale"
+''')
 
-        tab_html += f'''
+POPULAR_ITEM_ROW = Template('''
                     <tr>
-                        <td><strong class="{accent_class}">{i}</strong></td>
+                        <td><strong class="{accent_class!a}">{rank}</strong></td>
                         <td class="model-sample">{title}</td>
-                        <td>{item["販売数"]}</td>
-                        <td>${item["価格"]:.2f}</td>
-                        <td class="highlight {accent_class}">¥{int(item["仕入れ上限"]):,}</td>
+                        <td>{sales}</td>
+                        <td>${price:.2f}</td>
+                        <td class="highlight {accent_class!a}">¥{purchase_limit_jpy:,}</td>
                         <td>
-                            <a href="{ebay_url}" target="_blank" class="link-btn link-ebay">eBay</a>
-                            <input type="checkbox" class="search-checkbox" data-id="{item_id}_ebay">
-                            <a href="{mercari_url}" target="_blank" class="link-btn link-mercari">メルカリ</a>
-                            <input type="checkbox" class="search-checkbox" data-id="{item_id}_mercari">
+                            <a href="https://www.ebay.com/sch/i.html?_nkw={search_term!a}&LH_Sold=1" target="_blank" class="link-btn link-ebay">eBay</a>
+                            <input type="checkbox" class="search-checkbox" data-id="{item_id!a}_ebay">
+                            <a href="https://jp.mercari.com/search?keyword={mercari_term!a}&status=on_sale" target="_blank" class="link-btn link-mercari">メルカリ</a>
+                            <input type="checkbox" class="search-checkbox" data-id="{item_id!a}_mercari">
                         </td>
                     </tr>
-'''
+''')
 
-    tab_html += '''
+TAB_TABLE_END = '''
                 </tbody>
             </table>
         </div>
     </div>
 '''
-    return tab_html
 
-# 各ブランドタブを生成（売上順）
-brand_tabs = [
-    ('CHANEL', 'CHANEL', 'chanel-accent'),
-    ('LOUIS VUITTON', 'LOUIS_VUITTON', 'lv-accent'),
-    ('Vivienne Westwood', 'Vivienne_Westwood', 'vw-accent'),
-    ('GUCCI', 'GUCCI', 'gucci-accent'),
-    ('PRADA', 'PRADA', 'prada-accent'),
-    ('HERMES', 'HERMES', 'hermes-accent'),
-    ('Salvatore Ferragamo', 'Salvatore_Ferragamo', 'ferragamo-accent'),
-    ('DIOR', 'DIOR', 'dior-accent'),
-    ('CELINE', 'CELINE', 'celine-accent'),
-    ('FENDI', 'FENDI', 'fendi-accent'),
-    ('Alexandre de Paris', 'Alexandre_de_Paris', 'adp-accent'),
-]
+# 個別ブランドタブ生成関数
+def generate_brand_tab(brand_name, tab_id, accent_class):
+    stats = stats_engine.by('ブランド').get(brand_name)
+    if not stats:
+        return ''
 
-for brand_name, tab_id, accent_class in brand_tabs:
-    html_parts.append(generate_brand_tab(brand_name, tab_id, accent_class))
+    tab_values = dict(stats, brand_name=brand_name, tab_id=tab_id, accent_class=accent_class,
+                      novelty_premium=novelty_premiums.get(brand_name, 0.0),
+                      box_premium=box_premiums.get(brand_name, 0.0),
+                      novelty_count=flag_count('ノベルティ', brand_name),
+                      bulk_count=flag_count('まとめ売り', brand_name),
+                      purchase_limit_jpy=int(stats['purchase_limit']))
 
-# アイテムタイプ別タブ生成関数
-def generate_item_type_tab(item_type, tab_id):
-    type_df = df[df['アイテムタイプ'] == item_type]
-    if len(type_df) == 0:
-        return ''
+    # アイテムタイプ別統計
+    item_stats = []
+    for item_type, type_stats in stats_engine.within(['ブランド', 'アイテムタイプ'], brand_name).items():
+        item_stats.append(dict(with_interval(type_stats, brand_name, item_type), type=item_type,
+                               novelty_premium=type_novelty_premiums.get((brand_name, item_type), 0.0),
+                               box_premium=type_box_premiums.get((brand_name, item_type), 0.0)))
+    item_stats.sort(key=lambda x: x['sales'], reverse=True)
+    tab_values['top_types'] = ", ".join([s["type"] for s in item_stats[:3]])
 
-    stats = get_brand_stats(type_df)
+    total_brand_sales = stats['sales']
+    type_rows = [dict(type_stats,
+                      ratio=type_stats['sales'] / total_brand_sales * 100 if total_brand_sales > 0 else 0,
+                      stability=get_stability(type_stats['cv'], type_stats['unstable']),
+                      purchase_limit_jpy=int(type_stats['purchase_limit']),
+                      type_id=type_stats['type'].replace(' ', '_'),
+                      type_query=type_stats['type'].replace(' ', '+'))
+                 for type_stats in item_stats]
+
+    # 人気商品（static モード・チャンク集計は Top15）
+    if df is None:
+        popular_items = stream_summary.top_records(brand_name)
+        tab_values['popular_label'] = f'Top{POPULAR_ITEMS_LIMIT}'
+    else:
+        brand_df = df.take(row_index.value_rows('ブランド', brand_name))
+        popular_count = row_limit(POPULAR_ITEMS_LIMIT, len(brand_df))
+        tab_values['popular_label'] = f'Top{POPULAR_ITEMS_LIMIT}' if OUTPUT_MODE == 'static' else f'（全{popular_count:,}件）'
+        popular_items = brand_df.nlargest(popular_count, '販売数')[POPULAR_ITEM_FIELDS].to_dict('records')
+    popular_rows = []
+    for i, item in enumerate(popular_items, 1):
+        title = str(item['タイトル'])
+        popular_rows.append({
+            'rank': i,
+            'title': title[:80] + '...' if len(title) > 80 else title,
+            'sales': item['販売数'],
+            'price': item['価格'],
+            'purchase_limit_jpy': int(item['仕入れ上限']),
+            'item_id': f"{tab_id}_top{i}",
+            'search_term': title[:50].replace(' ', '+'),
+            'mercari_term': title[:30],
+        })
+
+    return ''.join([
+        BRAND_TAB_HEAD.render(tab_values),
+        table_rows(f'{tab_id}_types', BRAND_TYPE_ROW, type_rows, accent_class=accent_class, brand_name=brand_name,
+                                   brand_id=brand_name.replace(' ', '_'), brand_query=brand_name.replace(' ', '+')),
+        BRAND_TAB_MIDDLE.render(tab_values),
+        sortable_table_rows(f'{tab_id}_popular', POPULAR_ITEM_ROW, popular_rows,
+                            ['rank', 'title', 'sales', 'price', 'purchase_limit_jpy', None], accent_class=accent_class),
+        TAB_TABLE_END,
+    ])
 
-    # ブランド別統計
-    brand_stats_in_type = []
-    for brand in type_df['ブランド'].unique():
-        brand_df = type_df[type_df['ブランド'] == brand]
-        if len(brand_df) > 0:
-            b_stats = get_brand_stats(brand_df)
-            b_stats['brand'] = brand
-            brand_stats_in_type.append(b_stats)
-    brand_stats_in_type.sort(key=lambda x: x['sales'], reverse=True)
+# 各ブランドタブを生成（売上順）
+for brand_name, tab_id, accent_class in brand_tabs:
+    html_out.write(generate_brand_tab(brand_name, tab_id, accent_class))
 
-    tab_html = f'''
+ITEM_TYPE_TAB_HEAD = Template('''
     <!-- {item_type}タブ -->
-    <div id="{tab_id}" class="tab-content">
+    <div id="{tab_id!a}" class="tab-content">
         <h2 class="section-title">📊 {item_type} 市場分析</h2>
 
         <div class="stats-grid">
             <div class="stat-card">
                 <div class="label">総販売数</div>
-                <div class="value">{stats["sales"]:,}</div>
+                <div class="value">{sales:,}</div>
             </div>
             <div class="stat-card">
                 <div class="label">中央値</div>
-                <div class="value">${stats["median_price"]:.2f}</div>
+                <div class="value">${median_price:.2f}</div>
             </div>
             <div class="stat-card">
                 <div class="label">CV（変動係数）</div>
-                <div class="value">{stats["cv"]:.3f}</div>
+                <div class="value">{cv:.3f}</div>
             </div>
             <div class="stat-card">
                 <div class="label">仕入上限</div>
-                <div class="value">¥{int(stats["purchase_limit"]):,}</div>
+                <div class="value">¥{purchase_limit_jpy:,}</div>
             </div>
         </div>
 
@@ -1088,6 +1247,7 @@ def generate_item_type_tab(item_type, tab_id):
                         <th>販売数</th>
                         <th>比率</th>
                         <th>中央値</th>
+                        <th>中央値の95%信頼区間</th>
                         <th>仕入上限(¥)</th>
                         <th>CV値</th>
                         <th>安定度</th>
@@ -1095,44 +1255,51 @@ def generate_item_type_tab(item_type, tab_id):
                     </tr>
                 </thead>
                 <tbody>
-'''
+''')
 
-    total_type_sales = stats['sales']
-    for b_stats in brand_stats_in_type[:20]:
-        brand = b_stats['brand']
-        brand_display = '不明' if brand == '(不明)' else brand
-        ratio = b_stats['sales'] / total_type_sales * 100 if total_type_sales > 0 else 0
-        stability = get_stability(b_stats['cv'])
-        brand_id = brand.replace(' ', '_').replace('(', '').replace(')', '')
-        type_id = item_type.replace(' ', '_')
-        ebay_url = f"https://www.ebay.com/sch/i.html?_nkw={brand.replace(' ', '+')}+{item_type.replace(' ', '+')}+Hair+Accessory&LH_Sold=1"
-        mercari_url = f"https://jp.mercari.com/search?keyword={brand}%20{item_type}%20髪飾り&status=on_sale"
-
-        tab_html += f'''
+ITEM_TYPE_BRAND_ROW = Template('''
                     <tr>
                         <td><strong>{brand_display}</strong></td>
-                        <td>{b_stats["sales"]}</td>
+                        <td>{sales}</td>
                         <td>{ratio:.1f}%</td>
-                        <td>${b_stats["median_price"]:.2f}</td>
-                        <td class="highlight">¥{int(b_stats["purchase_limit"]):,}</td>
-                        <td>{b_stats["cv"]:.3f}</td>
+                        <td>${median_price:.2f}</td>
+                        <td>{median_ci}</td>
+                        <td class="highlight">¥{purchase_limit_jpy:,}</td>
+                        <td>{cv:.3f}</td>
                         <td>{stability}</td>
                         <td>
-                            <a href="{ebay_url}" target="_blank" class="link-btn link-ebay">eBay</a>
-                            <input type="checkbox" class="search-checkbox" data-id="{type_id}_{brand_id}_ebay">
-                            <a href="{mercari_url}" target="_blank" class="link-btn link-mercari">メルカリ</a>
-                            <input type="checkbox" class="search-checkbox" data-id="{type_id}_{brand_id}_mercari">
+                            <a href="https://www.ebay.com/sch/i.html?_nkw={ebay_query!a}+{type_query!a}+Hair+Accessory&LH_Sold=1" target="_blank" class="link-btn link-ebay">eBay</a>
+                            <input type="checkbox" class="search-checkbox" data-id="{type_id!a}_{brand_id!a}_ebay">
+                            <a href="https://jp.mercari.com/search?keyword={brand!a}%20{item_type!a}%20髪飾り&status=on_sale" target="_blank" class="link-btn link-mercari">メルカリ</a>
+                            <input type="checkbox" class="search-checkbox" data-id="{type_id!a}_{brand_id!a}_mercari">
                         </td>
                     </tr>
-'''
+''')
 
-    tab_html += '''
-                </tbody>
-            </table>
-        </div>
-    </div>
-'''
-    return tab_html
+# アイテムタイプ別タブ生成関数
+def generate_item_type_tab(item_type, tab_id):
+    stats = stats_engine.by('アイテムタイプ').get(item_type)
+    if not stats:
+        return ''
+
+    # ブランド別統計
+    brand_stats_in_type = []
+    for brand, b_stats in stats_engine.within(['アイテムタイプ', 'ブランド'], item_type).items():
+        brand_stats_in_type.append(dict(with_interval(b_stats, brand, item_type), brand=brand))
+    brand_stats_in_type.sort(key=lambda x: x['sales'], reverse=True)
+
+    total_type_sales = stats['sales']
+    brand_rows = [dict(brand_row_values(b_stats),
+                       ratio=b_stats['sales'] / total_type_sales * 100 if total_type_sales > 0 else 0)
+                  for b_stats in brand_stats_in_type[:20]]
+
+    return ''.join([
+        ITEM_TYPE_TAB_HEAD.render(stats, item_type=item_type, tab_id=tab_id,
+                                  purchase_limit_jpy=int(stats['purchase_limit'])),
+        table_rows(f'{tab_id}_brands', ITEM_TYPE_BRAND_ROW, brand_rows, item_type=item_type, type_id=item_type.replace(' ', '_'),
+                                        type_query=item_type.replace(' ', '+')),
+        TAB_TABLE_END,
+    ])
 
 # アイテムタイプ別タブを生成
 item_type_tabs = [
@@ -1145,13 +1312,12 @@ item_type_tabs = [
 ]
 
 for item_type, tab_id in item_type_tabs:
-    html_parts.append(generate_item_type_tab(item_type, tab_id))
+    html_out.write(generate_item_type_tab(item_type, tab_id))
 
 # ノベルティタブ
-novelty_df = df[df['ノベルティ'] == True]
-novelty_stats = get_brand_stats(novelty_df) if len(novelty_df) > 0 else {}
+novelty_stats = stats_engine.by('ノベルティ').get(True, {})
 
-html_parts.append(f'''
+html_out.write(f'''
     <!-- ノベルティタブ -->
     <div id="novelty" class="tab-content">
         <h2 class="section-title">🎁 ノベルティ品分析</h2>
@@ -1192,37 +1358,28 @@ html_parts.append(f'''
 
 # ノベルティのブランド別統計
 novelty_brand_stats = []
-for brand in novelty_df['ブランド'].unique():
-    brand_df = novelty_df[novelty_df['ブランド'] == brand]
-    if len(brand_df) > 0:
-        b_stats = get_brand_stats(brand_df)
-        b_stats['brand'] = brand
-        novelty_brand_stats.append(b_stats)
+for brand, b_stats in stats_engine.within(['ノベルティ', 'ブランド'], True).items():
+    novelty_brand_stats.append(dict(b_stats, brand=brand))
 novelty_brand_stats.sort(key=lambda x: x['sales'], reverse=True)
 
-for b_stats in novelty_brand_stats[:20]:
-    brand = b_stats['brand']
-    brand_display = '不明' if brand == '(不明)' else brand
-    brand_id = brand.replace(' ', '_').replace('(', '').replace(')', '')
-    ebay_url = f"https://www.ebay.com/sch/i.html?_nkw={brand.replace(' ', '+')}+novelty+Hair+Accessory&LH_Sold=1"
-    mercari_url = f"https://jp.mercari.com/search?keyword={brand}%20ノベルティ%20髪飾り&status=on_sale"
-
-    html_parts.append(f'''
+NOVELTY_BRAND_ROW = Template('''
                     <tr>
                         <td><strong>{brand_display}</strong></td>
-                        <td>{b_stats["sales"]}</td>
-                        <td>${b_stats["median_price"]:.2f}</td>
-                        <td class="highlight">¥{int(b_stats["purchase_limit"]):,}</td>
+                        <td>{sales}</td>
+                        <td>${median_price:.2f}</td>
+                        <td class="highlight">¥{purchase_limit_jpy:,}</td>
                         <td>
-                            <a href="{ebay_url}" target="_blank" class="link-btn link-ebay">eBay</a>
-                            <input type="checkbox" class="search-checkbox" data-id="novelty_{brand_id}_ebay">
-                            <a href="{mercari_url}" target="_blank" class="link-btn link-mercari">メルカリ</a>
-                            <input type="checkbox" class="search-checkbox" data-id="novelty_{brand_id}_mercari">
+                            <a href="https://www.ebay.com/sch/i.html?_nkw={ebay_query!a}+novelty+Hair+Accessory&LH_Sold=1" target="_blank" class="link-btn link-ebay">eBay</a>
+                            <input type="checkbox" class="search-checkbox" data-id="novelty_{brand_id!a}_ebay">
+                            <a href="https://jp.mercari.com/search?keyword={brand!a}%20ノベルティ%20髪飾り&status=on_sale" target="_blank" class="link-btn link-mercari">メルカリ</a>
+                            <input type="checkbox" class="search-checkbox" data-id="novelty_{brand_id!a}_mercari">
                         </td>
                     </tr>
 ''')
 
-html_parts.append('''
+html_out.write(table_rows('novelty_brands', NOVELTY_BRAND_ROW, [brand_row_values(b_stats) for b_stats in novelty_brand_stats[:20]]))
+
+html_out.write('''
                 </tbody>
             </table>
         </div>
@@ -1230,10 +1387,9 @@ html_parts.append('''
 ''')
 
 # まとめ売りタブ
-bulk_df = df[df['まとめ売り'] == True]
-bulk_stats = get_brand_stats(bulk_df) if len(bulk_df) > 0 else {}
+bulk_stats = stats_engine.by('まとめ売り').get(True, {})
 
-html_parts.append(f'''
+html_out.write(f'''
     <!-- まとめ売りタブ -->
     <div id="bundle" class="tab-content">
         <h2 class="section-title">📦 まとめ売り分析</h2>
@@ -1270,25 +1426,30 @@ html_parts.append(f'''
 
 # おすすめ順序タブ
 # 単品のみ（まとめ売り・CITESリスク品を除外）
-safe_df = df[(df['まとめ売り'] == False) & (df['CITES_RISK'] == False)]
-
-# ブランド×アイテムタイプ別集計
-recommend_data = []
-for (brand, item_type), group_df in safe_df.groupby(['ブランド', 'アイテムタイプ']):
-    if len(group_df) >= 2:
-        stats = get_brand_stats(group_df)
-        stats['brand'] = brand
-        stats['item_type'] = item_type
-        recommend_data.append(stats)
+# ブランド×アイテムタイプ別集計（2件以上）
+RECOMMEND_KEYS = ['まとめ売り', 'CITES_RISK', 'ブランド', 'アイテムタイプ']
+SAFE_FILTERS = [equals('まとめ売り', False), equals('CITES_RISK', False)]
+recommend_ranking = RankingEngine(stats_engine.columns(RECOMMEND_KEYS, min_count=2, sort=True))
+
+# 為替レート・手数料率・送料を変えた場合の仕入れ上限中央値とスコア（おすすめ表と同じ単品のみ・2件以上の
+# ブランド×アイテムタイプ × シナリオ）。利益重視モードのシナリオ表で使う
+purchase_scenarios = PurchaseScenarios.from_stats(stats_engine.within(RECOMMEND_KEYS, (False, False), min_count=2, sort=True),
+                                                  SCENARIO_EXCHANGE_RATES, SCENARIO_FEE_RATES, SCENARIO_SHIPPING_JPY)
+print(f"=== 仕入れ上限シナリオ: {purchase_scenarios.shape[0]:,}グループ × "
+      f"{purchase_scenarios.shape[1] * purchase_scenarios.shape[2] * purchase_scenarios.shape[3]}シナリオ ===")
+
+# スコア上位 k 件（スコアは仕入上限 × 販売数。信頼区間も単品のみの行から求めたもの）
+def top_recommendations(k, filters):
+    return [dict(with_interval(row, row['ブランド'], row['アイテムタイプ'], safe_brand_type_intervals), brand=row['ブランド'], item_type=row['アイテムタイプ'])
+            for row in recommend_ranking.top(k, limit_times_sales, SAFE_FILTERS + filters)]
 
 # 回転重視スコア（CV <= 0.5、仕入上限 <= 30000、販売数 >= 3）
-rotation_data = [d for d in recommend_data if d['cv'] <= 0.5 and d['purchase_limit'] <= 30000 and d['sales'] >= 3]
-rotation_data.sort(key=lambda x: x['purchase_limit'] * x['sales'], reverse=True)
+rotation_data = top_recommendations(30, ROTATION_FILTERS)
 
 # 利益重視スコア（全商品）
-profit_data = sorted(recommend_data, key=lambda x: x['purchase_limit'] * x['sales'], reverse=True)
+profit_data = top_recommendations(30, [])
 
-html_parts.append(f'''
+html_out.write(f'''
     <!-- おすすめ出品順序タブ -->
     <div id="recommend" class="tab-content">
         <h2 class="section-title">⭐ おすすめ出品順序</h2>
@@ -1323,6 +1484,7 @@ html_parts.append(f'''
                             <th>アイテムタイプ</th>
                             <th>販売数</th>
                             <th>中央値($)</th>
+                            <th>95%信頼区間</th>
                             <th>仕入上限</th>
                             <th>安定度</th>
                             <th>スコア</th>
@@ -1331,25 +1493,36 @@ html_parts.append(f'''
                     <tbody>
 ''')
 
-for i, data in enumerate(rotation_data[:30], 1):
-    stability = get_stability(data['cv'])
-    score = int(data['purchase_limit'] * data['sales'])
-    risk = '低' if data['cv'] <= 0.3 else ('中' if data['cv'] <= 0.5 else '高')
-
-    html_parts.append(f'''
+RECOMMEND_ROW = Template('''
                         <tr>
-                            <td><strong>{i}</strong></td>
-                            <td>{data["brand"]}</td>
-                            <td>{data["item_type"]}</td>
-                            <td>{data["sales"]}</td>
-                            <td>${data["median_price"]:.2f}</td>
-                            <td>¥{int(data["purchase_limit"]):,}</td>
-                            <td>{stability}</td>
+                            <td><strong>{rank}</strong></td>
+                            <td>{brand}</td>
+                            <td>{item_type}</td>
+                            <td>{sales}</td>
+                            <td>${median_price:.2f}</td>
+                            <td>{median_ci}</td>
+                            <td>¥{purchase_limit_jpy:,}</td>
+                            <td>{rating}</td>
                             <td>{score:,}</td>
                         </tr>
 ''')
 
-html_parts.append('''
+def recommend_rows(recommendations, rating):
+    """おすすめ表の行（rating は stats → 安定度・リスク等の表示）"""
+    return [dict(data, rank=i, rating=rating(data), purchase_limit_jpy=int(data['purchase_limit']),
+                 score=int(data['purchase_limit'] * data['sales']))
+            for i, data in enumerate(recommendations, 1)]
+
+# リスク（unstable なら1段階上げる）
+RISK_LABELS = ['低', '中', '高']
+
+def risk_label(data):
+    level = 0 if data['cv'] <= 0.3 else (1 if data['cv'] <= 0.5 else 2)
+    return RISK_LABELS[min(level + data['unstable'], 2)]
+
+html_out.write(table_rows('rotation', RECOMMEND_ROW, recommend_rows(rotation_data[:30], lambda data: get_stability(data['cv'], data['unstable']))))
+
+html_out.write('''
                     </tbody>
                 </table>
             </div>
@@ -1374,6 +1547,7 @@ html_parts.append('''
                             <th>アイテムタイプ</th>
                             <th>販売数</th>
                             <th>中央値($)</th>
+                            <th>95%信頼区間</th>
                             <th>仕入上限</th>
                             <th>リスク</th>
                             <th>スコア</th>
@@ -1382,24 +1556,59 @@ html_parts.append('''
                     <tbody>
 ''')
 
-for i, data in enumerate(profit_data[:30], 1):
-    score = int(data['purchase_limit'] * data['sales'])
-    risk = '低' if data['cv'] <= 0.3 else ('中' if data['cv'] <= 0.5 else '高')
+html_out.write(table_rows('profit', RECOMMEND_ROW, recommend_rows(profit_data[:30], risk_label)))
+
+html_out.write(f'''
+                    </tbody>
+                </table>
+            </div>
+
+            <div class="insight-box">
+                <h3>💱 為替・手数料・送料シナリオ別の仕入上限（利益重視 Top10）</h3>
+                <ul>
+                    <li>為替レート別の列は手数料率 {FEE_RATE:.0%}・送料 ¥{SHIPPING_JPY:,} の場合</li>
+                    <li>最悪: 為替 ¥{min(SCENARIO_EXCHANGE_RATES)}/$・手数料率 {max(SCENARIO_FEE_RATES):.0%}・送料 ¥{max(SCENARIO_SHIPPING_JPY):,}</li>
+                    <li>最良: 為替 ¥{max(SCENARIO_EXCHANGE_RATES)}/$・手数料率 {min(SCENARIO_FEE_RATES):.0%}・送料 ¥{min(SCENARIO_SHIPPING_JPY):,}</li>
+                </ul>
+            </div>
+
+            <div class="table-container">
+                <table>
+                    <thead>
+                        <tr>
+                            <th>ブランド</th>
+                            <th>アイテムタイプ</th>
+{''.join(f"                            <th>¥{rate}/$</th>{chr(10)}" for rate in SCENARIO_EXCHANGE_RATES)}\
+                            <th>最悪</th>
+                            <th>最良</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+''')
 
-    html_parts.append(f'''
+SCENARIO_ROW = Template('''
                         <tr>
-                            <td><strong>{i}</strong></td>
-                            <td>{data["brand"]}</td>
-                            <td>{data["item_type"]}</td>
-                            <td>{data["sales"]}</td>
-                            <td>${data["median_price"]:.2f}</td>
-                            <td>¥{int(data["purchase_limit"]):,}</td>
-                            <td>{risk}</td>
-                            <td>{score:,}</td>
+                            <td>{brand}</td>
+                            <td>{item_type}</td>
+''' + ''.join(f'''                            <td>¥{{limit_{i}:,}}</td>
+''' for i in range(len(SCENARIO_EXCHANGE_RATES))) + '''                            <td>¥{worst:,}</td>
+                            <td>¥{best:,}</td>
                         </tr>
 ''')
 
-html_parts.append('''
+# 利益重視 Top10 の仕入上限を、為替レート別（手数料率・送料は現在の設定）と最悪・最良のシナリオで引く
+rate_scenarios = [purchase_scenarios.scenario(rate, FEE_RATE, SHIPPING_JPY) for rate in SCENARIO_EXCHANGE_RATES]
+worst_scenario = purchase_scenarios.scenario(min(SCENARIO_EXCHANGE_RATES), max(SCENARIO_FEE_RATES), max(SCENARIO_SHIPPING_JPY))
+best_scenario = purchase_scenarios.scenario(max(SCENARIO_EXCHANGE_RATES), min(SCENARIO_FEE_RATES), min(SCENARIO_SHIPPING_JPY))
+scenario_rows = []
+for data in profit_data[:10]:
+    group = (data['brand'], data['item_type'])
+    limits = {f'limit_{i}': int(scenario[group][0]) for i, scenario in enumerate(rate_scenarios)}
+    scenario_rows.append(dict(limits, brand=data['brand'], item_type=data['item_type'],
+                              worst=int(worst_scenario[group][0]), best=int(best_scenario[group][0])))
+html_out.write(table_rows('profit_scenarios', SCENARIO_ROW, scenario_rows))
+
+html_out.write('''
                     </tbody>
                 </table>
             </div>
@@ -1409,7 +1618,7 @@ html_parts.append('''
 
 # JavaScript
 # グラフデータの準備
-price_dist = get_price_distribution_50(df['価格'])
+price_dist = stream_summary.price_counts if df is None else get_price_distribution_50(df['価格'])
 price_dist_labels = list(price_dist.keys())
 price_dist_values = list(price_dist.values())
 
@@ -1417,28 +1626,27 @@ brand_top10_labels = [b['brand'] for b in top20_brands[:10]]
 brand_top10_sales = [b['sales'] for b in top20_brands[:10]]
 
 # 月別販売数推移データの準備
-df['販売月'] = pd.to_datetime(df['販売日']).dt.to_period('M').astype(str)
-months = sorted(df['販売月'].unique())
 item_types_for_chart = ['Headband', 'Barrette', 'Hair Clip', 'Tiara', 'Scrunchie', 'Other']
-
-monthly_data = {}
-for item_type in item_types_for_chart:
-    monthly_data[item_type] = []
-    for month in months:
-        type_month_df = df[(df['アイテムタイプ'] == item_type) & (df['販売月'] == month)]
-        monthly_data[item_type].append(int(type_month_df['販売数'].sum()))
-
-# 各ブランドの価格分布データ
+if df is None:
+    monthly_matrix = stats_trend_matrix(stats_engine, by='アイテムタイプ', columns=item_types_for_chart)
+else:
+    monthly_matrix = trend_matrix(df, by='アイテムタイプ', resolution='month', columns=item_types_for_chart)
+months = monthly_matrix.index.tolist()
+monthly_data = {item_type: [int(v) for v in monthly_matrix[item_type]] for item_type in item_types_for_chart}
+
+# 各ブランドの価格分布データ（価格インデックスの二分探索で数える。チャンク集計ではチャンクごとに数えた合計）
 brand_price_dist = {}
 brand_item_type_dist = {}
 for brand_name, tab_id, _ in brand_tabs:
-    brand_df = df[df['ブランド'] == brand_name]
-    if len(brand_df) > 0:
-        brand_price_dist[tab_id] = get_price_distribution_50(brand_df['価格'])
-        item_dist = brand_df.groupby('アイテムタイプ')['販売数'].sum().to_dict()
-        brand_item_type_dist[tab_id] = {str(k): int(v) for k, v in item_dist.items()}
+    if df is None and stream_summary.group_counts[brand_name]:
+        brand_price_dist[tab_id] = stream_summary.group_price_counts[brand_name]
+    elif df is not None and brand_name in brand_price_index:
+        brand_price_dist[tab_id] = brand_price_index.histogram(brand_name, PRICE_BINS_50)
+    if tab_id in brand_price_dist:
+        item_dist = stats_engine.within(['ブランド', 'アイテムタイプ'], brand_name, sort=True)
+        brand_item_type_dist[tab_id] = {str(k): v['sales'] for k, v in item_dist.items()}
 
-html_parts.append(f'''
+html_out.write(f'''
     <script>
     // Plotly設定
     const plotlyLayout = {{
@@ -1449,12 +1657,22 @@ html_parts.append(f'''
     }};
     const plotlyConfig = {{ responsive: true, displayModeBar: false }};
 
+    // タブごとのグラフ（タブを初めて表示したときに1回だけ描画する。非表示のタブのグラフは作らない）
+    const tabCharts = {{}};
+    const renderedTabs = new Set();
+    function renderTabCharts(tabId) {{
+        if (renderedTabs.has(tabId) || !tabCharts[tabId]) return;
+        renderedTabs.add(tabId);
+        tabCharts[tabId]();
+    }}
+
     // タブ切り替え
     function showTab(tabId) {{
         document.querySelectorAll('.tab-content').forEach(t => t.classList.remove('active'));
         document.querySelectorAll('.tab').forEach(t => t.classList.remove('active'));
         document.getElementById(tabId).classList.add('active');
         document.querySelector(`[onclick="showTab('${{tabId}}')"]`).classList.add('active');
+        renderTabCharts(tabId);
     }}
 
     // おすすめモード切り替え
@@ -1492,12 +1710,12 @@ html_parts.append(f'''
         alert('再計算機能は準備中です');
     }}
 
-    // グラフ描画
-    document.addEventListener('DOMContentLoaded', function() {{
+    // 全体分析タブのグラフ
+    tabCharts['overview'] = function() {{
         // アイテムタイプ別棒グラフ
         Plotly.newPlot('itemTypeBarChart', [{{
-            y: {json.dumps(item_type_labels)},
-            x: {json.dumps(item_type_sales)},
+            y: {chart_series(item_type_labels)},
+            x: {chart_series(item_type_sales)},
             type: 'bar',
             orientation: 'h',
             marker: {{ color: '#e91e63' }}
@@ -1505,16 +1723,16 @@ html_parts.append(f'''
 
         // ブランドカテゴリ別円グラフ
         Plotly.newPlot('brandCatPieChart', [{{
-            labels: {json.dumps(brand_cat_labels)},
-            values: {json.dumps(brand_cat_sales)},
+            labels: {chart_series(brand_cat_labels)},
+            values: {chart_series(brand_cat_sales)},
             type: 'pie',
             hole: 0.4
         }}], {{...plotlyLayout, title: 'ブランドカテゴリ別シェア'}}, plotlyConfig);
 
         // ブランド別棒グラフ
         Plotly.newPlot('brandBarChart', [{{
-            y: {json.dumps(brand_top10_labels)},
-            x: {json.dumps(brand_top10_sales)},
+            y: {chart_series(brand_top10_labels)},
+            x: {chart_series(brand_top10_sales)},
             type: 'bar',
             orientation: 'h',
             marker: {{ color: '#9c27b0' }}
@@ -1522,15 +1740,15 @@ html_parts.append(f'''
 
         // ブランド別円グラフ
         Plotly.newPlot('brandPieChart', [{{
-            labels: {json.dumps(brand_top10_labels)},
-            values: {json.dumps(brand_top10_sales)},
+            labels: {chart_series(brand_top10_labels)},
+            values: {chart_series(brand_top10_sales)},
             type: 'pie'
         }}], {{...plotlyLayout, title: 'ブランド別シェア（Top10）'}}, plotlyConfig);
 
         // 価格帯分布
         Plotly.newPlot('priceDistChart', [{{
-            x: {json.dumps(price_dist_labels)},
-            y: {json.dumps(price_dist_values)},
+            x: {chart_series(price_dist_labels)},
+            y: {chart_series(price_dist_values)},
             type: 'bar',
             marker: {{ color: '#e91e63' }}
         }}], {{...plotlyLayout, title: '価格帯分布（50ドル刻み）', xaxis: {{ title: '価格帯' }}, yaxis: {{ title: '件数' }}}}, plotlyConfig);
@@ -1542,9 +1760,9 @@ html_parts.append(f'''
 monthly_colors = ['#e91e63', '#9c27b0', '#673ab7', '#3f51b5', '#2196f3', '#607d8b']
 for i, item_type in enumerate(item_types_for_chart):
     color = monthly_colors[i % len(monthly_colors)]
-    html_parts.append(f'''            {{
-                x: {json.dumps(months)},
-                y: {json.dumps(monthly_data[item_type])},
+    html_out.write(f'''            {{
+                x: {chart_series(months)},
+                y: {chart_series(monthly_data[item_type])},
                 name: '{item_type}',
                 type: 'scatter',
                 mode: 'lines+markers',
@@ -1553,8 +1771,9 @@ for i, item_type in enumerate(item_types_for_chart):
             }},
 ''')
 
-html_parts.append(f'''        ];
+html_out.write(f'''        ];
         Plotly.newPlot('monthlyTrendChart', monthlyTraces, {{...plotlyLayout, title: '月別販売数推移（アイテムタイプ別）', xaxis: {{ title: '年月' }}, yaxis: {{ title: '販売数' }}}}, plotlyConfig);
+    }};
 ''')
 
 # 各ブランドタブのグラフ
@@ -1565,36 +1784,46 @@ for brand_name, tab_id, _ in brand_tabs:
         item_labels = list(brand_item_type_dist[tab_id].keys())
         item_values = list(brand_item_type_dist[tab_id].values())
 
-        html_parts.append(f'''
+        html_out.write(f'''
+    // {brand_name}タブのグラフ
+    tabCharts['{tab_id}'] = function() {{
         // {brand_name}の価格帯分布
         Plotly.newPlot('{tab_id}_price_chart', [{{
-            x: {json.dumps(price_labels)},
-            y: {json.dumps(price_values)},
+            x: {chart_series(price_labels)},
+            y: {chart_series(price_values)},
             type: 'bar',
             marker: {{ color: '#e91e63' }}
         }}], {{...plotlyLayout, xaxis: {{ title: '価格帯' }}, yaxis: {{ title: '件数' }}}}, plotlyConfig);
 
         // {brand_name}のアイテムタイプ別分布
         Plotly.newPlot('{tab_id}_item_chart', [{{
-            labels: {json.dumps(item_labels)},
-            values: {json.dumps(item_values)},
+            labels: {chart_series(item_labels)},
+            values: {chart_series(item_values)},
             type: 'pie',
             hole: 0.4
         }}], {{...plotlyLayout}}, plotlyConfig);
+    }};
 ''')
 
-html_parts.append('''
+# 最初に表示されているタブ（全体分析）のグラフだけを読み込み時に描画する
+html_out.write('''
+    document.addEventListener('DOMContentLoaded', function() {
+        renderTabCharts(document.querySelector('.tab-content.active').id);
     });
     </script>
-</body>
+''')
+
+# data モードでは埋め込みデータと描画スクリプトを最後に置く（表の描画・グラフの配列の復元）
+if OUTPUT_MODE == 'data':
+    html_out.write(report_payload.html())
+
+html_out.write('''</body>
 </html>
 ''')
 
-# HTMLファイル出力
-output_path = '/Users/naokijodan/Desktop/hair-accessory-research/index.html'
-with open(output_path, 'w', encoding='utf-8') as f:
-    f.write(''.join(html_parts))
+# HTMLファイル出力（出力先への置き換え）
+output_size = html_out.close()
 
 print(f"\n=== HTML生成完了 ===")
-print(f"出力先: {output_path}")
-print(f"ファイルサイズ: {len(''.join(html_parts)):,} bytes")
+print(f"出力先: {OUTPUT_PATH}")
+print(f"ファイルサイズ: {output_size:,} bytes")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""タイトル分類キャッシュ - 分類結果をpickleファイルに保存し、前回までに見たタイトルの再分類を省略する"""
+
+import glob
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+# 保持するルールバージョン数（v1/v2 など複数スクリプトで同じディレクトリを共有しても互いに消さない）
+KEEP_VERSIONS = 4
+
+
+def title_key(title):
+    """正規化済みタイトル（str → upper）のハッシュ。分類結果は正規化後の文字列だけで決まる"""
+    return hashlib.blake2b(str(title).upper().encode('utf-8'), digest_size=16).digest()
+
+
+class ClassificationCache:
+    """タイトルハッシュ × ルールバージョンをキーにした分類結果のキャッシュ
+
+    ルールバージョン（TitleClassifier.rules_version = 全キーワードリストのハッシュ）ごとに
+    1ファイルを持つため、ルールを1つでも変えると以前の結果は参照されなくなる。
+    各ファイルは title_hash 列＋分類結果列のDataFrameで、照合はハッシュ列のインデックスで一括に行う。
+    直近の classify のヒット数・新規分類数は last_hit_count / last_miss_count に残す。
+    読み込んだファイルはインスタンスに保持し、classify のたびに読み直さない。
+    autosave=False なら新規分類はメモリに溜め、flush で1回だけ書き出す（チャンク読み込み用）。
+    """
+
+    def __init__(self, directory, autosave=True):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.autosave = autosave
+        self.last_hit_count = 0
+        self.last_miss_count = 0
+        self._stores = {}
+        self._indexes = {}
+        self._dirty = set()
+
+    def classify(self, classifier, titles):
+        """ユニークなタイトルを分類する（キャッシュにないものだけ classifier で判定して保存）
+
+        大文字・小文字だけが違うタイトルは同じハッシュになるため、ハッシュ単位で重複を除いてから
+        照合・分類・追加し、結果を入力の行に戻す（キャッシュのハッシュ列は常に一意）。
+        """
+        titles = pd.Series(titles).reset_index(drop=True)
+        path = os.path.join(self.directory, f'{classifier.rules_version}.pkl')
+        codes, keys = pd.factorize(np.array([title_key(t) for t in titles], dtype=object))
+        # ハッシュごとに最初に現れたタイトルを代表にする
+        first_rows = np.unique(codes, return_index=True)[1]
+
+        cached = self._load(path)
+        if cached is not None:
+            positions = self._indexes[path].get_indexer(keys)
+        else:
+            positions = np.full(len(keys), -1, dtype=np.int64)
+        hit = positions >= 0
+        self.last_hit_count = int(hit[codes].sum())
+        self.last_miss_count = len(codes) - self.last_hit_count
+
+        fresh = classifier.classify_unique(titles.iloc[first_rows[~hit]].reset_index(drop=True))
+        if len(fresh):
+            new_rows = fresh.copy()
+            new_rows.insert(0, 'title_hash', keys[~hit])
+            store = new_rows if cached is None else pd.concat([cached, new_rows], ignore_index=True)
+            self._stores[path] = store
+            self._indexes[path] = pd.Index(store['title_hash'])
+            self._dirty.add(path)
+            if self.autosave:
+                self.flush()
+            # 新規分類した行の位置（追加した行は store の末尾）
+            positions[~hit] = np.arange(len(store) - len(fresh), len(store))
+        elif os.path.exists(path):
+            # 新規分類がなければ書き直さず、使ったことだけ記録する（_prune で残す順に使う）
+            os.utime(path)
+            self._prune()
+
+        store = self._stores[path]
+        if store is None:
+            return fresh
+        return store.drop(columns='title_hash').iloc[positions[codes]].reset_index(drop=True)
+
+    def flush(self):
+        """まだ書き出していない新規分類をファイルに保存する"""
+        for path in sorted(self._dirty):
+            self._save(path, self._stores[path])
+        self._dirty.clear()
+        self._prune()
+
+    def _load(self, path):
+        """ルールバージョンのファイル（初回だけ読み込む。なければ None）"""
+        if path not in self._stores:
+            cached = pd.read_pickle(path) if os.path.exists(path) else None
+            if cached is not None:
+                # 以前の版で重複して保存されたハッシュがあっても照合できるようにする
+                cached = cached.drop_duplicates('title_hash', ignore_index=True)
+            self._stores[path] = cached
+            self._indexes[path] = pd.Index(cached['title_hash']) if cached is not None else None
+        return self._stores[path]
+
+    def _save(self, path, frame):
+        """一時ファイルに書いてから置き換える（途中で止まっても壊れたキャッシュを残さない）"""
+        tmp_path = f'{path}.tmp'
+        frame.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _prune(self):
+        """最近使った KEEP_VERSIONS 個を残し、古いルールバージョンのファイルを削除する"""
+        paths = sorted(glob.glob(os.path.join(self.directory, '*.pkl')), key=os.path.getmtime, reverse=True)
+        for old_path in paths[KEEP_VERSIONS:]:
+            os.remove(old_path)
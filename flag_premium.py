@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""フラグ別プレミアム - ノベルティ・箱あり等のフラグが付くと中央値価格が何%上がるかを全グループまとめて求める"""
+
+import numpy as np
+import pandas as pd
+
+
+def flag_premiums(df, flag, by='ブランド', value='価格', min_samples=2):
+    """by ごとの「flag あり」の value 中央値が「なし」の中央値より何%高いか（{グループ: %}）
+
+    by × flag の1回の groupby で全グループの件数と中央値を求めるため、グループごとの絞り込みは不要。
+    あり・なしのどちらかが min_samples 件未満、またはなしの中央値が0以下のグループは 0.0。
+    by が列名1つならキーはスカラー、リストならタプル。
+    """
+    keys = [by] if isinstance(by, str) else list(by)
+    grouped = df.groupby(keys + [flag], observed=True, sort=False)[value].agg(['size', 'median'])
+    table = grouped.unstack(flag).reindex(columns=pd.MultiIndex.from_product([['size', 'median'], [False, True]]))
+
+    with_count = table[('size', True)].fillna(0).to_numpy()
+    without_count = table[('size', False)].fillna(0).to_numpy()
+    with_median = table[('median', True)].to_numpy(dtype=np.float64)
+    without_median = table[('median', False)].to_numpy(dtype=np.float64)
+    valid = (with_count >= min_samples) & (without_count >= min_samples) & (without_median > 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        premium = np.where(valid, (with_median - without_median) / without_median * 100, 0.0)
+    return dict(zip(table.index.tolist(), premium.tolist()))
+
+
+def grouped_flag_premiums(grouped, min_samples=2):
+    """集計済みの {(グループのキー..., フラグ): 統計} からのプレミアム（flag_premiums と同じ規則、チャンク集計用）
+
+    統計は GroupStatsEngine.by の dict（count と median_price を使う）。グループのキーが1つならスカラー。
+    """
+    sides = {}
+    for key, stats in grouped.items():
+        group, flagged = key[:-1], key[-1]
+        sides.setdefault(group[0] if len(group) == 1 else group, {})[bool(flagged)] = stats
+    premiums = {}
+    for group, side in sides.items():
+        with_flag, without_flag = side.get(True), side.get(False)
+        valid = (with_flag is not None and without_flag is not None and with_flag['count'] >= min_samples
+                 and without_flag['count'] >= min_samples and without_flag['median_price'] > 0)
+        premiums[group] = ((with_flag['median_price'] - without_flag['median_price'])
+                           / without_flag['median_price'] * 100 if valid else 0.0)
+    return premiums
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""エンリッチ済みDataFrameのスナップショット - 列ごとの .npy に保存し、同じCSVなら再集計せずに読み込む"""
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# 保持するスナップショット数
+KEEP_SNAPSHOTS = 3
+
+# スナップショットの保存形式を変えたら上げる
+SNAPSHOT_FORMAT = 1
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """ファイル内容のSHA-256（ファイル名や更新日時ではなく中身で判定する）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_key(csv_path, settings):
+    """CSVの内容ハッシュと、派生列の計算に使う設定（為替・手数料・ルール等）からキーを作る"""
+    payload = json.dumps({'format': SNAPSHOT_FORMAT, 'csv': file_digest(csv_path), 'settings': settings},
+                         ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def save_snapshot(directory, key, df):
+    """DataFrameを1列1ファイルで保存する
+
+    数値・真偽値・日時列はそのまま .npy に、文字列などの列は整数コード＋ユニーク値に分けて保存する。
+    """
+    os.makedirs(directory, exist_ok=True)
+    final_dir = os.path.join(directory, key)
+    tmp_dir = f'{final_dir}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        entry = {'name': name, 'dtype': str(series.dtype), 'file': f'{i:03d}'}
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            entry['kind'] = 'category'
+            np.save(os.path.join(tmp_dir, f'{i:03d}.codes.npy'), series.cat.codes.to_numpy())
+            np.save(os.path.join(tmp_dir, f'{i:03d}.uniques.npy'),
+                    series.cat.categories.to_numpy(dtype=object), allow_pickle=True)
+            entry['ordered'] = bool(series.cat.ordered)
+        elif series.dtype.kind in 'biufcmM' and not isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+            entry['kind'] = 'numpy'
+            np.save(os.path.join(tmp_dir, f'{i:03d}.npy'), series.to_numpy())
+        else:
+            # 欠損値はコード -1（読み込み時にユニーク値の末尾に置いた NaN を参照）
+            entry['kind'] = 'factorized'
+            codes, uniques = pd.factorize(series)
+            np.save(os.path.join(tmp_dir, f'{i:03d}.codes.npy'), codes)
+            np.save(os.path.join(tmp_dir, f'{i:03d}.uniques.npy'), np.asarray(uniques, dtype=object),
+                    allow_pickle=True)
+        columns.append(entry)
+
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'rows': len(df), 'columns': columns}, f, ensure_ascii=False)
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+    _prune(directory)
+
+
+def load_snapshot(directory, key):
+    """保存済みのスナップショットを読み込む（なければ None）。数値列はメモリマップで開く"""
+    snapshot_dir = os.path.join(directory, key)
+    meta_path = os.path.join(snapshot_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+
+    data = {}
+    for entry in meta['columns']:
+        base = os.path.join(snapshot_dir, entry['file'])
+        if entry['kind'] == 'numpy':
+            data[entry['name']] = pd.Series(np.load(f'{base}.npy', mmap_mode='r'), copy=False)
+            continue
+        codes = np.load(f'{base}.codes.npy', mmap_mode='r')
+        uniques = np.load(f'{base}.uniques.npy', allow_pickle=True)
+        if entry['kind'] == 'category':
+            data[entry['name']] = pd.Series(pd.Categorical.from_codes(codes, uniques, ordered=entry['ordered']))
+        else:
+            values = np.append(uniques, np.nan)[codes]
+            data[entry['name']] = pd.Series(values, dtype=entry['dtype'])
+
+    os.utime(snapshot_dir)
+    return pd.DataFrame(data, index=pd.RangeIndex(meta['rows']))
+
+
+def _prune(directory):
+    """最近使った KEEP_SNAPSHOTS 個を残して古いスナップショットを削除する"""
+    paths = [p for p in glob.glob(os.path.join(directory, '*')) if os.path.isdir(p) and not p.endswith('.tmp')]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for old_path in paths[KEEP_SNAPSHOTS:]:
+        shutil.rmtree(old_path, ignore_errors=True)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""グループ別統計エンジン - 任意のキーの get_brand_stats 相当の統計を集計キューブのロールアップで求める"""
+
+from aggregate_cube import AggregateCube
+
+
+class GroupStatsEngine:
+    """DataFrameに対するグループ別統計（件数・販売数・売上・平均・中央値・最小・最大・CV・仕入れ上限中央値）
+
+    ブランドやアイテムタイプごとに df[df[col] == x] で絞り込んで集計する代わりに、
+    最初に1回だけ AggregateCube を作り、キーごとの統計はそのロールアップで求めて各タブで使い回す。
+    source には DataFrame か、チャンク集計で作った AggregateCube を渡す。
+    グループの並びは従来の df[col].unique() ループと同じく出現順（sort=True なら昇順）。
+    cv_min_count 未満の件数のグループは CV を 0 とする（v1 の calc_cv と同じ扱い）。
+    """
+
+    def __init__(self, source, cv_min_count=0):
+        self.cube = source if isinstance(source, AggregateCube) else AggregateCube.from_frame(source)
+        self.cv_min_count = cv_min_count
+        self._cache = {}
+
+    def by(self, keys, min_count=1, sort=False):
+        """keys ごとの統計を {グループ: get_brand_stats と同じ形の dict} で返す（min_count 件未満は除外）"""
+        cache_key = (keys if isinstance(keys, str) else tuple(keys), sort)
+        if cache_key not in self._cache:
+            self._cache[cache_key] = self.cube.rollup(keys, sort=sort).stats(self.cv_min_count)
+        return {group: stats for group, stats in self._cache[cache_key].items() if stats['count'] >= min_count}
+
+    def columns(self, keys, min_count=1, sort=False):
+        """keys ごとの統計を列ごとの配列で返す（キー列＋統計の {列名: ndarray}。RankingEngine にそのまま渡せる）"""
+        columns = self.cube.rollup(keys, sort=sort).columns(self.cv_min_count)
+        if not columns:
+            return columns
+        keep = columns['count'] >= min_count
+        return {name: values[keep] for name, values in columns.items()}
+
+    def within(self, keys, prefix, min_count=1, sort=False):
+        """複数キーの統計のうち、先頭のキーが prefix に一致するグループを {残りのキー: 統計} で返す
+
+        例: within(['ブランド', 'アイテムタイプ'], 'CHANEL') → CHANEL のアイテムタイプ別統計
+        """
+        prefix = prefix if isinstance(prefix, tuple) else (prefix,)
+        size = len(prefix)
+        result = {}
+        for group, stats in self.by(keys, min_count=min_count, sort=sort).items():
+            if group[:size] == prefix:
+                rest = group[size:]
+                result[rest[0] if len(rest) == 1 else rest] = stats
+        return result
+
+    def total(self):
+        """全行の統計（get_brand_stats(df) と同じ。行がなければ空の dict）"""
+        return self.by([]).get((), {})
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""HTMLテンプレート - タブ・表の行のテンプレートを1回だけ解析し、統計の dict のリストをまとめて描画する（値は HTML エスケープ）"""
+
+import html.entities
+import re
+import string
+
+# 文字参照として解釈されうる & だけをエスケープする（「H&M」「DOLCE & GABBANA」等はそのまま出力される）
+_LEGACY_ENTITIES = sorted((name for name in html.entities.html5 if not name.endswith(';')), key=len, reverse=True)
+_AMBIGUOUS_AMPERSAND = re.compile(r'&(?=#|[A-Za-z][A-Za-z0-9]*;|' + '|'.join(_LEGACY_ENTITIES) + ')')
+
+
+def escape_text(text):
+    """要素の中身として安全な文字列（<, > と文字参照になりうる & をエスケープ）"""
+    if '&' in text:
+        text = _AMBIGUOUS_AMPERSAND.sub('&amp;', text)
+    if '<' in text or '>' in text:
+        text = text.replace('<', '&lt;').replace('>', '&gt;')
+    return text
+
+
+def escape_attribute(text):
+    """ダブルクォートで囲んだ属性値として安全な文字列"""
+    text = escape_text(text)
+    if '"' in text:
+        text = text.replace('"', '&quot;')
+    return text
+
+
+_ESCAPES = {None: escape_text, 'a': escape_attribute, 's': None}
+
+
+class Template:
+    """{名前} / {名前:書式} のプレースホルダを持つHTMLテンプレート
+
+    作成時に1回だけ解析して、値を位置引数で埋める str.format 用の書式に変換しておく。
+    値は書式（format と同じ指定）で整形したあと、文字列の値だけをエスケープする。
+    {名前!a} は属性値用（" もエスケープ）、{名前!s} はエスケープしない（描画済みのHTML等、信頼できる値用）。
+    解析結果（literals・fields・conversions）は、同じテンプレートをブラウザ側で描画する場合にも使う（report_payload）。
+    """
+
+    def __init__(self, source):
+        self.source = source
+        parts = []
+        self.literals = []
+        self.fields = []
+        self.conversions = []
+        for literal, name, spec, conversion in string.Formatter().parse(source):
+            parts.append(literal.replace('{', '{{').replace('}', '}}'))
+            self.literals.append(literal)
+            if name is None:
+                continue
+            if conversion not in _ESCAPES:
+                raise ValueError(f'テンプレートの変換指定は !a か !s です: {{{name}!{conversion}}}')
+            parts.append(f'{{{len(self.fields)}}}')
+            self.fields.append((name, spec or '', _ESCAPES[conversion]))
+            self.conversions.append(conversion)
+        self._format = ''.join(parts).format
+
+    def render(self, values=None, **common):
+        """1件分を描画する（values と common の両方から名前を引く。values が優先）"""
+        return self._format(*self._values(values or {}, common))
+
+    def render_rows(self, rows, **common):
+        """rows（dict のリスト）を1件ずつ描画して連結する（common は全行に共通の値）"""
+        format_ = self._format
+        return ''.join([format_(*self._values(row, common)) for row in rows])
+
+    def _values(self, row, common):
+        values = []
+        for name, spec, escape in self.fields:
+            value = row[name] if name in row else common[name]
+            text = format(value, spec)
+            if escape is not None and isinstance(value, str):
+                text = escape(text)
+            values.append(text)
+        return values
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""HTML出力 - 生成したセクションをそのままバッファ付きで一時ファイルへ書き出し、最後に出力先へアトミックに置き換える"""
+
+import os
+import tempfile
+import weakref
+
+
+class StreamingHtmlWriter:
+    """出力先と同じディレクトリの一時ファイルに書き込み、close で出力先に置き換える（os.replace）
+
+    ページ全体を文字列のリストに溜めて join する必要がないため、レポートが大きくなっても
+    メモリに載るのは書き込み待ちのバッファ（buffer_size）だけ。close の前に失敗した場合は
+    一時ファイルを削除し、既存の出力ファイルはそのまま残る。with 文でも使える。
+    """
+
+    def __init__(self, path, buffer_size=1 << 16, encoding='utf-8'):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, self.temp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp', dir=directory)
+        # mkstemp は 0600 で作るため、通常の open と同じ権限（umask 適用後の 0666）に揃える
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(self.temp_path, 0o666 & ~umask)
+        self._file = os.fdopen(fd, 'w', encoding=encoding, buffering=buffer_size)
+        # close されないまま終了した場合も一時ファイルを残さない
+        self._discard = weakref.finalize(self, _remove_quietly, self._file, self.temp_path)
+        self.size = None
+
+    def write(self, text):
+        self._file.write(text)
+
+    def close(self):
+        """書き込みを確定して出力先に置き換え、ファイルサイズ（バイト）を返す"""
+        if self.size is None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self.temp_path, self.path)
+            self._discard.detach()
+            self.size = os.path.getsize(self.path)
+        return self.size
+
+    def abort(self):
+        """書き込みを破棄する（出力先は変更しない）"""
+        self._discard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def _remove_quietly(file, path):
+    file.close()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
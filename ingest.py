@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""CSV読み込み - レポートで使う列だけを型指定して読み込む"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows ではピークRSSを取得しない
+    resource = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# 読み込む列・型を変えたら上げる（スナップショットの無効化用）
+INGEST_VERSION = 1
+
+# レポートで使う列（これ以外の列は読み込まない）
+USE_COLUMNS = ['タイトル', '価格', '販売数', '販売日', 'ブランド']
+
+# 販売数は '1' 以外の表記が混じるため文字列のまま読み込み、後で数値化する
+CSV_DTYPES = {
+    '価格': 'float64',
+    '販売数': 'object',
+    'ブランド': 'category',
+}
+
+
+def title_dtype():
+    """タイトル用の文字列型（pyarrow があればArrow格納、欠損値は従来通り NaN）"""
+    if pyarrow is None:
+        return 'object'
+    try:
+        return pd.StringDtype('pyarrow', na_value=np.nan)
+    except TypeError:  # pandas < 2.3
+        return 'string[pyarrow_numpy]'
+
+
+def read_sales_csv(path, **options):
+    """販売データCSVを読み込む（使う列のみ・ブランドはカテゴリ型・販売日は日時型）"""
+    return pd.read_csv(
+        path,
+        usecols=USE_COLUMNS,
+        dtype={**CSV_DTYPES, 'タイトル': title_dtype()},
+        parse_dates=['販売日'],
+        **options,
+    )
+
+
+def iter_sales_csv(path, chunk_rows):
+    """販売データCSVを chunk_rows 行ずつ読み込む（型は read_sales_csv と同じ。カテゴリはチャンクごと）"""
+    with read_sales_csv(path, chunksize=chunk_rows) as reader:
+        yield from reader
+
+
+def to_sorted_categorical(series, extra_values=()):
+    """カテゴリ型に変換する（カテゴリは値の昇順。groupby の並びを文字列列のときと揃えるため）
+
+    extra_values を渡すと、後から代入する値もカテゴリに加える。
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        values = set(series.cat.categories)
+    else:
+        values = set(series.dropna().unique())
+    values.update(v for v in extra_values if pd.notna(v))
+    return series.astype(pd.CategoricalDtype(sorted(values)))
+
+
+def peak_rss_mb():
+    """プロセスのピークRSS（MB）。取得できない環境では None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux はKB、macOS はバイト単位
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class LoadTimer:
+    """読み込み開始からの経過時間とピークRSSを表示する"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+
+    def report(self, label):
+        elapsed = time.perf_counter() - self.started
+        rss = peak_rss_mb()
+        rss_text = f'{rss:,.1f}MB' if rss is not None else '不明'
+        print(f"=== {label}: {elapsed:.3f}秒 / ピークRSS: {rss_text} ===")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""キーワードオートマトン - 全キーワード群を1つにまとめ、1回の走査でタイトルごとの全ヒットを取得する"""
+
+import re
+from itertools import chain
+
+import numpy as np
+
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick が無い環境ではキーワードごとの検索にフォールバック
+    ahocorasick = None
+
+
+class KeywordAutomaton:
+    """名前付きキーワード群から一度だけ構築するキーワードマッチャー
+
+    pyahocorasick があればAho-Corasickオートマトンでバッファを1回だけ走査する。
+    無い環境ではキーワードごとにバッファ全体を検索し、同じヒット列を返す。
+    同じキーワードが複数の群に含まれていても走査は1回で済む。
+    """
+
+    def __init__(self, groups):
+        self.keywords = []
+        self.groups = {}
+        keyword_ids = {}
+        for name, keywords in groups.items():
+            ids = []
+            for kw in keywords:
+                if kw not in keyword_ids:
+                    keyword_ids[kw] = len(self.keywords)
+                    self.keywords.append(kw)
+                ids.append(keyword_ids[kw])
+            self.groups[name] = np.array(ids, dtype=np.int64)
+        self._lengths = np.array([len(kw) for kw in self.keywords], dtype=np.int64)
+
+        self._automaton = None
+        self._regexes = None
+        if ahocorasick is not None and self.keywords:
+            self._automaton = ahocorasick.Automaton()
+            for kid, kw in enumerate(self.keywords):
+                self._automaton.add_word(kw, kid)
+            self._automaton.make_automaton()
+        else:
+            self._regexes = [re.compile(re.escape(kw)) for kw in self.keywords]
+
+    def scan(self, buffer):
+        """TitleBuffer を走査し、全ヒットを KeywordHits として返す"""
+        if self._automaton is not None:
+            found = np.fromiter(chain.from_iterable(self._automaton.iter(buffer.text)), dtype=np.int64).reshape(-1, 2)
+            keyword_ids = found[:, 1]
+            positions = found[:, 0] - self._lengths[keyword_ids] + 1
+        else:
+            positions = []
+            keyword_ids = []
+            for kid, regex in enumerate(self._regexes):
+                starts = [m.start() for m in regex.finditer(buffer.text)]
+                positions.extend(starts)
+                keyword_ids.extend([kid] * len(starts))
+            positions = np.array(positions, dtype=np.int64)
+            keyword_ids = np.array(keyword_ids, dtype=np.int64)
+        return KeywordHits(self, buffer.size, buffer.rows_of(positions), keyword_ids)
+
+
+class KeywordHits:
+    """走査結果（ヒットしたタイトルの行番号とキーワードIDの組）"""
+
+    def __init__(self, automaton, size, rows, keyword_ids):
+        self.automaton = automaton
+        self.size = size
+        self.rows = rows
+        self.keyword_ids = keyword_ids
+
+    def any(self, group):
+        """群のいずれかのキーワードを含むタイトルのマスク"""
+        mask = np.zeros(self.size, dtype=bool)
+        selected = np.isin(self.keyword_ids, self.automaton.groups[group])
+        mask[self.rows[selected]] = True
+        return mask
+
+    def first(self, group, ranks=None):
+        """群の中で最も優先度の高いヒットの順位をタイトルごとに返す（ヒットなしは -1）
+
+        ranks を省略した場合は群に登録した順が優先順位になる。
+        """
+        group_ids = self.automaton.groups[group]
+        ranks = np.arange(len(group_ids)) if ranks is None else np.asarray(ranks, dtype=np.int64)
+        no_hit = int(ranks.max()) + 1 if len(ranks) else 0
+        rank_of = np.full(len(self.automaton.keywords), no_hit, dtype=np.int64)
+        np.minimum.at(rank_of, group_ids, ranks)
+
+        hit_ranks = rank_of[self.keyword_ids]
+        selected = hit_ranks < no_hit
+        best = np.full(self.size, no_hit, dtype=np.int64)
+        np.minimum.at(best, self.rows[selected], hit_ranks[selected])
+        best[best == no_hit] = -1
+        return best
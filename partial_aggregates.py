@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""部分集計 - チャンクごとにグループ別の合算可能な集計値を作り、全体を読み込まずに統計を求める"""
+
+import numpy as np
+import pandas as pd
+
+from quantile_sketch import QuantileSketches
+from welford import MomentAccumulators
+
+# 合算方法ごとの集計列（first_row はグループが最初に出現した行番号。出現順の並べ替えに使う）
+SUM_MEASURES = ['count', 'sales', 'revenue']
+MIN_MEASURES = ['first_row']
+
+# 分位点スケッチを持つ列（スケッチ名: 元の列）
+SKETCH_COLUMNS = {'price': '価格', 'purchase_limit': '仕入れ上限'}
+
+
+class GroupPartials:
+    """キー列ごとの部分集計（件数・合計＋価格の平均・分散・最小・最大＋中央値用の分位点スケッチ）
+
+    fold でエンリッチ済みのチャンクを取り込み、merge で別プロセス・別チャンクの結果を合算できる。
+    保持するのはグループ数分の集計値とスケッチだけなので、入力の行数によらずメモリは一定。
+    keys は groupby と同じく列名1つか列名のリスト（グループのキーもそれに合わせてスカラーかタプル）。
+    table はキー列＋集計列のDataFrameで、価格の平均・分散（Welford）は MomentAccumulators、
+    スケッチは QuantileSketches で、いずれも table の行をグループ番号として持つ。
+    sketch_columns（スケッチ名: 元の列）を空にするとスケッチを持たず、中央値・仕入れ上限は NaN になる。
+    """
+
+    def __init__(self, keys, sketch_capacity=1024, dropna=True, sketch_columns=SKETCH_COLUMNS):
+        self.keys = keys
+        self.key_columns = [keys] if isinstance(keys, str) else list(keys)
+        self.sketch_capacity = sketch_capacity
+        self.dropna = dropna
+        self.sketch_columns = dict(sketch_columns)
+        self.table = None
+        self.moments = MomentAccumulators()
+        self.sketches = {name: QuantileSketches(0, sketch_capacity) for name in self.sketch_columns}
+        self.rows_seen = 0
+        # merge で受け取り、まだ table に合算していない部分集計とそのグループ数
+        self._pending = []
+        self._pending_groups = 0
+
+    def fold(self, df):
+        """エンリッチ済みのDataFrame（チャンク）を取り込む"""
+        frame = df.assign(_row=np.arange(self.rows_seen, self.rows_seen + len(df), dtype=np.int64))
+        self.rows_seen += len(df)
+        grouped = frame.groupby(self.key_columns, observed=True, sort=False, dropna=self.dropna)
+        table = pd.DataFrame({
+            'count': grouped.size(),
+            'sales': grouped['販売数'].sum(),
+            'revenue': grouped['売上'].sum(),
+            'first_row': grouped['_row'].min(),
+        }).reset_index()
+
+        codes = _group_codes(grouped)
+        chunk = GroupPartials(self.keys, self.sketch_capacity, self.dropna, self.sketch_columns)
+        chunk.table = table
+        chunk.moments = MomentAccumulators.from_values(df['価格'].to_numpy(dtype=np.float64), codes, len(table))
+        for name, column in self.sketch_columns.items():
+            chunk.sketches[name] = QuantileSketches.from_values(df[column].to_numpy(dtype=np.float64), codes,
+                                                                len(table), self.sketch_capacity)
+        return self.merge(chunk)
+
+    def merge(self, other):
+        """別の部分集計を合算する
+
+        受け取った部分集計はいったん溜めておき、溜めたグループ数が合算済みのグループ数以上になったときに
+        まとめて集計し直す。合算済みの表を取り込むたびに集計し直さないため、合算の手間の合計は
+        取り込んだグループ数に比例する（チャンク数 × グループ数にならない）。
+        """
+        other.settle()
+        if other.table is None:
+            return self
+        if self.table is None:
+            self.table = other.table
+            self.moments = other.moments
+            self.sketches = other.sketches
+            return self
+        self._pending.append(other)
+        self._pending_groups += len(other.table)
+        if self._pending_groups >= len(self.table):
+            self.settle()
+        return self
+
+    def settle(self):
+        """溜めている部分集計を table・moments・sketches に合算する（参照する前に呼ぶ）"""
+        if not self._pending:
+            return self
+        pending = self._pending
+        self._pending = []
+        self._pending_groups = 0
+        combined = GroupPartials(self.keys, self.sketch_capacity, False, self.sketch_columns)
+        combined.table = pd.concat([self.table] + [part.table for part in pending], ignore_index=True)
+        combined.moments = self.moments.concat(*(part.moments for part in pending))
+        combined.sketches = {name: self.sketches[name].concat(*(part.sketches[name] for part in pending))
+                             for name in self.sketch_columns}
+        merged = combined.rollup(self.keys, dropna=False)
+        self.table = merged.table
+        self.moments = merged.moments
+        self.sketches = merged.sketches
+        return self
+
+    @property
+    def sketch_points(self):
+        """スケッチが保持している代表点の数（全スケッチの合計）"""
+        self.settle()
+        return sum(len(sketch.means) for sketch in self.sketches.values())
+
+    def rollup(self, keys, sort=False, dropna=True):
+        """キー列を keys に絞って集計し直した GroupPartials を返す（keys=[] なら全体で1グループ）
+
+        並びは sort=True ならキーの昇順、False ならグループが最初に出現した順。
+        """
+        self.settle()
+        result = GroupPartials(keys, self.sketch_capacity, dropna, self.sketch_columns)
+        if self.table is None:
+            return result
+        if result.key_columns:
+            grouped = self.table.groupby(result.key_columns, observed=True, sort=sort, dropna=dropna)
+            codes = _group_codes(grouped)
+            size = grouped.ngroups
+        else:
+            codes = np.zeros(len(self.table), dtype=np.int64)
+            size = 1 if len(self.table) else 0
+
+        valid = codes >= 0
+        table = self.table[valid]
+        valid_codes = codes[valid]
+        by_code = table.groupby(valid_codes)
+        _, first_positions = np.unique(valid_codes, return_index=True)
+        result.table = pd.concat([
+            table[result.key_columns].iloc[first_positions].reset_index(drop=True),
+            by_code[SUM_MEASURES].sum().reset_index(drop=True),
+            by_code[MIN_MEASURES].min().reset_index(drop=True),
+        ], axis=1)
+        if not sort:
+            # グループ番号を出現順に振り直す
+            order = np.argsort(result.table['first_row'].to_numpy(), kind='stable')
+            result.table = result.table.iloc[order].reset_index(drop=True)
+            renumber = np.empty(size, dtype=np.int64)
+            renumber[order] = np.arange(size)
+            codes = np.where(codes >= 0, renumber[codes], -1)
+        result.moments = self.moments.regroup(codes, size)
+        for name in self.sketch_columns:
+            result.sketches[name] = self.sketches[name].regroup(codes, size)
+        return result
+
+    def groups(self):
+        """グループのキー（table の行と同じ並び。keys が列名1つならスカラー、リストならタプル）"""
+        self.settle()
+        if self.table is None:
+            return []
+        columns = [self.table[col].tolist() for col in self.key_columns]
+        if isinstance(self.keys, str):
+            return columns[0]
+        return list(zip(*columns)) if columns else [()] * len(self.table)
+
+    def columns(self, cv_min_count=0):
+        """グループごとの統計を列ごとの配列で返す（{列名: ndarray}、table の行と同じ並び）
+
+        キー列と stats() の各統計に加え、標準偏差 std を含む。グループ数が多くても dict を作らずに済む。
+        """
+        self.settle()
+        if self.table is None:
+            return {}
+        table = self.table
+        count = table['count'].to_numpy(dtype=np.int64)
+        # 標本標準偏差（ddof=1）。1件のグループは pandas の std と同じく NaN
+        std = self.moments.std()
+        mean = self.moments.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cv = np.where((mean > 0) & (count >= cv_min_count), std / mean, 0.0)
+        columns = {key: table[key].to_numpy() for key in self.key_columns}
+        columns.update({
+            'count': count,
+            'sales': table['sales'].to_numpy(dtype=np.int64),
+            'revenue': table['revenue'].to_numpy(dtype=np.float64),
+            'avg_price': mean,
+            'median_price': self._median('price'),
+            'min_price': self.moments.min,
+            'max_price': self.moments.max,
+            'std': std,
+            'cv': cv,
+            'purchase_limit': self._median('purchase_limit'),
+        })
+        return columns
+
+    def _median(self, name):
+        if name not in self.sketches:
+            return np.full(len(self.table), np.nan)
+        return self.sketches[name].median()
+
+    def stats(self, cv_min_count=0):
+        """グループごとの統計（get_brand_stats と同じ形の dict）
+
+        cv_min_count 未満の件数のグループは CV を 0 とする。
+        """
+        if self.table is None:
+            return {}
+        columns = self.columns(cv_min_count)
+        names = ['count', 'sales', 'revenue', 'avg_price', 'median_price', 'min_price', 'max_price', 'std',
+                 'purchase_limit']
+        result = {}
+        for group, n, sales, revenue, avg, median, low, high, sd, limit in zip(
+                self.groups(), *(columns[name].tolist() for name in names)):
+            result[group] = {
+                'count': n,
+                'sales': sales,
+                'revenue': revenue,
+                'avg_price': avg,
+                'median_price': median,
+                'min_price': low,
+                'max_price': high,
+                'cv': sd / avg if avg > 0 and n >= cv_min_count else 0,
+                'purchase_limit': limit,
+            }
+        return result
+
+
+def _group_codes(grouped):
+    """行ごとのグループ番号（除外された行は -1）"""
+    return grouped.ngroup().fillna(-1).to_numpy(dtype=np.int64)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""価格帯ヒストグラム - 価格を1回だけビンに割り当て、全グループの価格帯分布をまとめて数える"""
+
+import numpy as np
+import pandas as pd
+
+
+class BinScheme:
+    """価格帯の区切りとラベル（pd.cut と同じく右閉区間 (下限, 上限]。下限以下・欠損値はどのビンにも入らない）"""
+
+    def __init__(self, edges, labels):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.labels = list(labels)
+        if len(self.labels) != len(self.edges) - 1:
+            raise ValueError(f'ラベル数({len(self.labels)})が区間数({len(self.edges) - 1})と一致しません')
+
+    def bin_codes(self, values):
+        """値ごとのビン番号（どのビンにも入らない値は -1）"""
+        codes = np.searchsorted(self.edges, np.asarray(values, dtype=np.float64), side='left') - 1
+        codes[codes >= len(self.labels)] = -1
+        return codes
+
+    def counts(self, values):
+        """価格帯ごとの件数（{ラベル: 件数}、件数0の価格帯も含む）"""
+        codes = self.bin_codes(values)
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.labels))
+        return dict(zip(self.labels, counts.tolist()))
+
+    def grouped_counts(self, values, groups):
+        """グループごとの価格帯分布（{グループ: {ラベル: 件数}}、グループは出現順）
+
+        グループ番号 × ビン番号を1本の番号にして bincount するため、グループ数によらず1回の走査で済む。
+        """
+        group_codes, uniques = pd.factorize(pd.Series(groups))
+        bins = len(self.labels)
+        codes = self.bin_codes(values)
+        valid = (group_codes >= 0) & (codes >= 0)
+        flat = group_codes[valid] * bins + codes[valid]
+        counts = np.bincount(flat, minlength=len(uniques) * bins).reshape(len(uniques), bins)
+        return {group: dict(zip(self.labels, row)) for group, row in zip(uniques.tolist(), counts.tolist())}
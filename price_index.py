@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""グループ別価格インデックス - グループ内で昇順に並べた価格を1本の配列とオフセットで持ち、分位点を位置の計算で、価格帯分布を二分探索で答える"""
+
+import numpy as np
+
+
+class PriceIndex:
+    """グループ（ブランド、ブランド×アイテムタイプ等）ごとの昇順ソート済み価格
+
+    values[offsets[i]:offsets[i + 1]] がグループ i の価格（昇順）。作成時に1回ソートするだけで、
+    全グループの分位点は位置の計算、グループの価格帯分布は searchsorted で求まり、
+    DataFrame の絞り込みや再走査は不要。欠損値は除く。グループは groupby と同じく出現順。
+    """
+
+    def __init__(self, groups, values, offsets):
+        self.groups = list(groups)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.counts = np.diff(self.offsets)
+        self._positions = {group: i for i, group in enumerate(self.groups)}
+
+    @classmethod
+    def from_frame(cls, df, keys, value='価格'):
+        """df を keys でグループ分けした value のインデックス（keys が列名1つならキーはスカラー、リストならタプル）"""
+        key_columns = [keys] if isinstance(keys, str) else list(keys)
+        grouped = df.groupby(key_columns, observed=True, sort=False)
+        groups = grouped.size().index.tolist()
+        if not isinstance(keys, str) and len(key_columns) == 1:
+            groups = [(group,) for group in groups]
+
+        values = df[value].to_numpy(dtype=np.float64)
+        codes = grouped.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+        keep = (codes >= 0) & ~np.isnan(values)
+        codes, values = codes[keep], values[keep]
+        order = np.lexsort((values, codes))
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(groups)))])
+        return cls(groups, values[order], offsets)
+
+    def __len__(self):
+        return len(self.groups)
+
+    def __contains__(self, group):
+        return group in self._positions
+
+    def prices(self, group):
+        """グループの価格（昇順の配列）"""
+        i = self._position(group)
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    def quantiles(self, q):
+        """全グループの分位点の配列（pandas の quantile と同じ線形補間。0.5 は median と同じ計算）"""
+        counts = self.counts
+        with np.errstate(invalid='ignore'):
+            if q == 0.5:
+                lower = self.offsets[:-1] + (counts - 1) // 2
+                upper = self.offsets[:-1] + counts // 2
+                result = (self._at(lower) + self._at(upper)) / 2
+            else:
+                position = q * (counts - 1)
+                lower = np.floor(position).astype(np.int64)
+                upper = np.minimum(lower + 1, counts - 1)
+                low_values = self._at(self.offsets[:-1] + lower)
+                high_values = self._at(self.offsets[:-1] + upper)
+                result = low_values + (high_values - low_values) * (position - lower)
+        result[counts == 0] = np.nan
+        return result
+
+    def histogram(self, group, scheme):
+        """グループの価格帯分布（BinScheme と同じ右閉区間。{ラベル: 件数}）"""
+        at_or_below = np.searchsorted(self.prices(group), scheme.edges, side='right')
+        return dict(zip(scheme.labels, np.diff(at_or_below).tolist()))
+
+    def _position(self, group):
+        try:
+            return self._positions[group]
+        except KeyError:
+            raise KeyError(f'インデックスにないグループです: {group}') from None
+
+    def _at(self, positions):
+        """位置の値（空のインデックス・空のグループ用に範囲外は NaN）"""
+        if not len(self.values):
+            return np.full(len(positions), np.nan)
+        return self.values[np.clip(positions, 0, len(self.values) - 1)]
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""仕入れ上限シナリオ - 為替レート × 手数料率 × 送料の組み合わせごとに、全グループの仕入れ上限中央値とスコアを一括で求める"""
+
+import numpy as np
+
+
+class PurchaseScenarios:
+    """グループ × 為替レート × 手数料率 × 送料 の仕入れ上限中央値とおすすめスコア（仕入れ上限 × 販売数）
+
+    仕入れ上限 = 価格 × 為替レート × (1 − 手数料率) − 送料 は価格の単調増加な一次式なので、
+    中央値は「中央値価格を同じ式で変換した値」に等しい。そのため全行を持たずに、
+    グループの中央値価格 (G,) をシナリオの軸 (R,), (F,), (S,) にブロードキャストするだけで
+    全シナリオの値 (G, R, F, S) が1回で求まる（チャンク集計の統計からも作れる）。
+    """
+
+    def __init__(self, groups, median_prices, sales, exchange_rates, fee_rates, shipping_jpy):
+        self.groups = list(groups)
+        self.exchange_rates = np.asarray(exchange_rates, dtype=np.float64)
+        self.fee_rates = np.asarray(fee_rates, dtype=np.float64)
+        self.shipping_jpy = np.asarray(shipping_jpy, dtype=np.float64)
+        if (self.exchange_rates <= 0).any() or (self.fee_rates >= 1).any():
+            raise ValueError('為替レートは正、手数料率は1未満で指定してください')
+
+        prices = np.asarray(median_prices, dtype=np.float64)[:, None, None, None]
+        rates = self.exchange_rates[None, :, None, None]
+        keep = (1 - self.fee_rates)[None, None, :, None]
+        shipping = self.shipping_jpy[None, None, None, :]
+        self.purchase_limits = prices * rates * keep - shipping
+        self.scores = self.purchase_limits * np.asarray(sales, dtype=np.float64)[:, None, None, None]
+
+    @classmethod
+    def from_stats(cls, group_stats, exchange_rates, fee_rates, shipping_jpy):
+        """GroupStatsEngine の {グループ: 統計} から作る（median_price と sales を使う）"""
+        groups = list(group_stats)
+        median_prices = [group_stats[group]['median_price'] for group in groups]
+        sales = [group_stats[group]['sales'] for group in groups]
+        return cls(groups, median_prices, sales, exchange_rates, fee_rates, shipping_jpy)
+
+    @property
+    def shape(self):
+        return self.purchase_limits.shape
+
+    def scenario(self, exchange_rate, fee_rate, shipping_jpy):
+        """1つのシナリオの {グループ: (仕入れ上限中央値, スコア)}（グリッドにない値は KeyError）"""
+        index = (slice(None), _axis_index(self.exchange_rates, exchange_rate, '為替レート'),
+                 _axis_index(self.fee_rates, fee_rate, '手数料率'), _axis_index(self.shipping_jpy, shipping_jpy, '送料'))
+        return dict(zip(self.groups, zip(self.purchase_limits[index].tolist(), self.scores[index].tolist())))
+
+
+def _axis_index(axis, value, label):
+    matches = np.flatnonzero(np.isclose(axis, value))
+    if not len(matches):
+        raise KeyError(f'{label} {value} はシナリオにありません')
+    return int(matches[0])
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""分位点スケッチ - 値の分布を有限個の重み付き代表点で保持し、チャンクをまたいで中央値を求める"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+
+# capacity_for_error が誤差を保証する1グループの最大の重み（行数）
+MAX_GROUP_COUNT = 2 ** 32
+
+
+def capacity_for_error(rank_error, max_count=MAX_GROUP_COUNT):
+    """許容する順位誤差（0.01 なら分位点の順位のずれが ±1% 以内）から1レベルあたりの代表点の上限数を決める
+
+    QuantileSketches の順位誤差は、チャンクの畳み込み・マージの回数や順序によらず
+    (log2(n/capacity) + 3) / capacity 以下になる（n はグループの行数）。
+    max_count 行までのグループでこれが rank_error 以下になる最小の capacity を返す。
+    None なら圧縮しない（厳密値）。
+    """
+    if rank_error is None:
+        return None
+    if not 0 < rank_error < 1:
+        raise ValueError(f'順位誤差は 0 より大きく 1 未満で指定してください: {rank_error}')
+    capacity = math.ceil(3 / rank_error)
+    while (max(math.log2(max_count / capacity), 0) + 3) / capacity > rank_error:
+        capacity += 1
+    return capacity
+
+
+class QuantileSketches:
+    """グループごとのマージ可能な分位点スケッチを列指向でまとめて持つ
+
+    全グループの代表点（値と重み）を1本の配列に group 番号順で並べて保持し、
+    作成・グループの付け替え（ロールアップ）・圧縮・分位点の計算をグループ横断で一括に行う。
+    各グループは capacity 個までは値をそのまま保持するため、小さいグループの分位点は
+    pandas の median / quantile と同じ厳密値になる。代表点の重みは 2 のべき乗（レベル）で、
+    同じグループ・同じレベルの代表点が capacity を超えたら値の順に並べて1つおきに残し、
+    重みを2倍にして1つ上のレベルに上げる（KLL スケッチの決定的な圧縮と同じ）。
+    レベル h の1回の圧縮で順位がずれるのは重み 2^h 以内で、レベル h を通る重みは行数 n 以下のため、
+    畳み込み・マージの回数や順序によらず順位誤差は (log2(n/capacity) + 3) / capacity 以下になる。
+    1グループの代表点は capacity × (log2(n/capacity) + 1) 個以下。
+    capacity=None なら圧縮せず常に厳密値を返す（全行がメモリにある場合用）。
+    許容誤差から capacity を決めるには capacity_for_error を使う。
+    圧縮で生じたずれ（重み単位）はグループごとに errors に積み上げ、
+    rank_error_bound で分位点の順位誤差の上限として返す。
+    """
+
+    def __init__(self, size=0, capacity=1024):
+        self.size = size
+        self.capacity = capacity
+        self.means = np.empty(0, dtype=np.float64)
+        self.weights = np.empty(0, dtype=np.float64)
+        self.groups = np.empty(0, dtype=np.int64)
+        self.exact = np.ones(size, dtype=bool)
+        self.errors = np.zeros(size, dtype=np.float64)
+
+    @classmethod
+    def from_values(cls, values, codes, size, capacity=1024):
+        """行ごとの値とグループ番号からスケッチを作る（欠損値と番号 -1 の行は無視）"""
+        values = np.asarray(values, dtype=np.float64)
+        codes = np.asarray(codes, dtype=np.int64)
+        keep = (codes >= 0) & ~np.isnan(values)
+        order = np.argsort(codes[keep], kind='stable')
+        sketches = cls(size, capacity)
+        sketches.means = values[keep][order]
+        sketches.weights = np.ones(len(sketches.means))
+        sketches.groups = codes[keep][order]
+        sketches._compress()
+        return sketches
+
+    def concat(self, *others):
+        """others のグループを順に後ろに連結したスケッチ（グループ番号はそれより前のグループ数だけずらす）"""
+        parts = [self, *others]
+        offsets = np.cumsum([0] + [part.size for part in parts])
+        result = QuantileSketches(int(offsets[-1]), self.capacity)
+        result.means = np.concatenate([part.means for part in parts])
+        result.weights = np.concatenate([part.weights for part in parts])
+        result.groups = np.concatenate([part.groups + offset for part, offset in zip(parts, offsets)])
+        result.exact = np.concatenate([part.exact for part in parts])
+        result.errors = np.concatenate([part.errors for part in parts])
+        return result
+
+    def regroup(self, mapping, size):
+        """グループ i を mapping[i] に付け替えてマージする（-1 のグループは捨てる）"""
+        mapping = np.asarray(mapping, dtype=np.int64)
+        new_groups = mapping[self.groups]
+        keep = new_groups >= 0
+        order = np.argsort(new_groups[keep], kind='stable')
+        result = QuantileSketches(size, self.capacity)
+        result.means = self.means[keep][order]
+        result.weights = self.weights[keep][order]
+        result.groups = new_groups[keep][order]
+        # 近似済みのグループを1つでも含むと近似
+        mapped = mapping >= 0
+        approximate = np.bincount(mapping[mapped], weights=~self.exact[mapped], minlength=size)
+        result.exact = approximate == 0
+        # マージしたグループのずれは足し合わせる
+        result.errors = np.bincount(mapping[mapped], weights=self.errors[mapped], minlength=size)
+        result._compress()
+        return result
+
+    def quantile(self, q):
+        """グループごとの分位点の配列（値がないグループは NaN）"""
+        result = np.full(self.size, np.nan)
+        exact_rows = self.exact[self.groups]
+        if exact_rows.any():
+            grouped = pd.Series(self.means[exact_rows]).groupby(self.groups[exact_rows])
+            # 0.5 は pandas の median と同じ計算（偶数個なら中央2値の平均）
+            values = grouped.median() if q == 0.5 else grouped.quantile(q)
+            result[values.index.to_numpy()] = values.to_numpy()
+        offsets = np.searchsorted(self.groups, np.arange(self.size + 1))
+        for group in np.flatnonzero(~self.exact):
+            start, end = offsets[group], offsets[group + 1]
+            if start == end:
+                continue
+            # 代表点を累積重みの中点に置き、その間を線形補間する
+            order = np.argsort(self.means[start:end], kind='stable')
+            means = self.means[start:end][order]
+            weights = self.weights[start:end][order]
+            centers = np.cumsum(weights) - weights / 2
+            result[group] = np.interp(q * weights.sum(), centers, means)
+        return result
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def rank_error_bound(self):
+        """グループごとの分位点の順位誤差の上限（総重みに対する割合。厳密値のグループは 0）
+
+        圧縮・マージで積み上げたずれに、代表点の間を補間するずれ（最大の代表点の重み）を足す。
+        """
+        totals = np.bincount(self.groups, weights=self.weights, minlength=self.size)
+        heaviest = np.zeros(self.size)
+        np.maximum.at(heaviest, self.groups, self.weights)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            bound = (self.errors + heaviest) / totals
+        return np.where(self.exact | (totals == 0), 0.0, bound)
+
+    def _compress(self):
+        """代表点が capacity を超えたグループ・レベルを、下のレベルから順に1つおきに間引いて上のレベルに上げる"""
+        if self.capacity is None or not len(self.weights):
+            return
+        levels = np.frexp(self.weights)[1] - 1
+        level = 0
+        while level <= levels.max():
+            at_level = levels == level
+            counts = np.bincount(self.groups[at_level], minlength=self.size)
+            full = counts > self.capacity
+            if full.any():
+                self._halve(np.flatnonzero(at_level & full[self.groups]), counts, level)
+                levels = np.frexp(self.weights)[1] - 1
+                self.errors[full] += 2.0 ** level
+                self.exact &= ~full
+            level += 1
+
+    def _halve(self, items, counts, level):
+        """items（グループ順）の代表点をグループごとに値の順に並べ、組ごとに1つを重み2倍で残す
+
+        奇数個のグループは最大の値を1つそのレベルに残す。残す側は偏らないようにレベルごとに入れ替える。
+        """
+        order = np.lexsort((self.means[items], self.groups[items]))
+        items = items[order]
+        groups = self.groups[items]
+        first = np.searchsorted(groups, groups, side='left')
+        position = np.arange(len(items)) - first
+        paired = position < counts[groups] - counts[groups] % 2
+        promoted = items[paired & (position % 2 == level % 2)]
+        dropped = items[paired & (position % 2 != level % 2)]
+        self.weights[promoted] *= 2
+        keep = np.ones(len(self.weights), dtype=bool)
+        keep[dropped] = False
+        self.means = self.means[keep]
+        self.weights = self.weights[keep]
+        self.groups = self.groups[keep]
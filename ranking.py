@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""おすすめランキング - グループ別統計の列に対してスコア関数と絞り込み条件を差し替えて Top-k を選ぶ"""
+
+import numpy as np
+
+
+# スコア関数（列の dict → スコアの配列）
+def limit_times_sales(columns):
+    """仕入れ上限 × 販売数（従来のおすすめスコア）"""
+    return columns['purchase_limit'] * columns['sales']
+
+
+# 絞り込み条件（列の dict → 残す行の bool 配列）
+def at_most(column, limit):
+    return lambda columns: columns[column] <= limit
+
+
+def at_least(column, limit):
+    return lambda columns: columns[column] >= limit
+
+
+def equals(column, value):
+    return lambda columns: columns[column] == value
+
+
+# 回転重視（CV <= 0.5、仕入上限 <= 30000、販売数 >= 3）
+ROTATION_FILTERS = [at_most('cv', 0.5), at_most('purchase_limit', 30000), at_least('sales', 3)]
+
+
+class RankingEngine:
+    """グループ × 統計の列（GroupPartials.columns / GroupStatsEngine.columns の形）からのランキング
+
+    スコア・絞り込みは全グループに対する配列演算で1回ずつ計算し、上位 k 件は argpartition で
+    選んでから k 件だけを並べるため、グループ数が数十万でも全件のソートは行わない。
+    同じスコアは元の並び順を保つ（list.sort(reverse=True) と同じ順位）。
+    """
+
+    def __init__(self, columns):
+        self.columns = dict(columns)
+        self.size = len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def mask(self, filters=()):
+        """すべての絞り込み条件を満たす行"""
+        keep = np.ones(self.size, dtype=bool)
+        for predicate in filters:
+            keep &= np.asarray(predicate(self.columns), dtype=bool)
+        return keep
+
+    def top_indices(self, k, score=limit_times_sales, filters=()):
+        """スコア上位 k 件の行番号（スコアの降順）とそのスコア"""
+        scores = np.asarray(score(self.columns), dtype=np.float64)
+        candidates = np.flatnonzero(self.mask(filters) & ~np.isnan(scores))
+        candidate_scores = scores[candidates]
+        if k < len(candidates):
+            # k 番目のスコアより大きいものは全部、同点は元の並びで先頭から残りの枠だけ採る
+            kth = candidate_scores[np.argpartition(-candidate_scores, k - 1)[k - 1]]
+            above = candidate_scores > kth
+            ties = np.flatnonzero(candidate_scores == kth)[:k - above.sum()]
+            chosen = np.sort(np.concatenate([np.flatnonzero(above), ties]))
+            candidates, candidate_scores = candidates[chosen], candidate_scores[chosen]
+        order = np.lexsort((candidates, -candidate_scores))
+        return candidates[order], candidate_scores[order]
+
+    def top(self, k, score=limit_times_sales, filters=(), columns=None):
+        """スコア上位 k 件を dict のリストで返す（columns を省略すると全列＋score）"""
+        indices, scores = self.top_indices(k, score, filters)
+        names = list(self.columns) if columns is None else list(columns)
+        values = [self.columns[name][indices].tolist() for name in names]
+        return [dict(zip(names, row), score=value) for row, value in zip(zip(*values), scores.tolist())]
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""埋め込みデータ - 表の行・グラフの配列を重複のない1つのJSONにまとめ、ブラウザ側で描画する（件数の多い表は仮想スクロール。OUTPUT_MODE = 'data' 用）"""
+
+import json
+import math
+import re
+
+import numpy as np
+
+# ブラウザ側で対応している書式（符号・桁区切り・小数点以下の桁数）
+_SPEC = re.compile(r'\+?,?(?:\.(\d+)f)?')
+
+# 列の種類（値をそのまま持つ列 / 文字列表のインデックスを持つ列）
+_RAW = 0
+_STRINGS = 1
+
+
+class ReportPayload:
+    """表・グラフのデータを列単位で1か所に集めた埋め込みデータ
+
+    表は行ごとのHTMLの代わりに、テンプレートが使う値だけを列の配列で持つ（テンプレート自体も1回だけ）。
+    文字列は全体で1つの文字列表に集め、列には表のインデックスを入れる。
+    同じ列・先頭部分が一致する列（Top20 とブランド一覧、Top10 のグラフ等）は1本の配列を共有する。
+    列の参照は [配列の番号, 件数, 種類]。小数は書式の桁数で丸めてから持つ（表示は Python の format と同じ）。
+    """
+
+    def __init__(self):
+        self.strings = []
+        self.templates = []
+        self.tables = {}
+        self.series = []
+        self._string_codes = {}
+        self._column_texts = []
+        self._template_ids = {}
+        self._series_ids = {}
+
+    def table(self, key, template, rows, **common):
+        """表の行を追加し、tbody に置くプレースホルダを返す（描画は CLIENT_SCRIPT）"""
+        if key in self.tables:
+            raise ValueError(f'表のキーが重複しています: {key}')
+        fields = {}
+        for name, spec, _ in template.fields:
+            if not _SPEC.fullmatch(spec):
+                raise ValueError(f'ブラウザ側で描画できない書式です: {{{name}:{spec}}}')
+            if name in fields or (rows and not all(name in row for row in rows)):
+                continue
+            precision = _SPEC.fullmatch(spec).group(1)
+            values = [_rounded(row[name], precision) for row in rows]
+            fields[name] = self._column(values)
+        missing = [name for name, _, _ in template.fields if name not in fields and name not in common]
+        if missing and rows:
+            raise KeyError(f'表の値がありません: {", ".join(missing)}')
+        self.tables[key] = {
+            'template': self._template(template),
+            'length': len(rows),
+            'fields': fields,
+            'common': {name: _json_value(common[name]) for name, _, _ in template.fields
+                       if name not in fields and name in common},
+        }
+        return f'<template data-table="{key}"></template>'
+
+    def virtual_table(self, key, template, rows, columns, **common):
+        """並べ替え・絞り込みできる仮想スクロールの表を追加し、プレースホルダを返す
+
+        columns は見出し（th）の順に、その列の並べ替え・絞り込みに使う値の名前（None は対象外）。
+        ブラウザ側では見えている行だけを描画するため、行数が多くてもHTML・DOMは大きくならない。
+        """
+        placeholder = self.table(key, template, rows, **common)
+        table = self.tables[key]
+        unknown = [name for name in columns if name is not None and name not in table['fields']]
+        if unknown and rows:
+            raise KeyError(f'並べ替えに使う値が行にありません: {", ".join(unknown)}')
+        table['columns'] = list(columns)
+        return placeholder
+
+    def add_series(self, values):
+        """グラフ用の配列を追加し、reportSeries() に渡す番号を返す（同じ配列は同じ番号）"""
+        ref = tuple(self._column([_json_value(value) for value in values]))
+        if ref not in self._series_ids:
+            self._series_ids[ref] = len(self.series)
+            self.series.append(list(ref))
+        return self._series_ids[ref]
+
+    def to_json(self):
+        payload = {
+            'strings': self.strings,
+            'columns': [json.loads(text) for text in self._column_texts],
+            'templates': self.templates,
+            'tables': self.tables,
+            'series': self.series,
+        }
+        return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), allow_nan=False)
+
+    def html(self):
+        """埋め込みデータと描画スクリプト（</body> の直前に置く）"""
+        data = self.to_json().replace('</', '<\\/')
+        return (f'    <script type="application/json" id="report-data">{data}</script>\n'
+                f'    <script>{CLIENT_SCRIPT}    </script>\n')
+
+    def _template(self, template):
+        if template.source not in self._template_ids:
+            self._template_ids[template.source] = len(self.templates)
+            fields = [[name, spec, conversion] for (name, spec, _), conversion
+                      in zip(template.fields, template.conversions)]
+            # 行の間の改行・インデントは表示に影響しないため詰める
+            literals = [re.sub(r'>\s+<', '><', literal) for literal in template.literals]
+            if literals:
+                literals[0] = literals[0].lstrip()
+                literals[-1] = literals[-1].rstrip()
+            self.templates.append([literals, fields])
+        return self._template_ids[template.source]
+
+    def _column(self, values):
+        """値の列を配列の表に追加し、参照 [配列の番号, 件数, 種類] を返す"""
+        kind = _RAW
+        if values and all(isinstance(value, str) for value in values):
+            kind = _STRINGS
+            values = [self._string_code(value) for value in values]
+        text = json.dumps(values, ensure_ascii=False, separators=(',', ':'), allow_nan=False)
+        for i, existing in enumerate(self._column_texts):
+            if existing == text or existing.startswith(text[:-1] + ','):
+                return [i, len(values), kind]
+            if text.startswith(existing[:-1] + ','):
+                # 既存の列が先頭部分なら、長い方に置き換えて共有する
+                self._column_texts[i] = text
+                return [i, len(values), kind]
+        self._column_texts.append(text)
+        return [len(self._column_texts) - 1, len(values), kind]
+
+    def _string_code(self, text):
+        code = self._string_codes.get(text)
+        if code is None:
+            code = self._string_codes[text] = len(self.strings)
+            self.strings.append(text)
+        return code
+
+
+def _json_value(value):
+    """JSON に書ける値（numpy のスカラーは Python の値に、NaN・無限大は null に）"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _rounded(value, precision):
+    """書式の桁数で丸めた値（format と同じ丸めになるため、ブラウザ側の toFixed で同じ表示になる）"""
+    value = _json_value(value)
+    if precision is not None and isinstance(value, float):
+        return round(value, int(precision))
+    return value
+
+
+# 仮想スクロールの表のスタイル（OUTPUT_MODE = 'data' のときにCSSに追加する）
+CLIENT_STYLE = '''
+.virtual-table { max-height: 600px; overflow-y: auto; }
+th.sortable { cursor: pointer; user-select: none; }
+.column-filter {
+    display: block;
+    width: 100%;
+    min-width: 60px;
+    margin-top: 4px;
+    padding: 2px 4px;
+    font-size: 0.9em;
+    font-weight: normal;
+    border: 1px solid var(--border-color);
+    border-radius: 3px;
+    background: var(--bg-card);
+    color: var(--text-primary);
+}
+'''
+
+# 埋め込みデータから表を描画し、グラフ用の配列を復元するスクリプト
+CLIENT_SCRIPT = '''
+    const reportData = JSON.parse(document.getElementById('report-data').textContent);
+
+    function reportColumn(ref) {
+        const values = reportData.columns[ref[0]].slice(0, ref[1]);
+        return ref[2] === 1 ? values.map(code => reportData.strings[code]) : values;
+    }
+
+    function reportSeries(id) {
+        return reportColumn(reportData.series[id]);
+    }
+
+    // Python の format と同じ表示（符号・桁区切り・小数点以下の桁数のみ対応）
+    function formatReportValue(value, spec) {
+        if (value === null) return 'nan';
+        const [, sign, comma, digits] = /^(\\+?)(,?)(?:\\.(\\d+)f)?$/.exec(spec);
+        let text = digits === undefined ? String(value) : value.toFixed(Number(digits));
+        if (comma) text = text.replace(/^(-?)(\\d+)/, (_, minus, int) => minus + int.replace(/\\B(?=(\\d{3})+$)/g, ','));
+        return sign && !text.startsWith('-') ? '+' + text : text;
+    }
+
+    function escapeReportText(text, attribute) {
+        text = text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+        return attribute ? text.replace(/"/g, '&quot;') : text;
+    }
+
+    function reportRows(table) {
+        if (!table.values) {
+            table.values = {};
+            Object.entries(table.fields).forEach(([name, ref]) => { table.values[name] = reportColumn(ref); });
+        }
+        return table.values;
+    }
+
+    // indices の行を描画する（表の行番号の配列）
+    function renderReportRows(table, indices) {
+        const [literals, fields] = reportData.templates[table.template];
+        const values = reportRows(table);
+        const columns = fields.map(([name]) => values[name] || null);
+        const html = [];
+        for (const i of indices) {
+            fields.forEach(([name, spec, conversion], j) => {
+                const value = columns[j] ? columns[j][i] : table.common[name];
+                let text = formatReportValue(value, spec);
+                if (conversion !== 's' && typeof value === 'string') text = escapeReportText(text, conversion === 'a');
+                html.push(literals[j], text);
+            });
+            if (literals.length > fields.length) html.push(literals[fields.length]);
+        }
+        return html.join('');
+    }
+
+    // 絞り込み条件（数値の列は「>=100」「<0.5」「=3」、文字列の列は部分一致）
+    function reportFilter(text) {
+        const needle = text.trim().toLowerCase();
+        const match = /^(<=|>=|<|>|=)?\s*(-?[\d,]*\.?\d+)$/.exec(needle);
+        const limit = match ? Number(match[2].replace(/,/g, '')) : NaN;
+        const compare = {
+            '<': value => value < limit, '<=': value => value <= limit,
+            '>': value => value > limit, '>=': value => value >= limit, '=': value => value === limit,
+        }[match ? match[1] || '=' : '='];
+        return value => typeof value === 'number' && match ? compare(value)
+            : String(value).toLowerCase().includes(needle);
+    }
+
+    function compareReportValues(a, b) {
+        if (a === null || b === null) return (a === null) - (b === null);
+        return typeof a === 'string' ? a.localeCompare(b, 'ja') : a - b;
+    }
+
+    // 仮想スクロールの表（見えている行だけを描画する。並べ替え・絞り込みは行番号の配列を作り直すだけ）
+    const VIRTUAL_OVERSCAN = 10;
+    function setupVirtualTable(placeholder, table) {
+        const tbody = placeholder.parentNode;
+        const container = tbody.closest('.table-container');
+        const headers = [...tbody.parentNode.querySelectorAll('thead th')];
+        const values = reportRows(table);
+        const columns = table.columns.map(name => name === null ? null : values[name]);
+        const filters = columns.map(() => null);
+        const all = Array.from({ length: table.length }, (_, i) => i);
+        let view = all, sortColumn = -1, descending = false, rowHeight = 40, measured = false, frame = 0;
+
+        function render() {
+            frame = 0;
+            const count = Math.ceil((container.clientHeight || 600) / rowHeight) + 2 * VIRTUAL_OVERSCAN;
+            const first = Math.max(0, Math.min(Math.floor(container.scrollTop / rowHeight) - VIRTUAL_OVERSCAN, view.length - count));
+            const last = Math.min(view.length, first + count);
+            tbody.innerHTML = `<tr style="height: ${first * rowHeight}px"></tr>`
+                + renderReportRows(table, view.slice(first, last))
+                + `<tr style="height: ${(view.length - last) * rowHeight}px"></tr>`;
+            // 行の高さは最初に表示されたときに実際の行から求める（非表示のタブでは測れない）
+            const rows = [...tbody.rows].slice(1, -1);
+            if (!measured && rows.length && rows[0].offsetHeight) {
+                measured = true;
+                rowHeight = rows.reduce((sum, row) => sum + row.offsetHeight, 0) / rows.length;
+                render();
+            }
+        }
+
+        function update() {
+            const active = columns.map((column, j) => filters[j] && [column, filters[j]]).filter(Boolean);
+            view = active.length ? all.filter(i => active.every(([column, test]) => test(column[i]))) : all.slice();
+            if (sortColumn >= 0) {
+                const column = columns[sortColumn];
+                const sign = descending ? -1 : 1;
+                view.sort((a, b) => compareReportValues(column[a], column[b]) * sign || a - b);
+            }
+            container.scrollTop = 0;
+            render();
+        }
+
+        headers.forEach((th, j) => {
+            if (!columns[j]) return;
+            const indicator = document.createElement('span');
+            indicator.className = 'sort-indicator';
+            const input = document.createElement('input');
+            input.className = 'column-filter';
+            input.placeholder = typeof columns[j][0] === 'number' ? '>=0' : '絞り込み';
+            input.addEventListener('input', () => {
+                filters[j] = input.value.trim() ? reportFilter(input.value) : null;
+                update();
+            });
+            th.classList.add('sortable');
+            th.append(indicator, input);
+            th.addEventListener('click', event => {
+                if (event.target === input) return;
+                // 数値の列は大きい順から
+                descending = sortColumn === j ? !descending : typeof columns[j][0] === 'number';
+                sortColumn = j;
+                headers.forEach(h => { const mark = h.querySelector('.sort-indicator'); if (mark) mark.textContent = ''; });
+                indicator.textContent = descending ? ' ▼' : ' ▲';
+                update();
+            });
+        });
+        container.classList.add('virtual-table');
+        container.addEventListener('scroll', () => { if (!frame) frame = requestAnimationFrame(render); });
+        render();
+    }
+
+    document.querySelectorAll('template[data-table]').forEach(placeholder => {
+        const table = reportData.tables[placeholder.dataset.table];
+        if (table.columns) {
+            setupVirtualTable(placeholder, table);
+        } else {
+            placeholder.insertAdjacentHTML('beforebegin', renderReportRows(table, Array.from({ length: table.length }, (_, i) => i)));
+            placeholder.remove();
+        }
+    });
+'''
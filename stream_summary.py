@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""チャンク集計の行単位の要約 - 集計キューブに入らない件数・販売日の範囲・価格帯分布・グループ別の上位行をチャンクごとに畳み込む"""
+
+import pandas as pd
+
+
+class StreamSummary:
+    """チャンク集計（stream_group_stats）で、集計キューブと一緒に畳み込む行単位の情報
+
+    全行を保持せずに、件数・販売日の最小/最大・price_bins の価格帯分布を数える。
+    group_column を渡すと、groups の各グループの行数・価格帯分布と、top_column の大きい順に
+    top_rows 件の行（top_fields の列）も残す。同値は nlargest と同じく先に現れた行が先。
+    """
+
+    def __init__(self, price_bins, group_column=None, groups=(), top_column='販売数', top_rows=0, top_fields=()):
+        self.price_bins = price_bins
+        self.group_column = group_column
+        self.top_column = top_column
+        self.top_rows = top_rows
+        self.top_fields = list(top_fields) or [top_column]
+        self.row_count = 0
+        self.first_date = None
+        self.last_date = None
+        self.price_counts = dict.fromkeys(price_bins.labels, 0)
+        self.group_counts = dict.fromkeys(groups, 0)
+        self.group_price_counts = {group: dict.fromkeys(price_bins.labels, 0) for group in groups}
+        self.top = {group: None for group in groups}
+
+    def fold(self, chunk):
+        """エンリッチ済みのチャンクを取り込む"""
+        self.row_count += len(chunk)
+        first, last = chunk['販売日'].min(), chunk['販売日'].max()
+        if not pd.isna(first):
+            self.first_date = first if self.first_date is None else min(self.first_date, first)
+            self.last_date = last if self.last_date is None else max(self.last_date, last)
+        _add_counts(self.price_counts, self.price_bins.counts(chunk['価格']))
+        if self.group_column is None or not self.group_counts:
+            return self
+
+        rows = chunk[chunk[self.group_column].isin(list(self.group_counts))]
+        for group, counts in self.price_bins.grouped_counts(rows['価格'], rows[self.group_column]).items():
+            _add_counts(self.group_price_counts[group], counts)
+        for group, group_rows in rows.groupby(self.group_column, observed=True, sort=False):
+            self.group_counts[group] += len(group_rows)
+            if self.top_rows:
+                # 前のチャンクまでの上位行を先に置くため、同値は先に現れた行が残る
+                candidates = group_rows[self.top_fields]
+                if self.top[group] is not None:
+                    candidates = pd.concat([self.top[group], candidates])
+                self.top[group] = candidates.nlargest(self.top_rows, self.top_column)
+        return self
+
+    def top_records(self, group, limit=None):
+        """グループの上位行（{列: 値} のリスト。limit 件まで）"""
+        top = self.top.get(group)
+        if top is None:
+            return []
+        return top.head(limit if limit is not None else len(top)).to_dict('records')
+
+
+def _add_counts(total, counts):
+    for label, count in counts.items():
+        total[label] += count
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""集計キューブ（チャンク集計）のテスト（python -m pytest で実行）"""
+
+import numpy as np
+import pandas as pd
+
+from aggregate_cube import AggregateCube
+from group_stats import GroupStatsEngine
+from quantile_sketch import capacity_for_error
+
+
+def enriched_frame(rows, seed=0):
+    """エンリッチ済みの販売データに相当する DataFrame（グループの種類は行数によらず一定）"""
+    rng = np.random.default_rng(seed)
+    brands = np.array(['CHANEL', 'DIOR', 'GUCCI', 'HERMES'])
+    brand = brands[rng.integers(0, len(brands), rows)]
+    price = np.round(rng.lognormal(4.5, 0.8, rows), 2)
+    sales = rng.integers(1, 4, rows)
+    return pd.DataFrame({
+        'ブランド': brand,
+        'アイテムタイプ': np.array(['Tiara', 'Headband', 'Barrette'])[rng.integers(0, 3, rows)],
+        'ブランドカテゴリ': np.where(brand == 'CHANEL', 'ハイブランド', 'デザイナー'),
+        '販売月': np.array([f'2025-{m:02d}' for m in range(1, 13)])[rng.integers(0, 12, rows)],
+        'まとめ売り': rng.random(rows) < 0.1,
+        'ノベルティ': rng.random(rows) < 0.2,
+        'CITES_RISK': rng.random(rows) < 0.05,
+        '箱あり': rng.random(rows) < 0.3,
+        '価格': price,
+        '販売数': sales,
+        '売上': price * sales,
+        '仕入れ上限': price * 130,
+    })
+
+
+def fold_in_chunks(df, sketch_capacity, chunk_rows=500):
+    cube = AggregateCube(sketch_capacity=sketch_capacity)
+    for start in range(0, len(df), chunk_rows):
+        cube.fold(df.iloc[start:start + chunk_rows])
+    return cube
+
+
+def test_chunked_cube_matches_whole_frame():
+    df = enriched_frame(5_000)
+    expected = GroupStatsEngine(df)
+    chunked = GroupStatsEngine(fold_in_chunks(df, sketch_capacity=None))
+    for keys in ['ブランド', ['ブランド', 'アイテムタイプ'], ['まとめ売り', 'CITES_RISK', 'ブランド', 'アイテムタイプ'],
+                 '販売月', []]:
+        assert list(chunked.by(keys)) == list(expected.by(keys))
+        for group, stats in expected.by(keys).items():
+            for name, value in stats.items():
+                assert np.isclose(chunked.by(keys)[group][name], value, equal_nan=True), (keys, group, name)
+
+
+def test_retained_sketch_points_are_sublinear_in_rows():
+    rank_error = 0.05
+    capacity = capacity_for_error(rank_error)
+    points = {}
+    for rows in [20_000, 200_000]:
+        df = enriched_frame(rows)
+        df[['まとめ売り', 'ノベルティ', 'CITES_RISK', '箱あり']] = False
+        cube = fold_in_chunks(df, capacity, chunk_rows=10_000)
+        points[rows] = cube.sketch_points
+        # スケッチは販売月をまとめたセルだけに持ち、各セルの代表点は capacity × (log2(n/capacity) + 1) 以下
+        assert cube.sketch_cells.table.shape[0] < cube.cell_count
+        sketches = cube.sketch_cells.sketches['price']
+        counts = cube.sketch_cells.table['count'].to_numpy()
+        levels = np.floor(np.log2(np.maximum(counts / capacity, 1))) + 1
+        assert (np.bincount(sketches.groups, minlength=len(counts)) <= capacity * levels).all()
+        # チャンクの数によらず設定した順位誤差に収まる
+        assert sketches.rank_error_bound().max() <= rank_error
+    assert points[200_000] < 3 * points[20_000]
+    assert points[200_000] < 200_000 / 5
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""ブートストラップ信頼区間のテスト（python -m pytest で実行）"""
+
+import numpy as np
+import pandas as pd
+
+from bootstrap import bootstrap_intervals
+from group_stats import GroupStatsEngine
+from ranking import RankingEngine, equals
+
+
+def sales_frame(rows, seed=0):
+    """単品とまとめ売り・CITESリスク品で価格帯が大きく違う販売データ"""
+    rng = np.random.default_rng(seed)
+    bulk = rng.random(rows) < 0.3
+    cites = rng.random(rows) < 0.1
+    price = np.round(rng.lognormal(4.0, 0.6, rows) * np.where(bulk | cites, 5, 1), 2)
+    return pd.DataFrame({
+        'ブランド': np.array(['CHANEL', 'DIOR', 'GUCCI', 'LOUIS VUITTON'])[rng.integers(0, 4, rows)],
+        'アイテムタイプ': np.array(['Tiara', 'Headband', 'Barrette', 'Kanzashi'])[rng.integers(0, 4, rows)],
+        'ブランドカテゴリ': 'ハイブランド',
+        '販売月': '2025-01',
+        'まとめ売り': bulk,
+        'ノベルティ': False,
+        'CITES_RISK': cites,
+        '箱あり': False,
+        '価格': price,
+        '販売数': 1,
+        '売上': price,
+        '仕入れ上限': price * 130,
+    })
+
+
+def test_recommendation_medians_lie_inside_their_intervals():
+    # おすすめ順序タブと同じく、単品のみ・2件以上のグループの中央値に、単品のみの行から求めた区間を付ける
+    df = sales_frame(400)
+    keys = ['まとめ売り', 'CITES_RISK', 'ブランド', 'アイテムタイプ']
+    ranking = RankingEngine(GroupStatsEngine(df).columns(keys, min_count=2, sort=True))
+    rows = ranking.top(100, filters=[equals('まとめ売り', False), equals('CITES_RISK', False)])
+    intervals = bootstrap_intervals(df[~df['まとめ売り'] & ~df['CITES_RISK']], ['ブランド', 'アイテムタイプ'],
+                                    resamples=200)
+    assert rows
+    for row in rows:
+        interval = intervals[(row['ブランド'], row['アイテムタイプ'])]
+        assert interval['median_ci_low'] <= row['median_price'] <= interval['median_ci_high'], row
+
+
+def test_intervals_contain_group_medians():
+    df = sales_frame(2_000, seed=1)
+    stats = GroupStatsEngine(df).by(['ブランド', 'アイテムタイプ'])
+    intervals = bootstrap_intervals(df, ['ブランド', 'アイテムタイプ'], resamples=200)
+    assert set(intervals) == set(stats)
+    for group, interval in intervals.items():
+        assert interval['median_ci_low'] <= stats[group]['median_price'] <= interval['median_ci_high'], group
+        assert interval['cv_ci_low'] <= interval['cv_ci_high']
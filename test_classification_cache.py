@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""タイトル分類キャッシュのテスト（python -m pytest で実行）"""
+
+import pandas as pd
+import pytest
+
+from classification_cache import ClassificationCache
+from title_classifier import TitleClassifier
+
+
+@pytest.fixture
+def classifier():
+    return TitleClassifier(
+        item_type_rules=[('Tiara', ['TIARA']), ('Headband', ['HEADBAND'])],
+        bulk_keywords=['LOT OF'], bulk_pattern=r'\d+\s*PCS', novelty_keywords=['NOVELTY'],
+        cites_risk_keywords=['TORTOISE'], brands=['Chanel', 'Dior'])
+
+
+def test_mixed_case_duplicates_over_two_runs(tmp_path, classifier):
+    titles = ['Chanel tiara', 'CHANEL TIARA', 'Dior headband']
+    expected = classifier.classify(titles)
+
+    # 1回目: 大文字・小文字違いのタイトルが同じハッシュでも1行だけ保存される
+    first = classifier.classify(titles, cache=ClassificationCache(tmp_path))
+    pd.testing.assert_frame_equal(first, expected)
+    store = pd.read_pickle(next(tmp_path.glob('*.pkl')))
+    assert store['title_hash'].is_unique
+    assert len(store) == 2
+
+    # 2回目（次のビルド・次のチャンク）: 保存済みのキャッシュで照合できる
+    cache = ClassificationCache(tmp_path)
+    second = classifier.classify(titles + ['dior HEADBAND', 'Chanel headband'], cache=cache)
+    pd.testing.assert_frame_equal(second.iloc[:3], expected)
+    assert second['アイテムタイプ'].tolist()[3:] == ['Headband', 'Headband']
+    assert cache.last_hit_count == 4
+    assert cache.last_miss_count == 1
+    assert pd.read_pickle(next(tmp_path.glob('*.pkl')))['title_hash'].is_unique
+
+
+def test_stream_chunks_flush_once(tmp_path, classifier):
+    cache = ClassificationCache(tmp_path, autosave=False)
+    classifier.classify(['Chanel tiara', 'CHANEL TIARA'], cache=cache)
+    classifier.classify(['chanel TIARA', 'Dior headband'], cache=cache)
+    assert not list(tmp_path.glob('*.pkl'))
+    cache.flush()
+    store = pd.read_pickle(next(tmp_path.glob('*.pkl')))
+    assert len(store) == 2
+    assert store['title_hash'].is_unique
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""分位点スケッチのテスト（python -m pytest で実行）"""
+
+import numpy as np
+
+from quantile_sketch import QuantileSketches, capacity_for_error
+
+
+def test_rank_error_holds_across_many_merges():
+    # 小さいチャンクを何百回もマージしても、順位誤差は設定した値に収まる
+    rank_error = 0.02
+    capacity = capacity_for_error(rank_error)
+    rng = np.random.default_rng(0)
+    values = np.round(rng.lognormal(4.5, 0.8, 300_000), 2)
+    codes = rng.integers(0, 3, len(values))
+    identity = np.arange(3)
+    merged = QuantileSketches(3, capacity)
+    for start in range(0, len(values), 1_000):
+        chunk = QuantileSketches.from_values(values[start:start + 1_000], codes[start:start + 1_000], 3, capacity)
+        merged = merged.concat(chunk).regroup(np.concatenate([identity, identity]), 3)
+
+    assert not merged.exact.any()
+    assert merged.rank_error_bound().max() <= rank_error
+    for q in [0.1, 0.5, 0.9]:
+        estimate = merged.quantile(q)
+        for group in range(3):
+            rank = (values[codes == group] <= estimate[group]).mean()
+            assert abs(rank - q) <= rank_error, (q, group, rank)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""タイトル分類エンジン - タイトルを一度だけ大文字化し、全フラグ列を一括判定する"""
+
+import hashlib
+import json
+import re
+
+import numpy as np
+import pandas as pd
+
+from keyword_automaton import KeywordAutomaton
+
+# 判定ロジック自体を変更したら上げる（分類キャッシュの無効化用）
+CLASSIFIER_VERSION = 1
+
+
+class TitleBuffer:
+    """大文字化済みタイトルを区切り文字で連結した1本のバッファ
+
+    キーワード検索はタイトルごとではなくバッファ全体に対して行い、
+    ヒット位置を行番号に戻して判定する。区切り文字はキーワードに含まれないため、
+    行をまたいだ誤ヒットは起きない。
+    """
+
+    SEP = '\x00'
+
+    def __init__(self, titles):
+        # 従来の str(title).upper() と同じ正規化（欠損値は 'NAN' になる）
+        uppers = [str(t).upper() for t in titles]
+        self.size = len(uppers)
+        self.text = self.SEP.join(uppers)
+        lengths = np.fromiter(map(len, uppers), dtype=np.int64, count=self.size) + 1
+        self.starts = np.zeros(self.size, dtype=np.int64)
+        if self.size > 1:
+            np.cumsum(lengths[:-1], out=self.starts[1:])
+
+    def rows_of(self, positions):
+        """バッファ上の位置をタイトルの行番号に変換"""
+        return np.searchsorted(self.starts, positions, side='right') - 1
+
+    def search(self, regex):
+        """正規表現に一致するタイトルのマスクを返す（re.search と同じ判定）"""
+        mask = np.zeros(self.size, dtype=bool)
+        positions = np.fromiter((m.start() for m in regex.finditer(self.text)), dtype=np.int64)
+        mask[self.rows_of(positions)] = True
+        return mask
+
+
+class TitleClassifier:
+    """アイテムタイプ・まとめ売り・ノベルティ・CITES・箱あり・ブランドの判定ルールを保持する
+
+    キーワードは従来の `kw in title_upper` と同じく大文字化済みタイトルへの部分一致で判定する。
+    全キーワード群は1つの KeywordAutomaton にまとめ、タイトル列を1回走査して全ヒットを得る。
+    box_keywords が None の場合は箱あり列を、brands が None の場合はタイトルブランド列を出力しない。
+    """
+
+    def __init__(self, item_type_rules, bulk_keywords, bulk_pattern, novelty_keywords,
+                 cites_risk_keywords, cites_safe_keywords=(), box_keywords=None, brands=None,
+                 default_item_type='Other'):
+        self.item_type_rules = [(label, list(keywords)) for label, keywords in item_type_rules]
+        self.default_item_type = default_item_type
+        self.brands = list(brands) if brands is not None else None
+
+        groups = {
+            'item_type': [kw for _, keywords in self.item_type_rules for kw in keywords],
+            'bulk': list(bulk_keywords),
+            'novelty': list(novelty_keywords),
+            'cites_risk': list(cites_risk_keywords),
+            'cites_safe': list(cites_safe_keywords),
+            'box': list(box_keywords or []),
+            # ブランドは従来通り b.upper() をタイトルから検出
+            'brand': [b.upper() for b in self.brands or []],
+        }
+        self.automaton = KeywordAutomaton(groups)
+        # ルールを変えると分類キャッシュが自動で無効になるよう、判定に使う全設定からバージョンを作る
+        self.rules_version = hashlib.sha256(json.dumps({
+            'engine': CLASSIFIER_VERSION,
+            'item_type_rules': self.item_type_rules,
+            'default_item_type': default_item_type,
+            'bulk_pattern': bulk_pattern,
+            'has_box': box_keywords is not None,
+            'has_brands': brands is not None,
+            'groups': groups,
+        }, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+        # アイテムタイプはキーワード単位ではなくルール単位で優先順位を付ける
+        self._item_type_ranks = [rank for rank, (_, keywords) in enumerate(self.item_type_rules) for _ in keywords]
+        self._item_type_labels = np.array([label for label, _ in self.item_type_rules] + [default_item_type],
+                                          dtype=object)
+        self._bulk_pattern = re.compile(bulk_pattern)
+        self._has_box = box_keywords is not None
+        self.last_row_count = 0
+        self.last_unique_count = 0
+
+    def classify(self, titles, cache=None):
+        """タイトル列を分類し、フラグ列をまとめたDataFrameを返す（indexは入力と同じ）
+
+        同じタイトルは何度出現しても1回だけ判定し、整数コード経由で全行に展開する。
+        cache（ClassificationCache）を渡すと、過去の実行で分類済みのタイトルは判定を省略する。
+        直近の行数・ユニーク数は last_row_count / last_unique_count に残す。
+        """
+        titles = pd.Series(titles)
+        codes, uniques = pd.factorize(titles, use_na_sentinel=False)
+        self.last_row_count = len(titles)
+        self.last_unique_count = len(uniques)
+
+        if cache is None:
+            unique_result = self.classify_unique(uniques)
+        else:
+            unique_result = cache.classify(self, uniques)
+        result = unique_result.take(codes)
+        result.index = titles.index
+        return result
+
+    def classify_unique(self, titles):
+        """ユニークなタイトルを分類する（行の並びは入力と同じ、indexは0始まりの連番）"""
+        buffer = TitleBuffer(titles)
+        hits = self.automaton.scan(buffer)
+
+        # アイテムタイプは先頭のルールほど優先（TiaraがHeadbandより優先など、-1 は既定値）
+        item_types = self._item_type_labels[hits.first('item_type', self._item_type_ranks)]
+
+        # 樹脂・フェイク等の記載があればリスクなし
+        cites_risk = hits.any('cites_risk') & ~hits.any('cites_safe')
+
+        result = pd.DataFrame({
+            'アイテムタイプ': item_types,
+            'まとめ売り': hits.any('bulk') | buffer.search(self._bulk_pattern),
+            'ノベルティ': hits.any('novelty'),
+            'CITES_RISK': cites_risk,
+        })
+        if self._has_box:
+            result['箱あり'] = hits.any('box')
+        if self.brands is not None:
+            # ALL_BRANDS の並び順で最初に見つかったブランド（検出なしは NaN）
+            brand_names = np.array(self.brands + [np.nan], dtype=object)
+            result['タイトルブランド'] = brand_names[hits.first('brand')]
+        return result
+
+    @property
+    def duplicate_ratio(self):
+        """直近の classify で重複により判定を省略できた行の割合"""
+        if not self.last_row_count:
+            return 0.0
+        return 1 - self.last_unique_count / self.last_row_count
+
+
+def apply_unique(values, func):
+    """値ごとに1回だけ func を適用し、結果を全行に展開する（Series.apply と同じ結果）"""
+    values = pd.Series(values)
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    mapped = np.empty(len(uniques), dtype=object)
+    mapped[:] = [func(v) for v in uniques]
+    return pd.Series(mapped[codes], index=values.index)
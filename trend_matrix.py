@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""時系列集計 - 期間 × アイテムタイプ（ブランド等）の推移表を1回の pivot で作る"""
+
+import pandas as pd
+
+# 集計単位 → pandas の期間コード
+RESOLUTIONS = {'day': 'D', 'week': 'W', 'month': 'M'}
+
+
+def period_labels(dates, resolution='month'):
+    """販売日を集計単位のラベルに変換する
+
+    month: '2025-01'（販売月と同じ） / week: 週の開始日（月曜）'2025-01-06' / day: '2025-01-08'
+    """
+    periods = dates.dt.to_period(RESOLUTIONS[resolution])
+    if resolution == 'week':
+        return periods.dt.start_time.dt.strftime('%Y-%m-%d')
+    return periods.astype(str)
+
+
+def trend_matrix(df, by=None, value='販売数', resolution='month', columns=None):
+    """期間 × by の合計表（index は期間の昇順、データのない組み合わせは 0）
+
+    by を省略すると期間ごとの合計1列（列名は value）。columns を渡すとその列順に揃え、
+    データのない列は 0 で埋める。月単位は派生済みの販売月列をそのまま使う。
+    """
+    if resolution == 'month' and '販売月' in df.columns:
+        periods = df['販売月']
+    else:
+        periods = period_labels(df['販売日'], resolution)
+    periods = periods.rename('期間')
+
+    if by is None:
+        matrix = df[value].groupby(periods, observed=True).sum().to_frame(value)
+    else:
+        matrix = df.pivot_table(index=periods, columns=by, values=value, aggfunc='sum', fill_value=0,
+                                observed=True)
+        matrix.columns = pd.Index(matrix.columns.astype(object), name=by)
+    matrix.index = pd.Index(matrix.index.astype(str), name='期間')
+    if columns is not None:
+        matrix = matrix.reindex(columns=columns, fill_value=0)
+    return matrix
+
+
+def stats_trend_matrix(stats_engine, by=None, value='sales', name='販売数', columns=None):
+    """GroupStatsEngine（チャンク集計）から作る月 × by の合計表（trend_matrix の月単位と同じ形）
+
+    value は統計の名前（'sales' = 販売数、'revenue' = 売上）。by を省略すると列名 name の1列。
+    """
+    if by is None:
+        totals = {month: stats[value] for month, stats in stats_engine.by('販売月').items()}
+        matrix = pd.Series(totals).to_frame(name)
+    else:
+        totals = {key: stats[value] for key, stats in stats_engine.by(['販売月', by]).items()}
+        matrix = pd.Series(totals).unstack(fill_value=0)
+        matrix.columns = pd.Index(matrix.columns.astype(object), name=by)
+    matrix = matrix.sort_index()
+    matrix.index = pd.Index(matrix.index.astype(str), name='期間')
+    if columns is not None:
+        matrix = matrix.reindex(columns=columns, fill_value=0)
+    return matrix
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""平均・分散の逐次集計 - Welford法（チャンク同士の合算は Chan らの式）でグループごとの平均・分散・CVを求める"""
+
+import numpy as np
+
+
+class MomentAccumulators:
+    """グループごとの件数・平均・偏差平方和（M2）・最小・最大を列指向でまとめて持つ
+
+    和と二乗和から分散を求める方法と違い、平均との差の二乗を積み上げるため桁落ちしない。
+    チャンクごとに from_values で作り、concat / regroup で別チャンク・別プロセスの結果と合算できる
+    （グループ数分の配列だけを持ち、行は保持しない）。欠損値は pandas と同じく無視する。
+    """
+
+    def __init__(self, size=0):
+        self.size = size
+        self.count = np.zeros(size, dtype=np.float64)
+        self.mean = np.zeros(size, dtype=np.float64)
+        self.m2 = np.zeros(size, dtype=np.float64)
+        self.min = np.full(size, np.nan)
+        self.max = np.full(size, np.nan)
+
+    @classmethod
+    def from_values(cls, values, codes, size):
+        """行ごとの値とグループ番号から作る（番号 -1 の行は無視）"""
+        values = np.asarray(values, dtype=np.float64)
+        codes = np.asarray(codes, dtype=np.int64)
+        keep = (codes >= 0) & ~np.isnan(values)
+        values = values[keep]
+        codes = codes[keep]
+
+        result = cls(size)
+        result.count = np.bincount(codes, minlength=size).astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result.mean = np.bincount(codes, weights=values, minlength=size) / result.count
+        result.mean[result.count == 0] = 0.0
+        # グループ平均との差で二乗和を取る（2パス）
+        result.m2 = np.bincount(codes, weights=(values - result.mean[codes]) ** 2, minlength=size)
+        np.fmin.at(result.min, codes, values)
+        np.fmax.at(result.max, codes, values)
+        return result
+
+    def concat(self, *others):
+        """others のグループを順に後ろに連結する（グループ番号はそれより前のグループ数だけずらす）"""
+        parts = [self, *others]
+        result = MomentAccumulators(sum(part.size for part in parts))
+        for name in ['count', 'mean', 'm2', 'min', 'max']:
+            setattr(result, name, np.concatenate([getattr(part, name) for part in parts]))
+        return result
+
+    def regroup(self, mapping, size):
+        """グループ i を mapping[i] に付け替えて合算する（-1 のグループは捨てる）
+
+        合算後の平均 = Σ n_i·平均_i / Σ n_i、M2 = Σ (M2_i + n_i·(平均_i − 合算後の平均)²)
+        """
+        mapping = np.asarray(mapping, dtype=np.int64)
+        keep = mapping >= 0
+        target = mapping[keep]
+        count = self.count[keep]
+        mean = self.mean[keep]
+
+        result = MomentAccumulators(size)
+        result.count = np.bincount(target, weights=count, minlength=size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result.mean = np.bincount(target, weights=count * mean, minlength=size) / result.count
+        result.mean[result.count == 0] = 0.0
+        spread = count * (mean - result.mean[target]) ** 2
+        result.m2 = np.bincount(target, weights=self.m2[keep] + spread, minlength=size)
+        np.fmin.at(result.min, target, self.min[keep])
+        np.fmax.at(result.max, target, self.max[keep])
+        return result
+
+    def variance(self, ddof=1):
+        """不偏分散（ddof=1）。件数が ddof 以下のグループは pandas と同じく NaN"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan)
+
+    def std(self, ddof=1):
+        return np.sqrt(self.variance(ddof))
+
+    def cv(self):
+        """変動係数（標準偏差 / 平均）。平均が0以下なら0"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.mean > 0, self.std() / self.mean, 0.0)